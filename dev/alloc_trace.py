@@ -0,0 +1,101 @@
+"""Allocation traces.
+
+One op per line, `op,size,id,timestamp`:
+  op         alloc or free
+  size       requested bytes (ignored for free)
+  id         handle of the allocation, a free refers to the id of its alloc
+  timestamp  cycle the op was issued, relative to the start of the trace
+
+Lines starting with # are comments. Files ending in .gz are compressed.
+"""
+
+import gzip
+import heapq
+import random
+
+OP_ALLOC = "alloc"
+OP_FREE = "free"
+
+
+class TraceRecord:
+    __slots__ = ("op", "size", "id", "timestamp")
+
+    def __init__(self, op, size, id, timestamp):
+        self.op = op
+        self.size = size
+        self.id = id
+        self.timestamp = timestamp
+
+    def __str__(self):
+        return f"{self.op},{self.size},{self.id},{self.timestamp}"
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t")
+    return open(path, mode)
+
+
+def read_trace(path):
+    """Yields the TraceRecords of `path` one line at a time."""
+    with _open(path, "r") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = line.split(",")
+            where = f"{path}:{lineno}"
+            assert len(fields) == 4, f"{where}: expected op,size,id,timestamp"
+            op, size, id, timestamp = fields
+            op = op.strip()
+            assert op in (OP_ALLOC, OP_FREE), f"{where}: unknown op {op}"
+            yield TraceRecord(op, int(size), int(id), int(timestamp))
+
+
+class TraceWriter:
+    def __init__(self, path):
+        self.path = path
+        self._f = _open(path, "w")
+        self._f.write("# op,size,id,timestamp\n")
+
+    def write(self, op, size, id, timestamp):
+        self._f.write(f"{op},{size},{id},{timestamp}\n")
+
+    def close(self):
+        self._f.close()
+
+
+# (probability, smallest, largest size) of synthetic_trace requests
+SYNTHETIC_SIZES = [
+    (0.6, 8, 64),
+    (0.3, 65, 512),
+    (0.09, 513, 4096),
+    (0.01, 4097, 65536),
+]
+
+
+def synthetic_trace(num_ops, seed=1, live_target=1000, long_lived=0.2):
+    """TraceRecords of a long running program, one op per timestamp.
+
+    Mostly small requests (SYNTHETIC_SIZES); most blocks are freed after a
+    few dozen ops, a `long_lived` share stays around for thousands, and the
+    number of live blocks hovers around `live_target`.
+    """
+    rng = random.Random(seed)
+    deaths = []  # (op the block is freed at, id)
+    next_id = 0
+    for t in range(num_ops):
+        if deaths and (deaths[0][0] <= t or len(deaths) > live_target):
+            _, id = heapq.heappop(deaths)
+            yield TraceRecord(OP_FREE, 0, id, t)
+            continue
+        r = rng.random()
+        for p, low, high in SYNTHETIC_SIZES:
+            r -= p
+            if r < 0:
+                break
+        mean = 2000 if rng.random() < long_lived else 20
+        death = t + 1 + int(rng.expovariate(1 / mean))
+        heapq.heappush(deaths, (death, next_id))
+        yield TraceRecord(OP_ALLOC, rng.randint(low, high), next_id, t)
+        next_id += 1
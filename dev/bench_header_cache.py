@@ -0,0 +1,223 @@
+"""Hit rate and latency of the header cache on allocation traces.
+
+As a cocotb bench (make MODULE=bench_header_cache TOPLEVEL=falafel) every
+trace is replayed through falafel with each strategy, from one large free
+block and checked against the reference model. One run measures one build;
+build it with and without a cache to compare, e.g.
+    python regress.py -m falafel:bench_header_cache -P HEADER_CACHE_ENTRIES=8
+and put the results side by side, relative to the build without a cache:
+    python bench_header_cache.py regress_results/*/*/bench_header_cache_*.json
+"""
+
+import argparse
+import json
+import os
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.utils import get_sim_time
+
+from alloc_trace import OP_ALLOC, OP_FREE, read_trace
+from bench_latency import load_heap, write_results
+from bench_segregated_fit import (
+    FREE_LIST_PTR,
+    HEAP_SIZE,
+    LOCK_ID,
+    LOCK_PTR,
+    SIZE_CLASS_LIMITS,
+    SIZE_CLASS_PTRS,
+    STRATEGIES,
+    make_model,
+    trace_ops,
+)
+from mem_agent import MemoryAgent
+from mem_rsp import issue_alloc_req, issue_free_req, wait_for_result
+from mem_traffic import READ, SEARCH
+from ref_model import Scoreboard, pack_config
+from replay_trace import LatencyStats
+from test_falafel import batched, header_burst, header_cache, reset_dut
+
+CLK_PERIOD = 10
+UNITS = "ns"
+
+FIELDS = [
+    "trace",
+    "strategy",
+    "allocs",
+    "frees",
+    "alloc_cycles",
+    "alloc_cycles_p99",
+    "free_cycles",
+    "free_cycles_p99",
+    "header_loads",
+    "cache_hits",
+    "hit_rate",
+    "search_reads_per_op",
+]
+
+
+@cocotb.test()
+async def bench_header_cache_traces(dut):
+    """Cycles per op, header loads and cache hits over allocation traces.
+
+    Cycles run from req_alloc_valid_i to rsp_result_val_o; header loads are
+    the LOADs the core sent (hits and misses of the cache, which count the
+    list head pointers too) and search_reads_per_op the memory reads they
+    cost. Without a cache every load is a miss. Configured from the
+    environment:
+      TRACE_FILES       comma separated traces (default: traces/example.trace)
+      BENCH_STRATEGIES  comma separated first, best, segregated
+                        (default: first,best)
+      TRACE_HEAP_SIZE   size of the initial free block (default: 64 MiB)
+      BENCH_OUT         output path without extension
+                        (default: bench_header_cache_<entries>[_keep])
+    """
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+
+    paths = os.environ.get("TRACE_FILES", "traces/example.trace").split(",")
+    strategies = os.environ.get("BENCH_STRATEGIES", "first,best").split(",")
+    heap_size = int(os.environ.get("TRACE_HEAP_SIZE", str(HEAP_SIZE)), 0)
+    entries = header_cache(dut)
+    keep = bool(int(getattr(dut, "HEADER_CACHE_KEEP_ON_LOCK", 0)))
+    default_out = f"bench_header_cache_{entries}" + ("_keep" if keep else "")
+    out = os.environ.get("BENCH_OUT", default_out)
+
+    dut.falafel_config_i.value = pack_config(
+        FREE_LIST_PTR, LOCK_PTR, LOCK_ID, SIZE_CLASS_PTRS, SIZE_CLASS_LIMITS
+    )
+    mem = MemoryAgent(dut, clk, lock_ptr=LOCK_PTR)
+    mem.start()
+    dut.req_alloc_valid_i.setimmediatevalue(0)
+    dut.result_ready_i.setimmediatevalue(1)
+
+    rows = []
+    for path in paths:
+        for name in strategies:
+            strategy = STRATEGIES[name]
+            dut.config_alloc_strategy_i.value = strategy
+            # also empties the cache
+            await reset_dut(dut, clk)
+            model = make_model(strategy, SIZE_CLASS_LIMITS, heap_size)
+            load_heap(mem, model)
+            scoreboard = Scoreboard(model, mem)
+
+            handles = {}
+            cycles = {OP_ALLOC: LatencyStats(), OP_FREE: LatencyStats()}
+            hits = search_reads = header_loads = 0
+            for n, (op, size, id) in enumerate(trace_ops(read_trace(path))):
+                if op == OP_ALLOC:
+                    assert model.can_alloc(size, strategy), (
+                        f"op {n}: out of memory allocating {size} bytes, "
+                        "raise TRACE_HEAP_SIZE"
+                    )
+                    start = await issue_alloc_req(dut, clk, size)
+                    result = await wait_for_result(dut, clk)
+                    expected = scoreboard.check_alloc(size, strategy, result)
+                    handles[id] = expected.addr
+                else:
+                    addr = handles.pop(id)
+                    start = await issue_free_req(dut, clk, addr)
+                    await wait_for_result(dut, clk)
+                    scoreboard.check_free(addr)
+                op_cycles = (get_sim_time(UNITS) - start) // CLK_PERIOD
+                cycles[op].add(int(op_cycles))
+                traffic = mem.traffic.last
+                reads = traffic.counts[SEARCH, READ]
+                search_reads += reads
+                hits += traffic.cache_hits
+                # a header load is two reads, or one burst
+                header_loads += traffic.cache_hits + (
+                    reads if header_burst(dut) else reads // 2
+                )
+            scoreboard.check_heap()
+
+            alloc, free = cycles[OP_ALLOC].summary(), cycles[OP_FREE].summary()
+            ops = alloc["count"] + free["count"]
+            row = {
+                "trace": os.path.basename(path),
+                "strategy": name,
+                "allocs": alloc["count"],
+                "frees": free["count"],
+                "alloc_cycles": alloc["mean"],
+                "alloc_cycles_p99": alloc["p99"],
+                "free_cycles": free["mean"],
+                "free_cycles_p99": free["p99"],
+                "header_loads": header_loads,
+                "cache_hits": hits,
+                "hit_rate": hits / header_loads if header_loads else 0.0,
+                "search_reads_per_op": search_reads / ops if ops else 0.0,
+            }
+            rows.append(row)
+            print(
+                ", ".join(
+                    f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}"
+                    for k, v in row.items()
+                )
+            )
+
+    if entries:
+        # the counters of the cache (cleared by the last reset) agree with
+        # the accounting of the memory agent
+        assert dut.header_cache_hits_o.value.integer == rows[-1]["cache_hits"]
+        misses = dut.header_cache_misses_o.value.integer
+        assert misses == rows[-1]["header_loads"] - rows[-1]["cache_hits"]
+
+    meta = {
+        "header_cache_entries": entries,
+        "header_cache_keep_on_lock": keep,
+        "header_burst": header_burst(dut),
+        "batched": batched(dut),
+        "memory": mem.config(),
+    }
+    write_results(out, rows, meta, FIELDS)
+    mem.stop()
+
+
+def build_name(result):
+    name = f"{result['header_cache_entries']} entries"
+    if result["header_cache_keep_on_lock"]:
+        name += ", kept"
+    return name
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "results",
+        nargs="+",
+        help="bench_header_cache json files",
+    )
+    args = parser.parse_args()
+
+    builds = []
+    for path in args.results:
+        with open(path) as f:
+            builds.append(json.load(f))
+    # the build without a cache is the baseline, else the first one given
+    uncached = [b for b in builds if not b["header_cache_entries"]]
+    base = (uncached or builds)[0]
+    base_rows = {(r["trace"], r["strategy"]): r for r in base["results"]}
+
+    print(f"baseline: {build_name(base)}")
+    for build in builds:
+        for row in build["results"]:
+            ref = base_rows.get((row["trace"], row["strategy"]))
+            line = (
+                f"{build_name(build):>16} {row['trace']:>20} "
+                f"{row['strategy']:>10}: "
+                f"hit rate {row['hit_rate']:.1%}, "
+                f"alloc {row['alloc_cycles']:.1f} cycles, "
+                f"free {row['free_cycles']:.1f} cycles, "
+                f"{row['search_reads_per_op']:.1f} reads/op"
+            )
+            if ref is not None and ref is not row:
+                line += (
+                    f" (alloc {row['alloc_cycles'] / ref['alloc_cycles']:.2f}x"
+                    f", free {row['free_cycles'] / ref['free_cycles']:.2f}x)"
+                )
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
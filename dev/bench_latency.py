@@ -0,0 +1,319 @@
+import csv
+import json
+import os
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import FallingEdge
+from cocotb.utils import get_sim_time
+
+from mem_agent import MemoryAgent
+from mem_rsp import (
+    issue_alloc_req,
+    issue_free_req,
+    issue_wrapper_req,
+    wait_for_result,
+)
+from mem_traffic import CAS, LOCK, READ, WRITE
+from ref_model import (
+    BEST_FIT,
+    BLOCK_HEADER_SIZE,
+    FIRST_FIT,
+    MERGE_BOTH,
+    MERGE_LEFT,
+    MERGE_NONE,
+    MERGE_RIGHT,
+    NEXT_FIT,
+    RefAllocator,
+    Scoreboard,
+    pack_config,
+)
+from test_falafel import header_burst, reset_dut
+from test_falafel_wrapper import (
+    configure_wrapper,
+    write_alloc_req,
+    write_free_req,
+)
+
+CLK_PERIOD = 10
+UNITS = "ns"
+
+FREE_LIST_PTR = 8
+LOCK_PTR = 0
+LOCK_ID = 1
+HEAP_BASE = 0x1000
+
+FILLER_FREE_SIZE = 64
+ALLOCATED_SIZE = 32
+TAIL_FREE_SIZE = 1024
+ALLOC_SIZE = 100  # only fits the tail block
+
+# next fit last: the first or best fit alloc before it sends the rover of
+# falafel back to the head, so it walks the fresh heap from the start like
+# the model does
+STRATEGY_NAMES = {
+    FIRST_FIT: "first_fit",
+    BEST_FIT: "best_fit",
+    NEXT_FIT: "next_fit",
+}
+FIELDS = [
+    "toplevel",
+    "op",
+    "strategy",
+    "merge",
+    "free_list_len",
+    "visited",
+    "cycles",
+    "mem_cycles",
+    "nodes",
+    "mem_reads",
+    "mem_writes",
+    "mem_cas",
+    "bytes",
+    "bytes_per_node",
+]
+
+# block layout at the end of the heap for each merge case, "T" is the block
+# that gets freed, "A" an allocated block and "F" the last free block
+CASE_LAYOUTS = {
+    MERGE_NONE: "ATAF",
+    MERGE_LEFT: "TAF",
+    MERGE_RIGHT: "ATF",
+    MERGE_BOTH: "TF",
+}
+
+
+def build_heap(free_list_len, layout):
+    """Heap with `free_list_len` free headers that cannot merge.
+
+    free_list_len - 1 (allocated, free) pairs are followed by `layout`, so
+    every op measured on it walks to the end of the free list. Returns the
+    model and the payload address of the "T" block.
+    """
+    model = RefAllocator(FREE_LIST_PTR)
+    addr = HEAP_BASE
+    target = None
+    blocks = "AF" * (free_list_len - 1) + layout
+    for i, kind in enumerate(blocks):
+        if kind == "F":
+            size = TAIL_FREE_SIZE if i == len(blocks) - 1 else FILLER_FREE_SIZE
+            model.add_free_block(addr, size)
+        else:
+            size = ALLOCATED_SIZE
+            model.add_allocated_block(addr, size)
+            if kind == "T":
+                target = addr + BLOCK_HEADER_SIZE
+        addr += BLOCK_HEADER_SIZE + size
+    return model, target
+
+
+def load_heap(mem, model):
+    mem.mem.clear()
+    mem.load_model(model)
+
+
+def write_results(path, rows, meta, fields=FIELDS):
+    """Write `rows` to path.csv, and with the `meta` entries to path.json."""
+    with open(path + ".csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(path + ".json", "w") as f:
+        json.dump({**meta, "results": rows}, f, indent=2)
+    print(f"Wrote {len(rows)} results to {path}.csv and {path}.json")
+
+
+@cocotb.test()
+async def bench_latency_sweep(dut):
+    """Cycles per alloc/free against the free list length.
+
+    Latency is counted from the cycle the request is raised on
+    req_alloc_valid_i (req_val_i for the wrapper) to the cycle
+    rsp_result_val_o (resp_val_o for a wrapper alloc) comes up. Frees are
+    not answered by the wrapper, so they are timed on the inner falafel.
+    mem_cycles is the part of it with a memory request or response in
+    flight; the memory transactions and bytes of the op come from
+    MemoryAgent.traffic. "alloc" requests only fit the last free block,
+    "alloc_exact" ones are an exact fit of the first. The memory model is
+    set with MEM_LATENCY, MEM_REQ_STALL and MEM_RSP_STALL (see
+    MemoryAgent). Builds with HEADER_BURST load and store headers in one
+    request and write to bench_latency_<toplevel>_burst by default.
+    Configured from the environment:
+      BENCH_LENGTHS  comma separated free list lengths
+                     (default: 1,10,100,1000,10000)
+      BENCH_OUT      output path without extension
+                     (default: bench_latency_<toplevel>)
+    """
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    is_wrapper = hasattr(dut, "req_val_i")
+    toplevel = "falafel_wrapper" if is_wrapper else "falafel"
+
+    lengths = os.environ.get("BENCH_LENGTHS", "1,10,100,1000,10000")
+    lengths = [int(n) for n in lengths.split(",")]
+    burst = header_burst(dut)
+    default_out = f"bench_latency_{toplevel}" + ("_burst" if burst else "")
+    out = os.environ.get("BENCH_OUT", default_out)
+
+    mem = MemoryAgent(dut, clk)
+    mem.start()
+    if is_wrapper:
+        for i in range(len(dut.req_val_i)):
+            dut.req_val_i[i].setimmediatevalue(0)
+        dut.resp_rdy_i.setimmediatevalue(1)
+        await reset_dut(dut, clk)
+        await configure_wrapper(dut, clk, FREE_LIST_PTR, LOCK_PTR, LOCK_ID)
+    else:
+        config = pack_config(FREE_LIST_PTR, LOCK_PTR, LOCK_ID)
+        dut.falafel_config_i.value = config
+        dut.req_alloc_valid_i.setimmediatevalue(0)
+        dut.result_ready_i.setimmediatevalue(1)
+        await reset_dut(dut, clk)
+
+    async def alloc(size, strategy):
+        if is_wrapper:
+            # the ALLOC_STRATEGY register, written before the timed request
+            await configure_wrapper(
+                dut, clk, FREE_LIST_PTR, LOCK_PTR, LOCK_ID, strategy
+            )
+            req = write_alloc_req(0)
+            start = await issue_wrapper_req(dut, clk, req, index=0)
+            await issue_wrapper_req(dut, clk, size, index=0)
+            rsp_val, rsp_rdy = dut.resp_val_o, dut.resp_rdy_i
+            while not (rsp_val.value == 1 and rsp_rdy.value == 1):
+                await FallingEdge(clk)
+            result = dut.resp_data_o.value.integer
+            end = get_sim_time(UNITS)
+            # falafel_output_fsm sends every response twice
+            await FallingEdge(clk)
+        else:
+            dut.config_alloc_strategy_i.value = strategy
+            start = await issue_alloc_req(dut, clk, size)
+            result = await wait_for_result(dut, clk)
+            end = get_sim_time(UNITS)
+        return result, int((end - start) // CLK_PERIOD)
+
+    async def free(addr):
+        if is_wrapper:
+            req = write_free_req(0)
+            start = await issue_wrapper_req(dut, clk, req, index=0)
+            await issue_wrapper_req(dut, clk, addr, index=0)
+            await wait_for_result(dut.i_falafel, clk)
+        else:
+            start = await issue_free_req(dut, clk, addr)
+            await wait_for_result(dut, clk)
+        return int((get_sim_time(UNITS) - start) // CLK_PERIOD)
+
+    rows = []
+
+    def record(
+        op,
+        strategy,
+        merge,
+        free_list_len,
+        visited,
+        cycles,
+        mem_cycles,
+    ):
+        traffic = mem.traffic.last
+        counts = traffic.counts.items()
+        reads = sum(n for (_, access), n in counts if access == READ)
+        writes = sum(n for (_, access), n in counts if access == WRITE)
+        total_bytes = sum(traffic.bytes.values())
+        nodes = traffic.nodes
+        row = {
+            "toplevel": toplevel,
+            "op": op,
+            "strategy": strategy,
+            "merge": merge,
+            "free_list_len": free_list_len,
+            "visited": visited,
+            "cycles": cycles,
+            "mem_cycles": mem_cycles,
+            "nodes": nodes,
+            "mem_reads": reads,
+            "mem_writes": writes,
+            "mem_cas": traffic.counts[LOCK, CAS],
+            "bytes": total_bytes,
+            "bytes_per_node": total_bytes / nodes if nodes else 0.0,
+        }
+        rows.append(row)
+        print(", ".join(f"{k}={v}" for k, v in row.items()))
+
+    for free_list_len in lengths:
+        for strategy in STRATEGY_NAMES:
+            model, _ = build_heap(free_list_len, CASE_LAYOUTS[MERGE_NONE])
+            load_heap(mem, model)
+            scoreboard = Scoreboard(model, mem)
+            busy_cycles = mem.busy_cycles
+            result, cycles = await alloc(ALLOC_SIZE, strategy)
+            mem_cycles = mem.busy_cycles - busy_cycles
+            expected = scoreboard.check_alloc(ALLOC_SIZE, strategy, result)
+            name = STRATEGY_NAMES[strategy]
+            record(
+                "alloc",
+                name,
+                "",
+                free_list_len,
+                expected.visited,
+                cycles,
+                mem_cycles,
+            )
+
+        if free_list_len > 1:
+            # the first filler block is an exact fit, best fit need not walk on
+            for strategy in STRATEGY_NAMES:
+                model, _ = build_heap(free_list_len, CASE_LAYOUTS[MERGE_NONE])
+                load_heap(mem, model)
+                scoreboard = Scoreboard(model, mem)
+                busy_cycles = mem.busy_cycles
+                result, cycles = await alloc(FILLER_FREE_SIZE, strategy)
+                mem_cycles = mem.busy_cycles - busy_cycles
+                expected = scoreboard.check_alloc(
+                    FILLER_FREE_SIZE,
+                    strategy,
+                    result,
+                )
+                name = STRATEGY_NAMES[strategy]
+                record(
+                    "alloc_exact",
+                    name,
+                    "",
+                    free_list_len,
+                    expected.visited,
+                    cycles,
+                    mem_cycles,
+                )
+
+        for merge, layout in CASE_LAYOUTS.items():
+            if free_list_len == 1 and merge in (MERGE_LEFT, MERGE_BOTH):
+                # the only free block is right of the target, there is
+                # nothing on the left to merge with
+                continue
+            model, target = build_heap(free_list_len, layout)
+            load_heap(mem, model)
+            scoreboard = Scoreboard(model, mem)
+            busy_cycles = mem.busy_cycles
+            cycles = await free(target)
+            mem_cycles = mem.busy_cycles - busy_cycles
+            expected = scoreboard.check_free(target)
+            merged = expected.merge
+            assert merged == merge, f"{merge} layout merged {merged}"
+            record(
+                "free",
+                "",
+                merge,
+                free_list_len,
+                expected.visited,
+                cycles,
+                mem_cycles,
+            )
+
+    meta = {
+        "toplevel": toplevel,
+        "header_burst": burst,
+        "clk_period_ns": CLK_PERIOD,
+        "memory": mem.config(),
+    }
+    write_results(out, rows, meta)
+    mem.stop()
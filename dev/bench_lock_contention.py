@@ -0,0 +1,132 @@
+import os
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.utils import get_sim_time
+
+from bench_latency import (
+    ALLOC_SIZE,
+    CASE_LAYOUTS,
+    build_heap,
+    load_heap,
+    write_results,
+)
+from mem_agent import MemoryAgent, parse_latency
+from mem_rsp import issue_alloc_req, issue_free_req, wait_for_result
+from ref_model import FIRST_FIT, MERGE_NONE, Scoreboard, pack_config
+from test_falafel import reset_dut
+
+CLK_PERIOD = 10
+UNITS = "ns"
+
+FREE_LIST_PTR = 8
+LOCK_PTR = 0
+LOCK_ID = 1
+
+FIELDS = [
+    "contention",
+    "hold",
+    "ops",
+    "mean_cycles",
+    "max_cycles",
+    "mem_reqs_per_op",
+    "lock_loads_per_op",
+    "cas_failures_per_op",
+    "lock_violations",
+]
+
+
+@cocotb.test()
+async def bench_lock_contention_sweep(dut):
+    """Alloc/free latency and memory traffic with other threads on the lock.
+
+    Every point runs alloc/free pairs on a heap of BENCH_FREE_LIST_LEN free
+    headers while the memory agent emulates other lock holders (see
+    MemoryAgent). Configured from the environment:
+      BENCH_CONTENTION     comma separated per-cycle lock take probabilities
+                           (default: 0,0.01,0.05,0.1,0.2)
+      BENCH_HOLD           semicolon separated hold time specs
+                           (default: fixed:20;fixed:200;uniform:10:400)
+      BENCH_OPS            ops per point (default: 200)
+      BENCH_FREE_LIST_LEN  free headers in the heap (default: 16)
+      BENCH_OUT            output path without extension
+                           (default: bench_lock_contention)
+    """
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+
+    contentions = os.environ.get("BENCH_CONTENTION", "0,0.01,0.05,0.1,0.2")
+    contentions = [float(p) for p in contentions.split(",")]
+    holds = os.environ.get("BENCH_HOLD", "fixed:20;fixed:200;uniform:10:400")
+    holds = holds.split(";")
+    num_ops = int(os.environ.get("BENCH_OPS", "200"))
+    free_list_len = int(os.environ.get("BENCH_FREE_LIST_LEN", "16"))
+    out = os.environ.get("BENCH_OUT", "bench_lock_contention")
+
+    dut.falafel_config_i.value = pack_config(FREE_LIST_PTR, LOCK_PTR, LOCK_ID)
+    dut.config_alloc_strategy_i.value = FIRST_FIT
+    mem = MemoryAgent(dut, clk, lock_ptr=LOCK_PTR)
+    mem.start()
+    dut.req_alloc_valid_i.setimmediatevalue(0)
+    dut.result_ready_i.setimmediatevalue(1)
+    await reset_dut(dut, clk)
+
+    rows = []
+    for hold in holds:
+        for contention in contentions:
+            model, _ = build_heap(free_list_len, CASE_LAYOUTS[MERGE_NONE])
+            mem.lock_contention = 0
+            mem.lock_release_cycle = None
+            load_heap(mem, model)
+            scoreboard = Scoreboard(model, mem)
+            mem.lock_contention = contention
+            mem.lock_hold = parse_latency(hold)
+
+            before = dict(mem.lock_stats(), num_reqs=mem.num_reqs)
+            total = 0
+            worst = 0
+            addr = None
+            for i in range(num_ops):
+                if addr is None:
+                    start = await issue_alloc_req(dut, clk, ALLOC_SIZE)
+                    result = await wait_for_result(dut, clk)
+                    expected = scoreboard.check_alloc(
+                        ALLOC_SIZE,
+                        FIRST_FIT,
+                        result,
+                    )
+                    addr = expected.addr
+                else:
+                    start = await issue_free_req(dut, clk, addr)
+                    await wait_for_result(dut, clk)
+                    scoreboard.check_free(addr)
+                    addr = None
+                cycles = int((get_sim_time(UNITS) - start) // CLK_PERIOD)
+                total += cycles
+                worst = max(worst, cycles)
+            after = dict(mem.lock_stats(), num_reqs=mem.num_reqs)
+            delta = {k: after[k] - before[k] for k in after}
+
+            row = {
+                "contention": contention,
+                "hold": hold,
+                "ops": num_ops,
+                "mean_cycles": total / num_ops,
+                "max_cycles": worst,
+                "mem_reqs_per_op": delta["num_reqs"] / num_ops,
+                "lock_loads_per_op": delta["lock_loads"] / num_ops,
+                "cas_failures_per_op": delta["cas_failures"] / num_ops,
+                "lock_violations": delta["lock_violations"],
+            }
+            rows.append(row)
+            print(", ".join(f"{k}={v}" for k, v in row.items()))
+            assert (
+                row["lock_violations"] == 0
+            ), "falafel touched the heap without the lock"
+
+    meta = {
+        "free_list_len": free_list_len,
+        "memory": mem.config(),
+    }
+    write_results(out, rows, meta, FIELDS)
+    mem.stop()
@@ -0,0 +1,163 @@
+import os
+import random
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.utils import get_sim_time
+
+from bench_latency import load_heap, write_results
+from mem_agent import MemoryAgent
+from mem_rsp import issue_alloc_req, issue_free_req, wait_for_result
+from ref_model import (
+    BEST_FIT,
+    BLOCK_HEADER_SIZE,
+    FIRST_FIT,
+    MIN_ALLOC_SIZE,
+    NEXT_FIT,
+    RefAllocator,
+    Scoreboard,
+    pack_config,
+)
+from test_falafel import header_burst, reset_dut
+
+CLK_PERIOD = 10
+UNITS = "ns"
+
+FREE_LIST_PTR = 8
+LOCK_PTR = 0
+LOCK_ID = 1
+HEAP_BASE = 0x1000
+TAIL_FREE_SIZE = 1 << 24
+
+STRATEGIES = {"first": FIRST_FIT, "best": BEST_FIT, "next": NEXT_FIT}
+FIELDS = [
+    "strategy",
+    "free_blocks",
+    "ops",
+    "allocs",
+    "frees",
+    "alloc_cycles",
+    "alloc_nodes",
+    "alloc_bytes",
+    "free_cycles",
+    "free_nodes",
+    "final_free_blocks",
+]
+
+
+def build_fragmented_heap(rng, num_free_blocks):
+    """Small free blocks of random size between allocated ones, then a tail.
+
+    Most requests of the workload do not fit the first few blocks, so first
+    fit keeps walking over the same small blocks at the head of the list.
+    """
+    model = RefAllocator(FREE_LIST_PTR)
+    addr = HEAP_BASE
+    for _ in range(num_free_blocks):
+        size = rng.randrange(MIN_ALLOC_SIZE, 96, 8)
+        model.add_free_block(addr, size)
+        addr += BLOCK_HEADER_SIZE + size
+        size = rng.randrange(MIN_ALLOC_SIZE, 128, 8)
+        model.add_allocated_block(addr, size)
+        addr += BLOCK_HEADER_SIZE + size
+    model.add_free_block(addr, TAIL_FREE_SIZE)
+    return model
+
+
+@cocotb.test()
+async def bench_next_fit_fragmented(dut):
+    """Next fit against first (and best) fit on a fragmented heap.
+
+    Every strategy runs the same seeded alloc/free sequence from the same
+    initial heap; frees pick a random live block, allocs ask for 16 to 256
+    bytes. Configured from the environment:
+      BENCH_STRATEGIES   comma separated first, best, next
+                         (default: first,next)
+      BENCH_FREE_BLOCKS  small free blocks in the initial heap (default: 32)
+      BENCH_OPS          alloc/free ops per strategy (default: 400)
+      BENCH_ALLOC_RATIO  probability of an alloc (default: 0.6)
+      BENCH_SEED         seed of the heap and the op sequence (default: 1)
+      BENCH_OUT          output path without extension
+                         (default: bench_next_fit)
+    """
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+
+    strategies = os.environ.get("BENCH_STRATEGIES", "first,next").split(",")
+    num_free_blocks = int(os.environ.get("BENCH_FREE_BLOCKS", "32"))
+    num_ops = int(os.environ.get("BENCH_OPS", "400"))
+    alloc_ratio = float(os.environ.get("BENCH_ALLOC_RATIO", "0.6"))
+    seed = int(os.environ.get("BENCH_SEED", "1"))
+    out = os.environ.get("BENCH_OUT", "bench_next_fit")
+
+    dut.falafel_config_i.value = pack_config(FREE_LIST_PTR, LOCK_PTR, LOCK_ID)
+    mem = MemoryAgent(dut, clk, lock_ptr=LOCK_PTR)
+    mem.start()
+    dut.req_alloc_valid_i.setimmediatevalue(0)
+    dut.result_ready_i.setimmediatevalue(1)
+
+    rows = []
+    for name in strategies:
+        strategy = STRATEGIES[name]
+        dut.config_alloc_strategy_i.value = strategy
+        # reset so that no rover survives from the previous strategy
+        await reset_dut(dut, clk)
+        rng = random.Random(seed)
+        model = build_fragmented_heap(rng, num_free_blocks)
+        load_heap(mem, model)
+        scoreboard = Scoreboard(model, mem)
+
+        live = []
+        cycles = {"alloc": 0, "free": 0}
+        nodes = {"alloc": 0, "free": 0}
+        ops = {"alloc": 0, "free": 0}
+        alloc_bytes = 0
+        for _ in range(num_ops):
+            if not live or rng.random() < alloc_ratio:
+                kind = "alloc"
+                size = rng.randrange(MIN_ALLOC_SIZE, 256, 8)
+                start = await issue_alloc_req(dut, clk, size)
+                result = await wait_for_result(dut, clk)
+                expected = scoreboard.check_alloc(size, strategy, result)
+                live.append(expected.addr)
+                alloc_bytes += mem.traffic.last.as_dict()["bytes"]
+            else:
+                kind = "free"
+                addr = live.pop(rng.randrange(len(live)))
+                start = await issue_free_req(dut, clk, addr)
+                await wait_for_result(dut, clk)
+                scoreboard.check_free(addr)
+            cycles[kind] += int((get_sim_time(UNITS) - start) // CLK_PERIOD)
+            nodes[kind] += mem.traffic.last.nodes
+            ops[kind] += 1
+        scoreboard.check_heap()
+
+        row = {
+            "strategy": name,
+            "free_blocks": num_free_blocks,
+            "ops": num_ops,
+            "allocs": ops["alloc"],
+            "frees": ops["free"],
+            "alloc_cycles": cycles["alloc"] / max(ops["alloc"], 1),
+            "alloc_nodes": nodes["alloc"] / max(ops["alloc"], 1),
+            "alloc_bytes": alloc_bytes / max(ops["alloc"], 1),
+            "free_cycles": cycles["free"] / max(ops["free"], 1),
+            "free_nodes": nodes["free"] / max(ops["free"], 1),
+            "final_free_blocks": len(model.free),
+        }
+        rows.append(row)
+        print(
+            ", ".join(
+                f"{k}={v:.1f}" if isinstance(v, float) else f"{k}={v}"
+                for k, v in row.items()
+            )
+        )
+
+    meta = {
+        "seed": seed,
+        "alloc_ratio": alloc_ratio,
+        "header_burst": header_burst(dut),
+        "memory": mem.config(),
+    }
+    write_results(out, rows, meta, FIELDS)
+    mem.stop()
@@ -0,0 +1,296 @@
+"""Walk lengths of segregated fit against first and best fit on traces.
+
+As a cocotb bench (make MODULE=bench_segregated_fit TOPLEVEL=falafel) every
+strategy replays the same allocation trace (see alloc_trace.py) through
+falafel from one large free block, checked against the reference model,
+and the headers loaded and cycles per op are taken from the simulation.
+Traces too long to simulate can be replayed on the reference models alone,
+which count the headers walked on the free lists; --synthetic adds a long
+generated workload (see alloc_trace.synthetic_trace):
+    python bench_segregated_fit.py [--limits 64,256,1024] TRACE...
+    python bench_segregated_fit.py [--limits 64,256,1024] --synthetic OPS
+"""
+
+import argparse
+import csv
+import os
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.utils import get_sim_time
+
+from alloc_trace import (
+    OP_ALLOC,
+    OP_FREE,
+    TraceWriter,
+    read_trace,
+    synthetic_trace,
+)
+from bench_latency import load_heap, write_results
+from mem_agent import MemoryAgent
+from mem_rsp import issue_alloc_req, issue_free_req, wait_for_result
+from ref_model import (
+    BEST_FIT,
+    FIRST_FIT,
+    SEGREGATED_FIT,
+    RefAllocator,
+    Scoreboard,
+    SegregatedRefAllocator,
+    pack_config,
+)
+from replay_trace import LatencyStats
+from test_falafel import header_burst, reset_dut
+
+CLK_PERIOD = 10
+UNITS = "ns"
+
+FREE_LIST_PTR = 8
+LOCK_PTR = 0
+LOCK_ID = 1
+# 16 bytes apart, the word after each pointer is written along with it
+SIZE_CLASS_PTRS = (0x40, 0x50, 0x60, 0x70)
+SIZE_CLASS_LIMITS = (64, 256, 1024)
+HEAP_BASE = 0x1000
+HEAP_SIZE = 64 << 20
+
+STRATEGIES = {
+    "first": FIRST_FIT,
+    "best": BEST_FIT,
+    "segregated": SEGREGATED_FIT,
+}
+FIELDS = [
+    "trace",
+    "strategy",
+    "allocs",
+    "frees",
+    "alloc_nodes",
+    "alloc_nodes_p99",
+    "alloc_nodes_max",
+    "free_nodes",
+    "free_nodes_p99",
+    "alloc_cycles",
+    "alloc_cycles_p99",
+    "free_cycles",
+    "free_blocks",
+    "external_fragmentation",
+]
+
+
+def trace_ops(records):
+    """(op, size, id) per trace record, without frees of unknown ids."""
+    live = set()
+    for record in records:
+        if record.op == OP_ALLOC:
+            live.add(record.id)
+            # falafel does not handle empty blocks
+            yield OP_ALLOC, max(record.size, 1), record.id
+        elif record.id in live:
+            live.remove(record.id)
+            yield OP_FREE, 0, record.id
+
+
+def make_model(strategy, limits=SIZE_CLASS_LIMITS, heap_size=HEAP_SIZE):
+    if strategy == SEGREGATED_FIT:
+        model = SegregatedRefAllocator(SIZE_CLASS_PTRS, limits)
+    else:
+        model = RefAllocator(FREE_LIST_PTR)
+    model.add_free_block(HEAP_BASE, heap_size)
+    return model
+
+
+def replay_model(
+    records,
+    strategy,
+    limits=SIZE_CLASS_LIMITS,
+    heap_size=HEAP_SIZE,
+):
+    """Headers visited per alloc and free of the trace, on the model alone."""
+    model = make_model(strategy, limits, heap_size)
+    handles = {}
+    visited = {OP_ALLOC: LatencyStats(), OP_FREE: LatencyStats()}
+    for n, (op, size, id) in enumerate(trace_ops(records)):
+        if op == OP_ALLOC:
+            assert model.can_alloc(
+                size, strategy
+            ), f"op {n}: out of memory allocating {size}"
+            result = model.alloc(size, strategy)
+            handles[id] = result.addr
+        else:
+            result = model.free_block(handles.pop(id))
+        visited[op].add(result.visited)
+    return visited, model
+
+
+def summary_row(trace, name, nodes, cycles, model):
+    alloc, free = nodes[OP_ALLOC].summary(), nodes[OP_FREE].summary()
+    fragmentation = model.fragmentation()
+    row = {
+        "trace": trace,
+        "strategy": name,
+        "allocs": alloc["count"],
+        "frees": free["count"],
+        "alloc_nodes": alloc["mean"],
+        "alloc_nodes_p99": alloc["p99"],
+        "alloc_nodes_max": alloc["max"],
+        "free_nodes": free["mean"],
+        "free_nodes_p99": free["p99"],
+        "free_blocks": fragmentation["free_blocks"],
+        "external_fragmentation": fragmentation["external_fragmentation"],
+    }
+    if cycles is not None:
+        row["alloc_cycles"] = cycles[OP_ALLOC].summary()["mean"]
+        row["alloc_cycles_p99"] = cycles[OP_ALLOC].summary()["p99"]
+        row["free_cycles"] = cycles[OP_FREE].summary()["mean"]
+    return row
+
+
+def format_row(row):
+    fields = []
+    for k, v in row.items():
+        fields.append(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}")
+    return ", ".join(fields)
+
+
+@cocotb.test()
+async def bench_segregated_fit_trace(dut):
+    """Segregated fit against first and best fit on an allocation trace.
+
+    Headers loaded per op come from MemoryAgent.traffic (for a free they
+    include the block to free and a right neighbor it merges with, on top
+    of the list walk); cycles run from req_alloc_valid_i to
+    rsp_result_val_o. Configured from the environment:
+      TRACE_FILE               trace to replay (default: traces/example.trace)
+      BENCH_STRATEGIES         comma separated first, best, segregated
+                               (default: all of them)
+      BENCH_SIZE_CLASS_LIMITS  comma separated upper bounds of the first
+                               three size classes (default: 64,256,1024)
+      TRACE_HEAP_SIZE          size of the initial free block (default: 64 MiB)
+      BENCH_OUT                output path without extension
+                               (default: bench_segregated_fit)
+    """
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+
+    path = os.environ.get("TRACE_FILE", "traces/example.trace")
+    strategies = os.environ.get("BENCH_STRATEGIES", ",".join(STRATEGIES))
+    strategies = strategies.split(",")
+    limits = os.environ.get("BENCH_SIZE_CLASS_LIMITS", "64,256,1024")
+    limits = [int(x, 0) for x in limits.split(",")]
+    heap_size = int(os.environ.get("TRACE_HEAP_SIZE", str(HEAP_SIZE)), 0)
+    out = os.environ.get("BENCH_OUT", "bench_segregated_fit")
+
+    dut.falafel_config_i.value = pack_config(
+        FREE_LIST_PTR, LOCK_PTR, LOCK_ID, SIZE_CLASS_PTRS, limits
+    )
+    mem = MemoryAgent(dut, clk, lock_ptr=LOCK_PTR)
+    mem.start()
+    dut.req_alloc_valid_i.setimmediatevalue(0)
+    dut.result_ready_i.setimmediatevalue(1)
+
+    rows = []
+    for name in strategies:
+        strategy = STRATEGIES[name]
+        dut.config_alloc_strategy_i.value = strategy
+        await reset_dut(dut, clk)
+        model = make_model(strategy, limits, heap_size)
+        load_heap(mem, model)
+        scoreboard = Scoreboard(model, mem)
+
+        handles = {}
+        nodes = {OP_ALLOC: LatencyStats(), OP_FREE: LatencyStats()}
+        cycles = {OP_ALLOC: LatencyStats(), OP_FREE: LatencyStats()}
+        for n, (op, size, id) in enumerate(trace_ops(read_trace(path))):
+            if op == OP_ALLOC:
+                assert model.can_alloc(size, strategy), (
+                    f"op {n}: out of memory allocating {size} bytes, "
+                    "raise TRACE_HEAP_SIZE"
+                )
+                start = await issue_alloc_req(dut, clk, size)
+                result = await wait_for_result(dut, clk)
+                expected = scoreboard.check_alloc(size, strategy, result)
+                handles[id] = expected.addr
+            else:
+                addr = handles.pop(id)
+                start = await issue_free_req(dut, clk, addr)
+                await wait_for_result(dut, clk)
+                scoreboard.check_free(addr)
+            cycles[op].add(int((get_sim_time(UNITS) - start) // CLK_PERIOD))
+            nodes[op].add(mem.traffic.last.nodes)
+        scoreboard.check_heap()
+
+        row = summary_row(os.path.basename(path), name, nodes, cycles, model)
+        rows.append(row)
+        print(format_row(row))
+
+    meta = {
+        "size_class_limits": limits,
+        "header_burst": header_burst(dut),
+        "memory": mem.config(),
+    }
+    write_results(out, rows, meta, FIELDS)
+    mem.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "traces",
+        nargs="*",
+        help="allocation traces to replay",
+    )
+    parser.add_argument(
+        "--synthetic", type=int, default=0, help="ops of a generated trace"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=1, help="seed of the generated trace"
+    )
+    parser.add_argument(
+        "--write-trace", help="save the generated trace, e.g. for TRACE_FILE"
+    )
+    parser.add_argument("--strategies", default=",".join(STRATEGIES))
+    parser.add_argument(
+        "--limits", default="64,256,1024", help="size class upper bounds"
+    )
+    parser.add_argument(
+        "--heap-size",
+        type=lambda x: int(x, 0),
+        default=HEAP_SIZE,
+    )
+    parser.add_argument("--csv", help="write the rows to this path")
+    args = parser.parse_args()
+    limits = [int(x, 0) for x in args.limits.split(",")]
+
+    traces = [
+        (os.path.basename(path), lambda path=path: read_trace(path))
+        for path in args.traces
+    ]
+    if args.synthetic:
+        name = f"synthetic_{args.synthetic}_seed{args.seed}"
+        traces.append(
+            (name, lambda: synthetic_trace(args.synthetic, args.seed)),
+        )
+        if args.write_trace:
+            writer = TraceWriter(args.write_trace)
+            for r in synthetic_trace(args.synthetic, args.seed):
+                writer.write(r.op, r.size, r.id, r.timestamp)
+            writer.close()
+    assert traces, "give a trace or --synthetic"
+
+    rows = []
+    for trace, records in traces:
+        for name in args.strategies.split(","):
+            visited, model = replay_model(
+                records(), STRATEGIES[name], limits, args.heap_size
+            )
+            row = summary_row(trace, name, visited, None, model)
+            rows.append(row)
+            print(format_row(row))
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""Simulated cycles per second of each Verilator build profile.
+
+Builds the toplevels with every profile of BUILD_PROFILES in regress.py
+(cached in sim_cache/ like the regression) and runs the same fixed
+alloc/free workload on each, one run at a time so the runs do not compete
+for CPUs:
+    falafel          test_stress, first fit, STRESS_SEED=1, --ops ops
+    falafel_wrapper  bench_throughput with 2 alloc and 2 free queues,
+                     BENCH_SEED=1, --cycles cycles
+Every run is repeated --repeat times and the fastest one counts; its wall
+clock time is the one of the test in results.xml, so the model startup is
+left out. On machines with fewer CPUs than --threads the threads profile
+still runs, Verilator warns that it is slowed down.
+
+    python bench_sim_speed.py
+    python bench_sim_speed.py -p fast -p threads --threads 4 --ops 100000
+Results go to bench_sim_speed.csv and .json, the run directories to
+regress_results/.
+"""
+
+import argparse
+import csv
+import json
+import os
+import shlex
+import time
+
+import regress
+import sim_profile
+
+CLK_PERIOD_NS = 10
+
+# toplevel, module, test, parameters, environment of the workload
+WORKLOADS = [
+    (
+        "falafel",
+        "test_stress",
+        "test_stress_alloc_free",
+        {},
+        {
+            "STRESS_SEED": "1",
+            "STRESS_STRATEGY": "first",
+            "STRESS_OPS": "{ops}",
+        },
+    ),
+    (
+        "falafel_wrapper",
+        "bench_throughput",
+        "bench_wrapper_throughput",
+        {"NUM_ALLOC_QUEUES": "2", "NUM_FREE_QUEUES": "2"},
+        {"BENCH_SEED": "1", "BENCH_CYCLES": "{cycles}"},
+    ),
+]
+
+FIELDS = [
+    "toplevel",
+    "profile",
+    "status",
+    "build_s",
+    "cycles",
+    "wall_s",
+    "cycles_per_s",
+    "speedup",
+]
+
+
+def run_profile(
+    workload,
+    profile,
+    threads,
+    compile_args,
+    out_dir,
+    repeat,
+    ops,
+    cycles,
+    timeout,
+):
+    """Row of one toplevel built with `profile` on top of `compile_args`."""
+    toplevel, module, test, parameters, env = workload
+    compile_args = compile_args + regress.profile_args(profile, threads)
+    row = {"toplevel": toplevel, "profile": profile}
+
+    start = time.time()
+    try:
+        _, sim_build, cached = regress.build(
+            toplevel,
+            parameters,
+            compile_args,
+        )
+    except SystemExit as e:
+        # cocotb-test exits on a failed build, the log is in sim_cache/
+        row["status"] = f"BUILD FAILED ({e})"
+        return row
+    row["build_s"] = 0.0 if cached else time.time() - start
+
+    for name, value in env.items():
+        os.environ[name] = value.format(ops=ops, cycles=cycles)
+    best = None
+    for i in range(repeat):
+        run_dir = os.path.join(out_dir, f"{profile}-{i}")
+        job = regress.Job(toplevel, module, test, 1)
+        result = regress.run_job(
+            job,
+            sim_build,
+            run_dir,
+            parameters,
+            compile_args,
+            timeout,
+            False,
+            False,
+            False,
+        )
+        if result["status"] != "PASS":
+            row["status"] = f"{result['status']} {result['message']}"
+            return row
+        _, wall_s, sim_time_ns = sim_profile.read_results(
+            os.path.join(run_dir, job.name, sim_profile.RESULTS_FILE)
+        )
+        if best is None or wall_s < best[0]:
+            best = (wall_s, sim_time_ns)
+    wall_s, sim_time_ns = best
+    row["status"] = "PASS"
+    row["cycles"] = sim_time_ns / CLK_PERIOD_NS
+    row["wall_s"] = wall_s
+    row["cycles_per_s"] = row["cycles"] / wall_s
+    return row
+
+
+def report(rows):
+    lines = [
+        f"{'toplevel':16} {'profile':8} {'build s':>8} {'cycles':>10} "
+        f"{'wall s':>8} "
+        f"{'cycles/s':>10} {'speedup':>8}"
+    ]
+    for r in rows:
+        if r["status"] != "PASS":
+            lines.append(f"{r['toplevel']:16} {r['profile']:8} {r['status']}")
+            continue
+        build = f"{r['build_s']:8.1f}" if r["build_s"] else f"{'cached':>8}"
+        speedup = f"{r['speedup']:7.2f}x" if r.get("speedup") else f"{'':>8}"
+        lines.append(
+            f"{r['toplevel']:16} {r['profile']:8} {build} {r['cycles']:10.0f} "
+            f"{r['wall_s']:8.2f} {r['cycles_per_s']:10.0f} {speedup}"
+        )
+    return "\n".join(lines)
+
+
+def write_results(path, rows, args):
+    with open(path + ".csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(path + ".json", "w") as f:
+        json.dump(
+            {
+                "clk_period_ns": CLK_PERIOD_NS,
+                "ops": args.ops,
+                "cycles": args.cycles,
+                "threads": args.threads,
+                "repeat": args.repeat,
+                "results": rows,
+            },
+            f,
+            indent=2,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "-p",
+        "--profile",
+        action="append",
+        choices=list(regress.BUILD_PROFILES),
+        help="profiles to compare (default: all)",
+    )
+    parser.add_argument(
+        "-t",
+        "--toplevel",
+        action="append",
+        choices=[w[0] for w in WORKLOADS],
+        help="default: both",
+    )
+    parser.add_argument(
+        "--compile-args",
+        default=regress.COMPILE_ARGS,
+        help="added to the arguments of every profile",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=2,
+        help="model threads of the threads profile",
+    )
+    parser.add_argument(
+        "--ops", type=int, default=2000, help="alloc/free ops on falafel"
+    )
+    parser.add_argument(
+        "--cycles",
+        type=int,
+        default=20000,
+        help="measurement window of the wrapper",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="runs per profile, the fastest counts",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=3600,
+        help="seconds per run",
+    )
+    parser.add_argument(
+        "--out", default="bench_sim_speed", help="csv/json path without suffix"
+    )
+    args = parser.parse_args()
+
+    profiles = args.profile or list(regress.BUILD_PROFILES)
+    out_dir = os.path.join(
+        regress.RESULTS_DIR, time.strftime("bench_sim_speed-%Y%m%d-%H%M%S")
+    )
+    rows = []
+    for workload in WORKLOADS:
+        if args.toplevel and workload[0] not in args.toplevel:
+            continue
+        default = None
+        for profile in profiles:
+            print(f"{workload[0]}: {profile}")
+            row = run_profile(
+                workload,
+                profile,
+                args.threads,
+                shlex.split(args.compile_args),
+                os.path.join(out_dir, workload[0]),
+                args.repeat,
+                args.ops,
+                args.cycles,
+                args.timeout,
+            )
+            if row["status"] == "PASS" and profile == "default":
+                default = row["cycles_per_s"]
+            rows.append(row)
+        for row in rows:
+            same_toplevel = row["toplevel"] == workload[0]
+            if same_toplevel and row["status"] == "PASS" and default:
+                row["speedup"] = row["cycles_per_s"] / default
+
+    print(report(rows))
+    write_results(args.out, rows, args)
+    print(f"Wrote {len(rows)} results to {args.out}.csv and {args.out}.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import json
+import os
+import random
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import ClockCycles
+
+from mem_agent import MemoryAgent
+from ref_model import RefAllocator, Scoreboard
+from test_falafel import header_burst
+from test_falafel_wrapper import configure_wrapper, reset_dut
+from wrapper_driver import WrapperDriver
+
+CLK_PERIOD = 10
+UNITS = "ns"
+
+FREE_LIST_PTR = 8
+LOCK_PTR = 0
+LOCK_ID = 1
+HEAP_BASE = 0x1000
+HEAP_SIZE = 1 << 30
+
+
+def queue_counts(dut):
+    # the split of req_val_i into header/alloc/free queues is a parameter of
+    # the wrapper, read it from the model when the simulator exposes it
+    try:
+        names = ("NUM_HEADER_QUEUES", "NUM_ALLOC_QUEUES", "NUM_FREE_QUEUES")
+        return tuple(int(getattr(dut, name).value) for name in names)
+    except AttributeError:
+        counts = os.environ.get("BENCH_QUEUES", "1,1,1")
+        return tuple(int(n) for n in counts.split(","))
+
+
+@cocotb.test()
+async def bench_wrapper_throughput(dut):
+    """Sustained ops/cycle of falafel_wrapper with every queue busy.
+
+    Build the wrapper with more queues to size them, e.g.
+    python regress.py -m falafel_wrapper:bench_throughput -P NUM_ALLOC_QUEUES=2
+    or with -P MAX_BATCH_OPS=N to serve queued requests in batches under
+    one lock acquisition.
+    Configured from the environment:
+      BENCH_CYCLES       length of the measurement window (default: 20000)
+      BENCH_QUEUES       header,alloc,free queue counts if the simulator does
+                         not expose the parameters (default: 1,1,1)
+      BENCH_RESP_STALL   probability resp_rdy_i is low in a cycle (default: 0)
+      BENCH_FREE_RATIO   share of frees sent on header queues (default: 0.5)
+      BENCH_SEED         seed of the request mix (default: RANDOM_SEED)
+      BENCH_OUT          write the report as json to this path
+    """
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+
+    cycles = int(os.environ.get("BENCH_CYCLES", "20000"))
+    resp_stall_prob = float(os.environ.get("BENCH_RESP_STALL", "0"))
+    free_ratio = float(os.environ.get("BENCH_FREE_RATIO", "0.5"))
+    seed = int(os.environ.get("BENCH_SEED", cocotb.RANDOM_SEED))
+    num_header, num_alloc, num_free = queue_counts(dut)
+
+    mem = MemoryAgent(dut, clk)
+    model = RefAllocator(FREE_LIST_PTR)
+    model.add_free_block(HEAP_BASE, HEAP_SIZE)
+    mem.write_header(HEAP_BASE, HEAP_SIZE, 0)
+    mem.write_word(FREE_LIST_PTR, HEAP_BASE)
+    scoreboard = Scoreboard(model, mem)
+    mem.start()
+
+    for i in range(len(dut.req_val_i)):
+        dut.req_val_i[i].setimmediatevalue(0)
+    dut.resp_rdy_i.setimmediatevalue(1)
+    await reset_dut(dut, clk)
+    await configure_wrapper(dut, clk, FREE_LIST_PTR, LOCK_PTR, LOCK_ID)
+
+    driver = WrapperDriver(
+        dut,
+        clk,
+        scoreboard,
+        random.Random(seed),
+        num_header_queues=num_header,
+        num_alloc_queues=num_alloc,
+        num_free_queues=num_free,
+        resp_stall_prob=resp_stall_prob,
+        free_ratio=free_ratio,
+    )
+    driver.start()
+    num_reqs, cas_attempts = mem.num_reqs, mem.cas_attempts
+    await ClockCycles(clk, cycles)
+    completed = driver.completed
+    num_reqs = mem.num_reqs - num_reqs
+    cas_attempts = mem.cas_attempts - cas_attempts
+    driver.stop()
+    await driver.drain()
+    driver.kill()
+    scoreboard.check_heap()
+
+    report = driver.report(cycles, completed)
+    report["queue_counts"] = {
+        "header": num_header,
+        "alloc": num_alloc,
+        "free": num_free,
+    }
+    report["seed"] = seed
+    report["header_burst"] = header_burst(dut)
+    report["max_batch_ops"] = int(getattr(dut, "MAX_BATCH_OPS", 1))
+    # lock acquisitions are CAS attempts, one per batch of ops
+    report["mem_reqs_per_op"] = num_reqs / completed if completed else 0.0
+    report["cas_per_op"] = cas_attempts / completed if completed else 0.0
+    report["memory"] = mem.config()
+    report["traffic"] = mem.traffic.report()
+    print(json.dumps(report, indent=2))
+    scoreboard.report()
+    if "BENCH_OUT" in os.environ:
+        with open(os.environ["BENCH_OUT"], "w") as f:
+            json.dump(report, f, indent=2)
+    mem.stop()
@@ -3,7 +3,17 @@
 
 module falafel
   import falafel_pkg::*;
-(
+#(
+    parameter bit BEST_FIT_STOP_UNSPLITTABLE = 1'b0,
+    parameter unsigned MAX_BATCH_OPS = 1,
+    parameter unsigned MAX_LOCK_HOLD_CYCLES = 0,
+    parameter bit HEADER_BURST = 1'b0,
+    // headers kept on chip between the core and the LSU (0: no cache),
+    // see falafel_header_cache
+    parameter unsigned HEADER_CACHE_ENTRIES = 0,
+    parameter bit HEADER_CACHE_KEEP_ON_LOCK = 1'b0,
+    localparam unsigned MEM_DATA_W = HEADER_BURST ? 2 * DATA_W : DATA_W
+) (
     input logic clk_i,
     input logic rst_ni,
     input alloc_strategy_t config_alloc_strategy_i,
@@ -24,22 +34,39 @@ module falafel
     input  logic              mem_req_rdy_i,       // mem ready
     output logic              mem_req_is_write_o,  // 1 for write, 0 for read
     output logic              mem_req_is_cas_o,    // 1 for cas, 0 for write
+    output logic              mem_req_is_burst_o,  // 1 for a whole header, see falafel_lsu
     output logic [DATA_W-1:0] mem_req_addr_o,      // address
-    output logic [DATA_W-1:0] mem_req_data_o,      // write data
+    output logic [MEM_DATA_W-1:0] mem_req_data_o,  // write data
     output logic [DATA_W-1:0] mem_req_cas_exp_o,   // compare & swap expected value
 
     //----------- memory response ------------//
     input  logic              mem_rsp_val_i,  // resp valid
     output logic              mem_rsp_rdy_o,  // falafel ready
-    input  logic [DATA_W-1:0] mem_rsp_data_i
+    input  logic [MEM_DATA_W-1:0] mem_rsp_data_i,
+
+    //----------- header cache ------------//
+    output logic [DATA_W-1:0] header_cache_hits_o,   // LOADs served on chip
+    output logic [DATA_W-1:0] header_cache_misses_o,  // LOADs sent to the LSU
+
+    //----------- perf counters ------------//
+    output perf_events_t perf_events_o
 );
 
   header_req_t core_req_header;
   header_rsp_t core_rsp_header;
   logic core_ready;
   logic lsu_ready;
+  header_req_t lsu_req_header;
+  header_rsp_t lsu_rsp_header;
+  logic lsu_core_ready;
+  logic cache_ready;
+  logic header_cache_hit;
 
-  falafel_core i_core (
+  falafel_core #(
+      .BEST_FIT_STOP_UNSPLITTABLE(BEST_FIT_STOP_UNSPLITTABLE),
+      .MAX_BATCH_OPS(MAX_BATCH_OPS),
+      .MAX_LOCK_HOLD_CYCLES(MAX_LOCK_HOLD_CYCLES)
+  ) i_core (
       .clk_i,
       .rst_ni,
       .config_alloc_strategy_i,
@@ -50,21 +77,53 @@ module falafel
       .size_to_allocate_i,
       .req_alloc_valid_i,
       .core_ready_o(core_ready),
-      .lsu_ready_i(lsu_ready),
+      .lsu_ready_i(cache_ready),
       .rsp_from_lsu_i(core_rsp_header),
       .req_to_lsu_o(core_req_header),
       .result_ready_i,
       .rsp_result_is_write_o,
       .rsp_result_val_o,
-      .rsp_result_data_o
+      .rsp_result_data_o,
+      .header_load_o(perf_events_o.header_load)
   );
 
-  falafel_lsu i_lsu (
+  if (HEADER_CACHE_ENTRIES > 0) begin : g_header_cache
+    falafel_header_cache #(
+        .NUM_ENTRIES(HEADER_CACHE_ENTRIES),
+        .KEEP_ON_LOCK(HEADER_CACHE_KEEP_ON_LOCK)
+    ) i_header_cache (
+        .clk_i,
+        .rst_ni,
+        .core_req_header_i(core_req_header),
+        .core_rsp_header_o(core_rsp_header),
+        .core_rdy_i(core_ready),
+        .cache_ready_o(cache_ready),
+        .lsu_req_header_o(lsu_req_header),
+        .lsu_rsp_header_i(lsu_rsp_header),
+        .lsu_core_rdy_o(lsu_core_ready),
+        .lsu_ready_i(lsu_ready),
+        .hit_o(header_cache_hit),
+        .hits_o(header_cache_hits_o),
+        .misses_o(header_cache_misses_o)
+    );
+  end else begin : g_no_header_cache
+    assign lsu_req_header = core_req_header;
+    assign core_rsp_header = lsu_rsp_header;
+    assign lsu_core_ready = core_ready;
+    assign cache_ready = lsu_ready;
+    assign header_cache_hit = 0;
+    assign header_cache_hits_o = '0;
+    assign header_cache_misses_o = '0;
+  end
+
+  falafel_lsu #(
+      .HEADER_BURST(HEADER_BURST)
+  ) i_lsu (
       .clk_i,
       .rst_ni,
-      .core_req_header_i(core_req_header),
-      .core_rsp_header_o(core_rsp_header),
-      .core_rdy_i(core_ready),
+      .core_req_header_i(lsu_req_header),
+      .core_rsp_header_o(lsu_rsp_header),
+      .core_rdy_i(lsu_core_ready),
       .lsu_ready_o(lsu_ready),
 
       //----------- memory request ------------//
@@ -72,6 +131,7 @@ module falafel
       .mem_req_rdy_i,  // mem ready
       .mem_req_is_write_o,  // 1 for write, 0 for read
       .mem_req_is_cas_o,  // 1 for cas, 0 for write
+      .mem_req_is_burst_o,  // 1 for a whole header
       .mem_req_addr_o,  // address
       .mem_req_data_o,  // write data
       .mem_req_cas_exp_o,
@@ -80,6 +140,7 @@ module falafel
       //----------- memory response ------------//
       .mem_rsp_val_i,  // resp valid
       .mem_rsp_rdy_o,  // falafel ready
-      .mem_rsp_data_i
+      .mem_rsp_data_i,
+      .cas_retry_o(perf_events_o.cas_retry)
   );
 endmodule
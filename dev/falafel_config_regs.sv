@@ -10,22 +10,47 @@ module falafel_config_regs
     input logic write_i,
     input logic [DATA_W-1:0] addr_i,
     input logic [DATA_W-1:0] data_i,
+    output logic ready_o,  // takes write_i
+
+    // a write to a perf counter returns the counter instead
+    input perf_counters_t perf_counters_i,
+    output logic read_val_o,
+    input logic read_rdy_i,
+    output logic [DATA_W-1:0] read_data_o,
 
     output config_regs_t config_o
 );
   typedef logic [DATA_W-1:0] word_t;
 
   config_regs_t config_d, config_q;
+  logic read_val_d, read_val_q;
+  logic [DATA_W-1:0] read_data_d, read_data_q;
 
   always_comb begin
     config_d = config_q;
+    read_val_d = read_val_q && !read_rdy_i;
+    read_data_d = read_data_q;
 
     if (write_i) begin
       unique case (addr_i)
         FREE_LIST_PTR_ADDR: config_d.free_list_ptr = word_t'(data_i);
         LOCK_PTR_ADDR: config_d.lock_ptr = word_t'(data_i);
         LOCK_ID_ADDR: config_d.lock_id = word_t'(data_i);
-        default: ;
+        ALLOC_STRATEGY_ADDR: config_d.alloc_strategy = alloc_strategy_t'(data_i[31:0]);
+        default: begin
+          for (int i = 0; i < NUM_SIZE_CLASSES; i++) begin
+            if (addr_i == SIZE_CLASS_PTR_ADDR + 8 * i) config_d.size_class_ptr[i] = word_t'(data_i);
+          end
+          for (int i = 0; i < NUM_SIZE_CLASSES - 1; i++) begin
+            if (addr_i == SIZE_CLASS_LIMIT_ADDR + 8 * i) config_d.size_class_limit[i] = word_t'(data_i);
+          end
+          for (int i = 0; i < NUM_PERF_COUNTERS; i++) begin
+            if (addr_i == PERF_COUNTER_ADDR + 8 * i) begin
+              read_val_d = 1;
+              read_data_d = perf_counters_i[i];
+            end
+          end
+        end
       endcase
     end
   end
@@ -33,10 +58,17 @@ module falafel_config_regs
   always_ff @(posedge clk_i) begin
     if (!rst_ni) begin
       config_q <= '0;
+      read_val_q <= 0;
+      read_data_q <= '0;
     end else begin
       config_q <= config_d;
+      read_val_q <= read_val_d;
+      read_data_q <= read_data_d;
     end
   end
 
   assign config_o = config_q;
+  assign ready_o = !read_val_q;
+  assign read_val_o = read_val_q;
+  assign read_data_o = read_data_q;
 endmodule
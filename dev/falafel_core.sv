@@ -2,7 +2,18 @@
 
 module falafel_core
   import falafel_pkg::*;
-(
+#(
+    // best fit also stops at the first fit too small to split, instead of
+    // walking on for a tighter one
+    parameter bit BEST_FIT_STOP_UNSPLITTABLE = 1'b0,
+    // ops served per lock acquisition: while it holds the lock the core
+    // takes the next queued request right after returning a result, and
+    // releases the lock once none is pending or one of the caps is hit
+    parameter unsigned MAX_BATCH_OPS = 1,
+    // no new op is started under the lock after it was held this many
+    // cycles (0: no cap besides MAX_BATCH_OPS)
+    parameter unsigned MAX_LOCK_HOLD_CYCLES = 0
+) (
     input logic clk_i,
     input logic rst_ni,
     input alloc_strategy_t config_alloc_strategy_i,
@@ -19,7 +30,8 @@ module falafel_core
     (* mark_debug = "true" *) input logic result_ready_i,
     (* mark_debug = "true" *) output logic rsp_result_val_o,
     (* mark_debug = "true" *) output logic rsp_result_is_write_o,
-    (* mark_debug = "true" *) output logic [DATA_W-1:0] rsp_result_data_o
+    (* mark_debug = "true" *) output logic [DATA_W-1:0] rsp_result_data_o,
+    output logic header_load_o  // a header, not a list head pointer, is requested
 );
 
   typedef enum integer {
@@ -29,6 +41,8 @@ module falafel_core
     REQ_LOAD_HEADER,
     ALLOC_SEARCH_POS_FIRST_FIT,
     ALLOC_SEARCH_POS_BEST_FIT,
+    ALLOC_SEARCH_POS_NEXT_FIT,
+    ALLOC_SEARCH_POS_SEGREGATED_FIT,
     REQ_ADJUST_ALLOCATED_HEADER,
     FREE_SEARCH_POS,
     FREE_CHECK_NEIGHBORS,
@@ -46,6 +60,7 @@ module falafel_core
     CORE_LOAD_HEADER,
     CORE_ADJUST_ALLOCATED_HEADER,
     CORE_LOAD_FREE_TARGET_HEADER,
+    CORE_LOAD_FREE_TARGET_SIZE,
     CORE_LOAD_RIGHT_HEADER_FOR_MERGE_BOTH_SIDES,
     CORE_LOAD_RIGHT_HEADER_FOR_MERGE_RIGHT,
     CORE_MERGE_RIGHT,
@@ -59,6 +74,7 @@ module falafel_core
     FIRST_HEADER_ADDR,
     SEARCH,
     FREE_TARGET_HEADER,
+    FREE_TARGET_SIZE,
     FREE_RIGHT_HEADER
   } load_type_t;
 
@@ -82,6 +98,24 @@ module falafel_core
   header_t best_fit_header_prev_d, best_fit_header_prev_q;
   logic [DATA_W-1:0] smallest_diff_d, smallest_diff_q;
 
+  // next fit resumes from the free header after its last allocation; it is
+  // forgotten when a free or another strategy changes the list around it
+  logic rover_valid_d, rover_valid_q;
+  logic [DATA_W-1:0] rover_addr_d, rover_addr_q;
+  logic [DATA_W-1:0] rover_prev_addr_d, rover_prev_addr_q;
+  logic next_fit_wrapped_d, next_fit_wrapped_q;
+
+  // segregated fit walks the list of one size class at a time; a free
+  // loads its block first to find the class it goes to
+  size_class_t size_class_d, size_class_q;
+  logic [DATA_W-1:0] list_head_ptr;
+
+  // batching (MAX_BATCH_OPS > 1): the lock is kept between ops
+  logic lock_held_d, lock_held_q;
+  logic [DATA_W-1:0] batch_ops_d, batch_ops_q;
+  logic [DATA_W-1:0] lock_hold_cycles_d, lock_hold_cycles_q;
+  logic batch_continue;
+
   (* mark_debug = "true" *) header_t alloc_target_header_d, alloc_target_header_q;
   header_t free_target_header_d, free_target_header_q;
   header_t header_to_create_d, header_to_create_q;
@@ -93,6 +127,17 @@ module falafel_core
   header_t merged_block_header_d, merged_block_header_q;
 
 
+  function automatic size_class_t size_class_of(input logic [DATA_W-1:0] size_i,
+                                                input config_regs_t config_i);
+    size_class_of = size_class_t'(NUM_SIZE_CLASSES - 1);
+    for (int i = NUM_SIZE_CLASSES - 2; i >= 0; i--) begin
+      if (size_i < config_i.size_class_limit[i]) size_class_of = size_class_t'(i);
+    end
+  endfunction
+
+  assign list_head_ptr = (config_alloc_strategy_i == SEGREGATED_FIT) ?
+      falafel_config_i.size_class_ptr[size_class_q] : falafel_config_i.free_list_ptr;
+
   task automatic send_req_to_lsu(input header_t header_i, input req_lsu_op_t lsu_op_i,
                                  output header_req_t req_to_lsu_o);
     begin
@@ -115,7 +160,7 @@ module falafel_core
         alloc_target_header_o.size = size_to_allocate_i;  // TODO
         alloc_target_header_o.next_addr = '0;
         header_to_create_o.addr = fit_header_i.addr + BLOCK_HEADER_SIZE + size_to_allocate_i;
-        header_to_create_o.size = fit_header_i.size - size_to_allocate_i;
+        header_to_create_o.size = fit_header_i.size - size_to_allocate_i - BLOCK_HEADER_SIZE;
         header_to_create_o.next_addr = fit_header_i.next_addr;
         header_to_adjust_link_o.next_addr = header_to_create_o.addr;
       end else begin
@@ -126,9 +171,40 @@ module falafel_core
     end
   endtask
 
+  // where an op starts once the lock is held: the first header address,
+  // the rover for a next fit alloc or the block to free for segregated fit
+  task automatic start_op_under_lock(
+      input logic is_alloc_i, input alloc_strategy_t alloc_strategy_i, input logic rover_valid_i,
+      input logic [DATA_W-1:0] rover_addr_i, input logic [DATA_W-1:0] rover_prev_addr_i,
+      output core_state_e next_state_o, output load_type_t load_type_o,
+      output logic [DATA_W-1:0] prev_addr_o, output logic [DATA_W-1:0] curr_addr_o,
+      output logic next_fit_wrapped_o, output logic rover_valid_o);
+    begin
+      next_state_o = REQ_LOAD_HEADER;
+      load_type_o = FIRST_HEADER_ADDR;
+      prev_addr_o = '0;
+      curr_addr_o = '0;
+      next_fit_wrapped_o = 1;
+      rover_valid_o = rover_valid_i;
+      if (is_alloc_i && (alloc_strategy_i == NEXT_FIT)) begin
+        if (rover_valid_i) begin
+          prev_addr_o = rover_prev_addr_i;
+          curr_addr_o = rover_addr_i;
+          load_type_o = SEARCH;
+          next_fit_wrapped_o = 0;
+        end
+      end else if (is_alloc_i) begin
+        rover_valid_o = 0;
+      end else if (alloc_strategy_i == SEGREGATED_FIT) begin
+        load_type_o = FREE_TARGET_SIZE;
+      end
+    end
+  endtask
+
   always_comb begin : core_fsm
     req_to_lsu_o = '0;
     core_ready_o = 0;
+    header_load_o = 0;
 
     state_d = state_q;
     is_alloc_d = is_alloc_q;
@@ -150,6 +226,16 @@ module falafel_core
     best_fit_header_d = best_fit_header_q;
     best_fit_header_prev_d = best_fit_header_prev_q;
     smallest_diff_d = smallest_diff_q;
+    rover_valid_d = rover_valid_q;
+    rover_addr_d = rover_addr_q;
+    rover_prev_addr_d = rover_prev_addr_q;
+    next_fit_wrapped_d = next_fit_wrapped_q;
+    size_class_d = size_class_q;
+    lock_held_d = lock_held_q;
+    batch_ops_d = batch_ops_q;
+    lock_hold_cycles_d = lock_held_q ? lock_hold_cycles_q + 1 : '0;
+    batch_continue = (batch_ops_q < MAX_BATCH_OPS) &&
+        ((MAX_LOCK_HOLD_CYCLES == 0) || (lock_hold_cycles_q < MAX_LOCK_HOLD_CYCLES));
 
     first_header_ptr_d = first_header_ptr_q;
     alloc_target_header_d = alloc_target_header_q;
@@ -197,28 +283,44 @@ module falafel_core
         right_header_d = '0;
         merged_block_header_d = '0;
 
-        if (req_alloc_valid_i) begin
+        if (lock_held_q && !(req_alloc_valid_i && batch_continue)) begin
+          // end of the batch, leave the pending request for the next one
+          req_alloc_ready_o = 0;
+          state_d = REQ_RELEASE_LOCK;
+        end else if (req_alloc_valid_i) begin
           is_alloc_d = is_alloc_i ? 1 : 0;
           size_to_allocate_d = req_alloc_valid_i ? size_to_allocate_i : '0;
           addr_to_free_d = addr_to_free_i;
+          size_class_d = size_class_of(size_to_allocate_i, falafel_config_i);
           state_d = REQ_ACQUIRE_LOCK;
           core_ready_o = 0;
         end
       end
       REQ_ACQUIRE_LOCK: begin
-        header_to_get_lock.addr = falafel_config_i.lock_ptr;
-        header_to_get_lock.size = falafel_config_i.lock_id;  // irregular header for lock key area
-        send_req_to_lsu(.header_i(header_to_get_lock), .lsu_op_i(LOCK),
-                        .req_to_lsu_o(req_to_lsu_o));
-        if (lsu_ready_i) begin
-          core_op_d = CORE_ACQUIRE_LOCK;
-          state_d   = WAIT_RSP_FROM_LSU;
+        if (lock_held_q) begin
+          batch_ops_d = batch_ops_q + 1;
+          start_op_under_lock(.is_alloc_i(is_alloc_q), .alloc_strategy_i(config_alloc_strategy_i),
+                              .rover_valid_i(rover_valid_q), .rover_addr_i(rover_addr_q),
+                              .rover_prev_addr_i(rover_prev_addr_q), .next_state_o(state_d),
+                              .load_type_o(load_type_d), .prev_addr_o(prev_header_d.addr),
+                              .curr_addr_o(curr_header_d.addr),
+                              .next_fit_wrapped_o(next_fit_wrapped_d),
+                              .rover_valid_o(rover_valid_d));
+        end else begin
+          header_to_get_lock.addr = falafel_config_i.lock_ptr;
+          header_to_get_lock.size = falafel_config_i.lock_id;  // irregular header for lock key area
+          send_req_to_lsu(.header_i(header_to_get_lock), .lsu_op_i(LOCK),
+                          .req_to_lsu_o(req_to_lsu_o));
+          if (lsu_ready_i) begin
+            core_op_d = CORE_ACQUIRE_LOCK;
+            state_d   = WAIT_RSP_FROM_LSU;
+          end
         end
       end
       REQ_LOAD_HEADER: begin
         unique case (load_type_q)
           FIRST_HEADER_ADDR: begin
-            load_req_header.addr = falafel_config_i.free_list_ptr;
+            load_req_header.addr = list_head_ptr;
             core_op_d = CORE_LOAD_FIRST_HEADER_ADDR;
           end
           SEARCH: begin
@@ -229,6 +331,10 @@ module falafel_core
             load_req_header.addr = addr_to_free_q - BLOCK_HEADER_SIZE;
             core_op_d = CORE_LOAD_FREE_TARGET_HEADER;
           end
+          FREE_TARGET_SIZE: begin
+            load_req_header.addr = addr_to_free_q - BLOCK_HEADER_SIZE;
+            core_op_d = CORE_LOAD_FREE_TARGET_SIZE;
+          end
           FREE_RIGHT_HEADER: begin
             load_req_header.addr = curr_header_q.next_addr;
             if (core_op_q == CORE_MERGE_BOTH_SIDES)
@@ -240,6 +346,7 @@ module falafel_core
         endcase
         send_req_to_lsu(.header_i(load_req_header), .lsu_op_i(LOAD), .req_to_lsu_o(req_to_lsu_o));
         if (lsu_ready_i) begin
+          header_load_o = (load_type_q != FIRST_HEADER_ADDR);
           state_d = WAIT_RSP_FROM_LSU;
         end
       end
@@ -271,7 +378,18 @@ module falafel_core
           smallest_diff_d = header_from_lsu_q.size - size_to_allocate_q;
         end
 
-        if (header_from_lsu_q.next_addr != '0) begin
+        if ((header_from_lsu_q.size >= size_to_allocate_q) &&
+            (((header_from_lsu_q.size - size_to_allocate_q) == '0) ||
+             (BEST_FIT_STOP_UNSPLITTABLE &&
+              ((header_from_lsu_q.size - size_to_allocate_q) < MIN_ALLOC_SIZE)))) begin
+          // nothing further down the list can fit better
+          set_headers_after_fit(
+              .fit_header_i(best_fit_header_d), .fit_header_prev_i(best_fit_header_prev_d),
+              .size_to_allocate_i(size_to_allocate_q),
+              .alloc_target_header_o(alloc_target_header_d),
+              .header_to_create_o(header_to_create_d),
+              .header_to_adjust_link_o(header_to_adjust_link_d), .next_state_o(state_d));
+        end else if (header_from_lsu_q.next_addr != '0) begin
           prev_header_d = header_from_lsu_q;
           curr_header_d.addr = header_from_lsu_q.next_addr;
           state_d = REQ_LOAD_HEADER;
@@ -294,6 +412,66 @@ module falafel_core
           end
         end
       end
+      ALLOC_SEARCH_POS_NEXT_FIT: begin
+        core_ready_o = 1;
+        if (header_from_lsu_q.size < size_to_allocate_q) begin
+          if ((header_from_lsu_q.next_addr == '0) && !next_fit_wrapped_q) begin
+            // the part of the list before the rover is left
+            next_fit_wrapped_d = 1;
+            prev_header_d = '0;
+            state_d = REQ_LOAD_HEADER;
+            load_type_d = FIRST_HEADER_ADDR;
+          end else begin
+            prev_header_d = header_from_lsu_q;
+            curr_header_d.addr = header_from_lsu_q.next_addr;
+            state_d = REQ_LOAD_HEADER;
+            load_type_d = SEARCH;
+          end
+        end else begin
+          first_fit_header_d = header_from_lsu_q;
+          set_headers_after_fit(
+              .fit_header_i(header_from_lsu_q), .fit_header_prev_i(prev_header_q),
+              .size_to_allocate_i(size_to_allocate_q),
+              .alloc_target_header_o(alloc_target_header_d),
+              .header_to_create_o(header_to_create_d),
+              .header_to_adjust_link_o(header_to_adjust_link_d), .next_state_o(state_d));
+          // the next search starts at what takes the place of this block
+          rover_prev_addr_d = prev_header_q.addr;
+          if (header_from_lsu_q.size - size_to_allocate_q >= MIN_ALLOC_SIZE) begin
+            rover_addr_d  = header_from_lsu_q.addr + BLOCK_HEADER_SIZE + size_to_allocate_q;
+            rover_valid_d = 1;
+          end else begin
+            rover_addr_d  = header_from_lsu_q.next_addr;
+            rover_valid_d = (header_from_lsu_q.next_addr != '0);
+          end
+        end
+      end
+      ALLOC_SEARCH_POS_SEGREGATED_FIT: begin
+        core_ready_o = 1;
+        if (header_from_lsu_q.size < size_to_allocate_q) begin
+          if ((header_from_lsu_q.next_addr == '0) &&
+              (size_class_q != size_class_t'(NUM_SIZE_CLASSES - 1))) begin
+            // nothing in this class fits, go on with the next one
+            size_class_d = size_class_q + 1;
+            prev_header_d = '0;
+            state_d = REQ_LOAD_HEADER;
+            load_type_d = FIRST_HEADER_ADDR;
+          end else begin
+            prev_header_d = header_from_lsu_q;
+            curr_header_d.addr = header_from_lsu_q.next_addr;
+            state_d = REQ_LOAD_HEADER;
+            load_type_d = SEARCH;
+          end
+        end else begin
+          first_fit_header_d = header_from_lsu_q;
+          set_headers_after_fit(
+              .fit_header_i(header_from_lsu_q), .fit_header_prev_i(prev_header_q),
+              .size_to_allocate_i(size_to_allocate_q),
+              .alloc_target_header_o(alloc_target_header_d),
+              .header_to_create_o(header_to_create_d),
+              .header_to_adjust_link_o(header_to_adjust_link_d), .next_state_o(state_d));
+        end
+      end
       REQ_ADJUST_ALLOCATED_HEADER: begin
         if (lsu_ready_i) begin
           send_req_to_lsu(.header_i(alloc_target_header_q),
@@ -327,7 +505,7 @@ module falafel_core
       end
       REQ_ADJUST_LINK: begin
         if (header_to_adjust_link_q.addr == '0) begin : adjusting_first_header_ptr
-          adjusted_first_header_ptr.addr = falafel_config_i.free_list_ptr;
+          adjusted_first_header_ptr.addr = list_head_ptr;
           adjusted_first_header_ptr.size = header_to_adjust_link_q.next_addr;  // irregular header for first header ptr area
           if (lsu_ready_i) begin
             send_req_to_lsu(.header_i(adjusted_first_header_ptr),
@@ -346,16 +524,14 @@ module falafel_core
 
       end
       FREE_SEARCH_POS: begin
-        // if ((addr_to_free_q > header_from_lsu_q.addr) &&
-        // ((addr_to_free_q < header_from_lsu_q.next_addr) |
-        // (header_from_lsu_q.next_addr == '0))) begin
         if (addr_to_free_q < header_from_lsu_q.addr) begin  // first header
           curr_header_d = first_header_ptr_q;
           state_d = REQ_LOAD_HEADER;
           load_type_d = FREE_TARGET_HEADER;
         end
         else if ((addr_to_free_q > header_from_lsu_q.addr) &&
-        (addr_to_free_q < header_from_lsu_q.next_addr)) begin
+        ((addr_to_free_q < header_from_lsu_q.next_addr) ||
+        (header_from_lsu_q.next_addr == '0))) begin  // last header
           curr_header_d = header_from_lsu_q;
           state_d = REQ_LOAD_HEADER;
           load_type_d = FREE_TARGET_HEADER;
@@ -365,6 +541,11 @@ module falafel_core
           state_d = REQ_LOAD_HEADER;
           load_type_d = SEARCH;
         end
+        if ((config_alloc_strategy_i == SEGREGATED_FIT) && (load_type_d == FREE_TARGET_HEADER)) begin
+          // the target header was loaded first to pick the class
+          header_from_lsu_d = free_target_header_q;
+          state_d = FREE_CHECK_NEIGHBORS;
+        end
       end
       FREE_CHECK_NEIGHBORS: begin
         free_target_header_d = header_from_lsu_q;
@@ -373,6 +554,11 @@ module falafel_core
         does_merge_left = (curr_header_q.addr + BLOCK_HEADER_SIZE + curr_header_q.size
           == (addr_to_free_q - BLOCK_HEADER_SIZE));
         does_merge_both_sides = does_merge_right && does_merge_left;
+        // the block goes in after the header before the rover, or swallows it
+        if ((curr_header_q.addr == rover_prev_addr_q) ||
+            (does_merge_right && (curr_header_q.next_addr == rover_prev_addr_q))) begin
+          rover_valid_d = 0;
+        end
 
         if (does_merge_both_sides) begin
           core_op_d = CORE_MERGE_BOTH_SIDES;
@@ -389,8 +575,8 @@ module falafel_core
           state_d   = FREE_MERGE_NEIGHBOR;
         end else if (!does_merge_left && !does_merge_right) begin
           header_to_create_d.addr = addr_to_free_q - BLOCK_HEADER_SIZE;
-          header_to_create_d.next_addr = header_from_lsu_q.next_addr;
-          header_to_adjust_link_d.addr = header_from_lsu_q.addr;
+          header_to_create_d.next_addr = curr_header_q.next_addr;
+          header_to_adjust_link_d = curr_header_q;
           header_to_adjust_link_d.next_addr = header_to_create_d.addr;
           state_d = REQ_CREATE_NEW_HEADER;
         end
@@ -438,8 +624,16 @@ module falafel_core
         if (rsp_from_lsu_i.val) begin
           unique case (core_op_q)
             CORE_ACQUIRE_LOCK: begin
-              state_d = REQ_LOAD_HEADER;
-              load_type_d = FIRST_HEADER_ADDR;
+              lock_held_d = (MAX_BATCH_OPS > 1);
+              batch_ops_d = 1;
+              lock_hold_cycles_d = '0;
+              start_op_under_lock(.is_alloc_i(is_alloc_q), .alloc_strategy_i(config_alloc_strategy_i),
+                                  .rover_valid_i(rover_valid_q), .rover_addr_i(rover_addr_q),
+                                  .rover_prev_addr_i(rover_prev_addr_q), .next_state_o(state_d),
+                                  .load_type_o(load_type_d), .prev_addr_o(prev_header_d.addr),
+                                  .curr_addr_o(curr_header_d.addr),
+                                  .next_fit_wrapped_o(next_fit_wrapped_d),
+                                  .rover_valid_o(rover_valid_d));
             end
             CORE_LOAD_FIRST_HEADER_ADDR: begin
               curr_header_d.addr = rsp_from_lsu_i.header.size;  // irregular header for first header ptr area
@@ -447,6 +641,18 @@ module falafel_core
               // first_header_ptr_d.addr = falafel_config_i.free_list_ptr;
               state_d = REQ_LOAD_HEADER;
               load_type_d = SEARCH;
+              if ((config_alloc_strategy_i == SEGREGATED_FIT) &&
+                  (rsp_from_lsu_i.header.size == '0)) begin  // the class is empty
+                if (!is_alloc_q) begin
+                  // the block becomes the only header of its class
+                  curr_header_d = '0;
+                  header_from_lsu_d = free_target_header_q;
+                  state_d = FREE_CHECK_NEIGHBORS;
+                end else if (size_class_q != size_class_t'(NUM_SIZE_CLASSES - 1)) begin
+                  size_class_d = size_class_q + 1;
+                  load_type_d  = FIRST_HEADER_ADDR;
+                end
+              end
             end
             CORE_LOAD_HEADER: begin
               header_from_lsu_d = rsp_from_lsu_i.header;
@@ -455,6 +661,10 @@ module falafel_core
                   state_d = ALLOC_SEARCH_POS_FIRST_FIT;
                 end else if (config_alloc_strategy_i == BEST_FIT) begin
                   state_d = ALLOC_SEARCH_POS_BEST_FIT;
+                end else if (config_alloc_strategy_i == NEXT_FIT) begin
+                  state_d = ALLOC_SEARCH_POS_NEXT_FIT;
+                end else if (config_alloc_strategy_i == SEGREGATED_FIT) begin
+                  state_d = ALLOC_SEARCH_POS_SEGREGATED_FIT;
                 end
               end else begin
                 state_d = FREE_SEARCH_POS;
@@ -464,6 +674,12 @@ module falafel_core
               header_from_lsu_d = rsp_from_lsu_i.header;
               state_d = FREE_CHECK_NEIGHBORS;
             end
+            CORE_LOAD_FREE_TARGET_SIZE: begin
+              free_target_header_d = rsp_from_lsu_i.header;
+              size_class_d = size_class_of(rsp_from_lsu_i.header.size, falafel_config_i);
+              state_d = REQ_LOAD_HEADER;
+              load_type_d = FIRST_HEADER_ADDR;
+            end
             CORE_LOAD_RIGHT_HEADER_FOR_MERGE_BOTH_SIDES: begin
               header_from_lsu_d = rsp_from_lsu_i.header;
               state_d = FREE_MERGE_NEIGHBOR;
@@ -475,12 +691,16 @@ module falafel_core
               core_op_d = CORE_MERGE_RIGHT;
             end
             CORE_MERGE_RIGHT: state_d = REQ_ADJUST_LINK;
-            CORE_MERGE_LEFT: state_d = REQ_RELEASE_LOCK;
-            CORE_MERGE_BOTH_SIDES: state_d = REQ_RELEASE_LOCK;
-            CORE_ADJUST_LINK: state_d = REQ_RELEASE_LOCK;
+            // in a batch the result goes out first and the lock stays held
+            CORE_MERGE_LEFT: state_d = lock_held_q ? RETURN_RESULT : REQ_RELEASE_LOCK;
+            CORE_MERGE_BOTH_SIDES: state_d = lock_held_q ? RETURN_RESULT : REQ_RELEASE_LOCK;
+            CORE_ADJUST_LINK: state_d = lock_held_q ? RETURN_RESULT : REQ_RELEASE_LOCK;
             CORE_ADJUST_ALLOCATED_HEADER: state_d = REQ_CREATE_NEW_HEADER;
             CORE_CREATE_NEW_HEADER: state_d = REQ_ADJUST_LINK;
-            CORE_RELEASE: state_d = RETURN_RESULT;
+            CORE_RELEASE: begin
+              state_d = lock_held_q ? IDLE : RETURN_RESULT;
+              lock_held_d = 0;
+            end
           endcase
         end
       end
@@ -488,10 +708,10 @@ module falafel_core
         rsp_result_val_o = 1;
         if (is_alloc_q) begin
           rsp_result_is_write_o = 1;
-          if (config_alloc_strategy_i == FIRST_FIT) begin
-            rsp_result_data_o = first_fit_header_q.addr + BLOCK_HEADER_SIZE;
-          end else begin
+          if (config_alloc_strategy_i == BEST_FIT) begin
             rsp_result_data_o = best_fit_header_q.addr + BLOCK_HEADER_SIZE;
+          end else begin
+            rsp_result_data_o = first_fit_header_q.addr + BLOCK_HEADER_SIZE;
           end
         end else begin
           rsp_result_is_write_o = 0;
@@ -523,6 +743,14 @@ module falafel_core
       best_fit_header_q <= '0;
       best_fit_header_prev_q <= '0;
       smallest_diff_q <= '0;
+      rover_valid_q <= 0;
+      rover_addr_q <= '0;
+      rover_prev_addr_q <= '0;
+      next_fit_wrapped_q <= 0;
+      size_class_q <= '0;
+      lock_held_q <= 0;
+      batch_ops_q <= '0;
+      lock_hold_cycles_q <= '0;
 
       first_header_ptr_q <= '0;
       alloc_target_header_q <= '0;
@@ -547,6 +775,14 @@ module falafel_core
       best_fit_header_q <= best_fit_header_d;
       best_fit_header_prev_q <= best_fit_header_prev_d;
       smallest_diff_q <= smallest_diff_d;
+      rover_valid_q <= rover_valid_d;
+      rover_addr_q <= rover_addr_d;
+      rover_prev_addr_q <= rover_prev_addr_d;
+      next_fit_wrapped_q <= next_fit_wrapped_d;
+      size_class_q <= size_class_d;
+      lock_held_q <= lock_held_d;
+      batch_ops_q <= batch_ops_d;
+      lock_hold_cycles_q <= lock_hold_cycles_d;
 
       first_header_ptr_q <= first_header_ptr_d;
       alloc_target_header_q <= alloc_target_header_d;
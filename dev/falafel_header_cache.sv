@@ -0,0 +1,188 @@
+`include "falafel_pkg.sv"
+
+module falafel_header_cache
+  import falafel_pkg::*;
+#(
+    parameter unsigned NUM_ENTRIES = 4,
+    // keep the entries when the lock is acquired; only for heaps whose
+    // lists no one but this falafel changes
+    parameter bit KEEP_ON_LOCK = 1'b0,
+    localparam unsigned INDEX_W = NUM_ENTRIES > 1 ? $clog2(NUM_ENTRIES) : 1
+) (
+    input logic clk_i,
+    input logic rst_ni,
+
+    // same handshake as falafel_lsu on both sides
+    input header_req_t core_req_header_i,
+    output header_rsp_t core_rsp_header_o,
+    input logic core_rdy_i,
+    output logic cache_ready_o,
+
+    output header_req_t lsu_req_header_o,
+    input header_rsp_t lsu_rsp_header_i,
+    output logic lsu_core_rdy_o,
+    input logic lsu_ready_i,
+
+    output logic hit_o,  // a LOAD is served from the cache this cycle
+    output logic [DATA_W-1:0] hits_o,
+    output logic [DATA_W-1:0] misses_o
+);
+
+  // Headers (size and next_addr at addr) the core loaded or stored since
+  // it last acquired the lock. Stores are written through to the LSU and
+  // update the entry of their header; every entry is dropped once the lock
+  // is taken, as software may change the lists while falafel does not hold
+  // it (unless KEEP_ON_LOCK). The list head pointers are cached like any
+  // other header.
+
+  typedef enum integer {
+    IDLE,
+    SEND_HIT_RSP,
+    WAIT_RSP_FROM_LSU
+  } cache_state_e;
+
+  cache_state_e state_d, state_q;
+  header_t entries_d[NUM_ENTRIES], entries_q[NUM_ENTRIES];
+  logic [NUM_ENTRIES-1:0] valid_d, valid_q;
+  logic [INDEX_W-1:0] victim_d, victim_q;  // round robin replacement
+  header_req_t req_header_d, req_header_q;
+  header_rsp_t rsp_header_d, rsp_header_q;
+  logic [DATA_W-1:0] hits_d, hits_q;
+  logic [DATA_W-1:0] misses_d, misses_q;
+
+  logic lookup_hit;
+  logic [INDEX_W-1:0] lookup_index;
+
+  function automatic logic find_entry(input logic [DATA_W-1:0] addr_i,
+                                      input header_t entries_i[NUM_ENTRIES],
+                                      input logic [NUM_ENTRIES-1:0] valid_i,
+                                      output logic [INDEX_W-1:0] index_o);
+    find_entry = 0;
+    index_o = '0;
+    for (int i = 0; i < NUM_ENTRIES; i++) begin
+      if (valid_i[i] && entries_i[i].addr == addr_i) begin
+        find_entry = 1;
+        index_o = INDEX_W'(i);
+      end
+    end
+  endfunction
+
+  always_comb begin
+    lookup_hit = find_entry(core_req_header_i.header.addr, entries_q, valid_q, lookup_index) &&
+        (core_req_header_i.lsu_op == LOAD);
+  end
+
+  // the header written by the store the LSU has just completed
+  task automatic write_through(input header_req_t req_i, inout header_t entries[NUM_ENTRIES],
+                               inout logic [NUM_ENTRIES-1:0] valid, inout logic [INDEX_W-1:0] victim);
+    logic hit;
+    logic [INDEX_W-1:0] index;
+    logic [DATA_W-1:0] store_begin;
+    store_begin = (req_i.lsu_op == EDIT_NEXT_ADDR) ?
+        req_i.header.addr + BLOCK_NEXT_ADDR_OFFSET : req_i.header.addr;
+    // drop the other headers the stored bytes overlap
+    for (int i = 0; i < NUM_ENTRIES; i++) begin
+      if ((entries[i].addr != req_i.header.addr) &&
+          (entries[i].addr < req_i.header.addr + BLOCK_HEADER_SIZE) &&
+          (entries[i].addr + BLOCK_HEADER_SIZE > store_begin))
+        valid[i] = 0;
+    end
+    hit = find_entry(req_i.header.addr, entries, valid, index);
+    if (req_i.lsu_op == EDIT_SIZE_AND_NEXT_ADDR) begin
+      if (!hit) begin
+        index = victim;
+        victim = (victim == INDEX_W'(NUM_ENTRIES - 1)) ? '0 : victim + 1;
+      end
+      entries[index] = req_i.header;
+      valid[index] = 1;
+    end else if (hit) begin  // EDIT_NEXT_ADDR
+      entries[index].next_addr = req_i.header.next_addr;
+    end
+  endtask
+
+  always_comb begin : cache_fsm
+    state_d = state_q;
+    entries_d = entries_q;
+    valid_d = valid_q;
+    victim_d = victim_q;
+    req_header_d = req_header_q;
+    rsp_header_d = rsp_header_q;
+    hits_d = hits_q;
+    misses_d = misses_q;
+
+    cache_ready_o = 0;
+    core_rsp_header_o = '0;
+    lsu_req_header_o = '0;
+    lsu_core_rdy_o = core_rdy_i;
+    hit_o = 0;
+
+    unique case (state_q)
+      IDLE: begin
+        cache_ready_o = lookup_hit ? 1 : lsu_ready_i;
+        if (core_req_header_i.val && lookup_hit) begin
+          hit_o = 1;
+          hits_d = hits_q + 1;
+          rsp_header_d.header = entries_q[lookup_index];
+          rsp_header_d.val = 1;
+          state_d = SEND_HIT_RSP;
+        end else if (core_req_header_i.val) begin
+          lsu_req_header_o = core_req_header_i;
+          if (lsu_ready_i) begin
+            req_header_d = core_req_header_i;
+            if (core_req_header_i.lsu_op == LOAD) misses_d = misses_q + 1;
+            state_d = WAIT_RSP_FROM_LSU;
+          end
+        end
+      end
+      SEND_HIT_RSP: begin
+        core_rsp_header_o = rsp_header_q;
+        if (core_rdy_i) begin
+          state_d = IDLE;
+        end
+      end
+      WAIT_RSP_FROM_LSU: begin
+        core_rsp_header_o = lsu_rsp_header_i;
+        if (lsu_rsp_header_i.val && core_rdy_i) begin
+          state_d = IDLE;
+          unique case (req_header_q.lsu_op)
+            LOCK: if (!KEEP_ON_LOCK) valid_d = '0;
+            LOAD: begin
+              entries_d[victim_q] = lsu_rsp_header_i.header;
+              valid_d[victim_q] = 1;
+              victim_d = (victim_q == INDEX_W'(NUM_ENTRIES - 1)) ? '0 : victim_q + 1;
+            end
+            EDIT_SIZE_AND_NEXT_ADDR, EDIT_NEXT_ADDR:
+            write_through(.req_i(req_header_q), .entries(entries_d), .valid(valid_d),
+                          .victim(victim_d));
+            default: ;
+          endcase
+        end
+      end
+      default: ;
+    endcase
+  end
+
+  always_ff @(posedge clk_i) begin
+    if (!rst_ni) begin
+      state_q <= IDLE;
+      valid_q <= '0;
+      victim_q <= '0;
+      req_header_q <= '0;
+      rsp_header_q <= '0;
+      hits_q <= '0;
+      misses_q <= '0;
+    end else begin
+      state_q <= state_d;
+      valid_q <= valid_d;
+      victim_q <= victim_d;
+      req_header_q <= req_header_d;
+      rsp_header_q <= rsp_header_d;
+      hits_q <= hits_d;
+      misses_q <= misses_d;
+    end
+    entries_q <= entries_d;
+  end
+
+  assign hits_o = hits_q;
+  assign misses_o = misses_q;
+endmodule
@@ -28,11 +28,22 @@ module falafel_input_arbiter
     output logic              free_fifo_write_o,
     output logic [DATA_W-1:0] free_fifo_din_o,
 
+    // a FIFO is full while a queue has a request for it
+    output logic alloc_fifo_stall_o,
+    output logic free_fifo_stall_o,
+
     //------------- config regs --------------//
-    output config_regs_t config_o
+    output config_regs_t config_o,
+
+    //------------ perf counters -------------//
+    input  perf_counters_t              perf_counters_i,
+    output logic                        perf_read_val_o,
+    input  logic                        perf_read_rdy_i,
+    output logic           [DATA_W-1:0] perf_read_data_o
 );
 
   logic                      config_reg_write;
+  logic                      config_reg_rdy;
   logic         [DATA_W-1:0] config_reg_data;
   logic         [DATA_W-1:0] config_reg_addr;
 
@@ -62,6 +73,7 @@ module falafel_input_arbiter
               .free_req_rdy_i    (queue_free_fifo_rdy[i]),
               .free_req_data_o   (queue_free_fifo_entry[i]),
               .config_reg_write_o(config_reg_write),
+              .config_reg_rdy_i  (config_reg_rdy),
               .config_reg_data_o (config_reg_data),
               .config_reg_addr_o (config_reg_addr)
           );
@@ -80,6 +92,7 @@ module falafel_input_arbiter
               .free_req_rdy_i    (queue_free_fifo_rdy[i]),
               .free_req_data_o   (queue_free_fifo_entry[i]),
               .config_reg_write_o(  /* unused */),
+              .config_reg_rdy_i  (1'b1),
               .config_reg_data_o (  /* unused */),
               .config_reg_addr_o (  /* unused */)
           );
@@ -128,6 +141,20 @@ module falafel_input_arbiter
   endgenerate
 
 
+  always_comb begin
+    alloc_fifo_stall_o = 1'b0;
+    for (int i = 0; i < NUM_HEADER_QUEUES + NUM_ALLOC_QUEUES; i++) begin
+      if (queue_alloc_fifo_val[i]) alloc_fifo_stall_o = alloc_fifo_full_i;
+    end
+  end
+
+  always_comb begin
+    free_fifo_stall_o = 1'b0;
+    for (int i = 0; i < NUM_HEADER_QUEUES + NUM_FREE_QUEUES; i++) begin
+      if (queue_free_fifo_val[i]) free_fifo_stall_o = free_fifo_full_i;
+    end
+  end
+
   always_comb begin
     alloc_fifo_write_o = 1'b0;
     alloc_fifo_din_size_o = '0;
@@ -173,9 +200,14 @@ module falafel_input_arbiter
   falafel_config_regs i_falafel_config_registers (
       .clk_i,
       .rst_ni,
-      .write_i (config_reg_write),
-      .addr_i  (config_reg_addr),
-      .data_i  (config_reg_data),
-      .config_o(config_o)
+      .write_i        (config_reg_write),
+      .addr_i         (config_reg_addr),
+      .data_i         (config_reg_data),
+      .ready_o        (config_reg_rdy),
+      .perf_counters_i(perf_counters_i),
+      .read_val_o     (perf_read_val_o),
+      .read_rdy_i     (perf_read_rdy_i),
+      .read_data_o    (perf_read_data_o),
+      .config_o       (config_o)
   );
 endmodule
@@ -20,6 +20,7 @@ module falafel_input_parser
     output alloc_entry_t free_req_data_o,
 
     output logic              config_reg_write_o,
+    input  logic              config_reg_rdy_i,
     output logic [DATA_W-1:0] config_reg_data_o,
     output logic [DATA_W-1:0] config_reg_addr_o
 );
@@ -116,7 +117,7 @@ module falafel_input_parser
       end
 
       STATE_WRITE_CONFIG_REG: begin
-        req_rdy_o = 1'b1;
+        req_rdy_o = config_reg_rdy_i;
 
         if (req_val_i && req_rdy_o) begin
           input_state_d = STATE_READ_HEADER;
@@ -2,7 +2,12 @@
 
 module falafel_lsu
   import falafel_pkg::*;
-(
+#(
+    // load and store a whole header_net_t (size and next_addr) in one
+    // 2*DATA_W wide memory transaction instead of two DATA_W ones
+    parameter bit HEADER_BURST = 1'b0,
+    localparam unsigned MEM_DATA_W = HEADER_BURST ? 2 * DATA_W : DATA_W
+) (
     input logic clk_i,
     input logic rst_ni,
 
@@ -16,15 +21,18 @@ module falafel_lsu
     (* mark_debug = "true" *) input logic mem_req_rdy_i,  // mem ready
     (* mark_debug = "true" *) output logic mem_req_is_write_o,  // 1 for write, 0 for read
     (* mark_debug = "true" *) output logic mem_req_is_cas_o,  // 1 for cas, 0 for write
+    (* mark_debug = "true" *) output logic mem_req_is_burst_o,  // 1 for a whole header at addr
     (* mark_debug = "true" *) output logic [DATA_W-1:0] mem_req_addr_o,  // address
-    (* mark_debug = "true" *) output logic [DATA_W-1:0] mem_req_data_o,  // write data
+    (* mark_debug = "true" *) output logic [MEM_DATA_W-1:0] mem_req_data_o,  // write data
     output logic [DATA_W-1:0] mem_req_cas_exp_o,  // compare & swap expected value
 
     //----------- memory response ------------//
     (* mark_debug = "true" *) input logic mem_rsp_val_i,  // resp valid
     (* mark_debug = "true" *) output logic mem_rsp_rdy_o,  // falafel ready
     (* mark_debug = "true" *)
-    input logic [DATA_W-1:0] mem_rsp_data_i  // resp data // different from original falafel
+    input logic [MEM_DATA_W-1:0] mem_rsp_data_i,  // resp data // different from original falafel
+
+    output logic cas_retry_o  // the lock CAS failed and is tried again
 );
 
   typedef enum integer {
@@ -34,8 +42,10 @@ module falafel_lsu
     UNLOCK_KEY,
     LOAD_SIZE,
     LOAD_NEXT_ADDR,
+    LOAD_HEADER,
     STORE_UPDATED_SIZE,
     STORE_UPDATED_NEXT_ADDR,
+    STORE_UPDATED_HEADER,
     WAIT_RSP_FROM_MEM,
     SEND_RSP_TO_CORE
   } lsu_state_e;
@@ -47,7 +57,9 @@ module falafel_lsu
     LSU_LOAD_SIZE,
     LSU_LOAD_NEXT_ADDR,
     LSU_STORE_SIZE,
-    LSU_STORE_NEXT_ADDR
+    LSU_STORE_NEXT_ADDR,
+    LSU_LOAD_HEADER,
+    LSU_STORE_HEADER
   } lsu_op_t;
 
   (* mark_debug = "true" *) lsu_state_e state_q, state_d;
@@ -69,10 +81,10 @@ module falafel_lsu
   task automatic send_mem_store_req(
       input logic [DATA_W-1:0] addr_to_send_i, input logic [DATA_W-1:0] data_to_send_i,
       output logic mem_req_val_o, output logic [DATA_W-1:0] mem_req_addr_o,
-      output logic [DATA_W-1:0] mem_req_data_o, output logic mem_req_is_write_o);
+      output logic [MEM_DATA_W-1:0] mem_req_data_o, output logic mem_req_is_write_o);
     mem_req_val_o = 1;
     mem_req_addr_o = addr_to_send_i;
-    mem_req_data_o = data_to_send_i;
+    mem_req_data_o = MEM_DATA_W'(data_to_send_i);
     mem_req_is_write_o = 1;
   endtask
 
@@ -83,8 +95,10 @@ module falafel_lsu
     lsu_op_d = lsu_op_q;
     lsu_ready_o = 0;
     mem_req_is_cas_o = 0;
+    mem_req_is_burst_o = 0;
     mem_req_val_o = 0;
     core_rsp_header_o = '0;
+    cas_retry_o = 0;
     load_addr_d = load_addr_q;
     mem_rsp_rdy_o = 0;
     mem_req_is_write_o = 0;
@@ -108,12 +122,22 @@ module falafel_lsu
               lsu_op_d = LSU_UNLOCK;
             end
             LOAD: begin
-              state_d  = LOAD_SIZE;
-              lsu_op_d = LSU_LOAD_SIZE;
+              if (HEADER_BURST) begin
+                state_d  = LOAD_HEADER;
+                lsu_op_d = LSU_LOAD_HEADER;
+              end else begin
+                state_d  = LOAD_SIZE;
+                lsu_op_d = LSU_LOAD_SIZE;
+              end
             end
             EDIT_SIZE_AND_NEXT_ADDR: begin
-              state_d  = STORE_UPDATED_SIZE;
-              lsu_op_d = LSU_STORE_SIZE;
+              if (HEADER_BURST) begin
+                state_d  = STORE_UPDATED_HEADER;
+                lsu_op_d = LSU_STORE_HEADER;
+              end else begin
+                state_d  = STORE_UPDATED_SIZE;
+                lsu_op_d = LSU_STORE_SIZE;
+              end
             end
             EDIT_NEXT_ADDR: begin
               state_d  = STORE_UPDATED_NEXT_ADDR;
@@ -134,7 +158,7 @@ module falafel_lsu
       LOCK_DO_CAS: begin
         mem_req_is_cas_o = 1'b1;
         mem_req_addr_o = req_header_q.header.addr;
-        mem_req_data_o = req_header_q.header.size;  // TODO lock id
+        mem_req_data_o = MEM_DATA_W'(req_header_q.header.size);  // TODO lock id
         mem_req_val_o = 1;
         if (mem_req_rdy_i) begin
           state_d = WAIT_RSP_FROM_MEM;
@@ -155,6 +179,26 @@ module falafel_lsu
           state_d = WAIT_RSP_FROM_MEM;
         end
       end
+      LOAD_HEADER: begin
+        send_mem_load_req(.addr_to_send_i(req_header_q.header.addr), .mem_req_val_o(mem_req_val_o),
+                          .mem_req_addr_o(mem_req_addr_o), .mem_req_is_write_o(mem_req_is_write_o));
+        mem_req_is_burst_o = 1;
+        if (mem_req_rdy_i) begin
+          state_d = WAIT_RSP_FROM_MEM;
+        end
+      end
+      STORE_UPDATED_HEADER: begin
+        send_mem_store_req(.addr_to_send_i(req_header_q.header.addr),
+                           .data_to_send_i(req_header_q.header.size), .mem_req_val_o(mem_req_val_o),
+                           .mem_req_addr_o(mem_req_addr_o), .mem_req_data_o(mem_req_data_o),
+                           .mem_req_is_write_o(mem_req_is_write_o));
+        // size at addr in the low word, next_addr at addr + BLOCK_NEXT_ADDR_OFFSET above it
+        mem_req_data_o = MEM_DATA_W'({req_header_q.header.next_addr, req_header_q.header.size});
+        mem_req_is_burst_o = 1;
+        if (mem_req_rdy_i) begin
+          state_d = WAIT_RSP_FROM_MEM;
+        end
+      end
       STORE_UPDATED_SIZE: begin
         send_mem_store_req(.addr_to_send_i(req_header_q.header.addr),
                            .data_to_send_i(req_header_q.header.size), .mem_req_val_o(mem_req_val_o),
@@ -200,15 +244,13 @@ module falafel_lsu
               end
             end
             LSU_DO_CAS: begin
-              if (mem_rsp_data_i == 0) begin
+              if (mem_rsp_data_i == EMPTY_KEY) begin
                 state_d = SEND_RSP_TO_CORE;
-              end else begin
+              end else begin  // someone else took the lock since LOAD_KEY
+                cas_retry_o = 1;
                 state_d  = LOAD_KEY;
                 lsu_op_d = LSU_LOAD_KEY;
               end
-              begin
-                state_d = SEND_RSP_TO_CORE;
-              end
             end
             LSU_LOAD_SIZE: begin
               rsp_header_d.header.size = mem_rsp_data_i;
@@ -219,6 +261,12 @@ module falafel_lsu
               rsp_header_d.header.next_addr = mem_rsp_data_i;
               state_d = SEND_RSP_TO_CORE;
             end
+            LSU_LOAD_HEADER: begin
+              rsp_header_d.header.size = DATA_W'(mem_rsp_data_i);
+              rsp_header_d.header.next_addr = DATA_W'(mem_rsp_data_i >> DATA_W);
+              state_d = SEND_RSP_TO_CORE;
+            end
+            LSU_STORE_HEADER: state_d = SEND_RSP_TO_CORE;
             LSU_STORE_SIZE: begin
               state_d  = STORE_UPDATED_NEXT_ADDR;
               lsu_op_d = LSU_STORE_NEXT_ADDR;
@@ -0,0 +1,102 @@
+`timescale 1ns / 1ps
+`include "falafel_pkg.sv"
+
+module falafel_perf_counters
+  import falafel_pkg::*;
+(
+    input logic clk_i,
+    input logic rst_ni,
+
+    // requests and results of falafel
+    input logic req_val_i,
+    input logic req_rdy_i,
+    input logic is_alloc_i,
+    input logic result_val_i,
+    input logic result_rdy_i,
+    input perf_events_t events_i,
+
+    input logic mem_req_val_i,
+    input logic mem_req_rdy_i,
+
+    // a FIFO is full while a request waits to go in
+    input logic alloc_fifo_stall_i,
+    input logic free_fifo_stall_i,
+    input logic resp_fifo_stall_i,
+
+    input logic [DATA_W-1:0] header_cache_hits_i,
+    input logic [DATA_W-1:0] header_cache_misses_i,
+
+    output perf_counters_t counters_o
+);
+
+  // Free running since reset, indexed by PERF_* (see falafel_pkg). The
+  // cycles of an op run from the cycle falafel takes the request to the
+  // one it hands over the result; falafel serves one op at a time.
+
+  perf_counters_t counters_d, counters_q;
+  logic busy_d, busy_q;
+  logic is_alloc_d, is_alloc_q;
+  logic [DATA_W-1:0] op_cycles_d, op_cycles_q;
+
+  function automatic logic [DATA_W-1:0] max(input logic [DATA_W-1:0] a, input logic [DATA_W-1:0] b);
+    max = (a > b) ? a : b;
+  endfunction
+
+  always_comb begin
+    logic [DATA_W-1:0] cycles;
+
+    counters_d = counters_q;
+    busy_d = busy_q;
+    is_alloc_d = is_alloc_q;
+    op_cycles_d = busy_q ? op_cycles_q + 1 : '0;
+    cycles = op_cycles_q + 1;
+
+    if (busy_q && result_val_i && result_rdy_i) begin
+      busy_d = 0;
+      if (is_alloc_q) begin
+        counters_d[PERF_ALLOCS] = counters_q[PERF_ALLOCS] + 1;
+        counters_d[PERF_ALLOC_CYCLES] = counters_q[PERF_ALLOC_CYCLES] + cycles;
+        counters_d[PERF_ALLOC_MAX_CYCLES] = max(counters_q[PERF_ALLOC_MAX_CYCLES], cycles);
+      end else begin
+        counters_d[PERF_FREES] = counters_q[PERF_FREES] + 1;
+        counters_d[PERF_FREE_CYCLES] = counters_q[PERF_FREE_CYCLES] + cycles;
+        counters_d[PERF_FREE_MAX_CYCLES] = max(counters_q[PERF_FREE_MAX_CYCLES], cycles);
+      end
+    end
+    if (req_val_i && req_rdy_i) begin
+      busy_d = 1;
+      is_alloc_d = is_alloc_i;
+      op_cycles_d = '0;
+    end
+
+    if (events_i.header_load)
+      counters_d[PERF_HEADERS_VISITED] = counters_q[PERF_HEADERS_VISITED] + 1;
+    if (events_i.cas_retry) counters_d[PERF_CAS_RETRIES] = counters_q[PERF_CAS_RETRIES] + 1;
+    if (mem_req_val_i && mem_req_rdy_i)
+      counters_d[PERF_MEM_REQS] = counters_q[PERF_MEM_REQS] + 1;
+    if (alloc_fifo_stall_i)
+      counters_d[PERF_ALLOC_FIFO_FULL_CYCLES] = counters_q[PERF_ALLOC_FIFO_FULL_CYCLES] + 1;
+    if (free_fifo_stall_i)
+      counters_d[PERF_FREE_FIFO_FULL_CYCLES] = counters_q[PERF_FREE_FIFO_FULL_CYCLES] + 1;
+    if (resp_fifo_stall_i)
+      counters_d[PERF_RESP_FIFO_FULL_CYCLES] = counters_q[PERF_RESP_FIFO_FULL_CYCLES] + 1;
+    counters_d[PERF_HEADER_CACHE_HITS] = header_cache_hits_i;
+    counters_d[PERF_HEADER_CACHE_MISSES] = header_cache_misses_i;
+  end
+
+  always_ff @(posedge clk_i) begin
+    if (!rst_ni) begin
+      counters_q <= '0;
+      busy_q <= 0;
+      is_alloc_q <= 0;
+      op_cycles_q <= '0;
+    end else begin
+      counters_q <= counters_d;
+      busy_q <= busy_d;
+      is_alloc_q <= is_alloc_d;
+      op_cycles_q <= op_cycles_d;
+    end
+  end
+
+  assign counters_o = counters_q;
+endmodule
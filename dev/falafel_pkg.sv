@@ -6,7 +6,9 @@ package falafel_pkg;
 
   typedef enum integer {
     FIRST_FIT,
-    BEST_FIT
+    BEST_FIT,
+    NEXT_FIT,
+    SEGREGATED_FIT
   } alloc_strategy_t;
 
   typedef enum integer {
@@ -19,6 +21,10 @@ package falafel_pkg;
 
   localparam unsigned DATA_W = 64;
 
+  // free lists of SEGREGATED_FIT, one per size class
+  localparam unsigned NUM_SIZE_CLASSES = 4;
+  typedef logic [$clog2(NUM_SIZE_CLASSES)-1:0] size_class_t;
+
   typedef struct packed {
     logic [DATA_W-1:0] addr;
     logic [DATA_W-1:0] size;
@@ -59,6 +65,13 @@ typedef struct packed {
   // Internal configuration registers
   typedef struct packed {
     // logic is_on;
+    // SEGREGATED_FIT only: class i takes sizes below size_class_limit[i]
+    // (ascending), the last class the rest; size_class_ptr[i] is the
+    // address of the word holding the first header of class i (the word
+    // after it is overwritten as well, as the one after free_list_ptr)
+    logic [NUM_SIZE_CLASSES-2:0][DATA_W-1:0] size_class_limit;
+    logic [NUM_SIZE_CLASSES-1:0][DATA_W-1:0] size_class_ptr;
+    alloc_strategy_t alloc_strategy;  // only used by falafel_wrapper
     logic [DATA_W-1:0] free_list_ptr;
     logic [DATA_W-1:0] lock_ptr;
     logic [DATA_W-1:0] lock_id;
@@ -78,6 +91,38 @@ typedef struct packed {
   localparam FREE_LIST_PTR_ADDR = 'h10;
   localparam LOCK_PTR_ADDR = 'h18;
   localparam LOCK_ID_ADDR = 'h20;
+  localparam ALLOC_STRATEGY_ADDR = 'h28;
+  // one register per size class, 8 bytes apart
+  localparam SIZE_CLASS_PTR_ADDR = 'h30;
+  localparam SIZE_CLASS_LIMIT_ADDR = 'h50;
+
+  // Performance counters, read only: a REQ_ACCESS_REGISTER to
+  // PERF_COUNTER_ADDR + 8 * PERF_* answers with the counter on the response
+  // path instead of writing it
+  localparam PERF_COUNTER_ADDR = 'h100;
+  localparam unsigned PERF_ALLOCS = 0;  // ops completed
+  localparam unsigned PERF_FREES = 1;
+  localparam unsigned PERF_ALLOC_CYCLES = 2;  // request accepted to result, summed
+  localparam unsigned PERF_ALLOC_MAX_CYCLES = 3;
+  localparam unsigned PERF_FREE_CYCLES = 4;
+  localparam unsigned PERF_FREE_MAX_CYCLES = 5;
+  localparam unsigned PERF_HEADERS_VISITED = 6;  // header loads but the list head pointers
+  localparam unsigned PERF_CAS_RETRIES = 7;  // lock CAS that found the lock taken
+  localparam unsigned PERF_MEM_REQS = 8;
+  localparam unsigned PERF_ALLOC_FIFO_FULL_CYCLES = 9;  // full with a request waiting
+  localparam unsigned PERF_FREE_FIFO_FULL_CYCLES = 10;
+  localparam unsigned PERF_RESP_FIFO_FULL_CYCLES = 11;
+  localparam unsigned PERF_HEADER_CACHE_HITS = 12;
+  localparam unsigned PERF_HEADER_CACHE_MISSES = 13;
+  localparam unsigned NUM_PERF_COUNTERS = 14;
+
+  typedef logic [NUM_PERF_COUNTERS-1:0][DATA_W-1:0] perf_counters_t;
+
+  // single cycle events inside falafel, see falafel_perf_counters
+  typedef struct packed {
+    logic header_load;
+    logic cas_retry;
+  } perf_events_t;
 
   // Opcodes
   localparam REQ_ACCESS_REGISTER = OPCODE_SIZE'(0);
@@ -7,7 +7,17 @@ module falafel_wrapper
     parameter unsigned NUM_HEADER_QUEUES = 1,
     parameter unsigned NUM_ALLOC_QUEUES = 1,
     parameter unsigned NUM_FREE_QUEUES = 1,
-    localparam unsigned NUM_QUEUES = NUM_HEADER_QUEUES + NUM_ALLOC_QUEUES + NUM_FREE_QUEUES
+    parameter bit BEST_FIT_STOP_UNSPLITTABLE = 1'b0,
+    parameter unsigned MAX_BATCH_OPS = 1,
+    parameter unsigned MAX_LOCK_HOLD_CYCLES = 0,
+    parameter bit HEADER_BURST = 1'b0,
+    parameter unsigned HEADER_CACHE_ENTRIES = 0,
+    parameter bit HEADER_CACHE_KEEP_ON_LOCK = 1'b0,
+    // entries of the alloc, free and response FIFOs (at least 2); each
+    // holds one more in its output register
+    parameter unsigned NUM_OP_FIFO_ENTRIES = 4,
+    localparam unsigned NUM_QUEUES = NUM_HEADER_QUEUES + NUM_ALLOC_QUEUES + NUM_FREE_QUEUES,
+    localparam unsigned MEM_DATA_W = HEADER_BURST ? 2 * DATA_W : DATA_W
 ) (
     input logic clk_i,
     input logic rst_ni,
@@ -27,17 +37,21 @@ module falafel_wrapper
     input  logic              mem_req_rdy_i,       // mem ready
     output logic              mem_req_is_write_o,  // 1 for write, 0 for read
     output logic              mem_req_is_cas_o,    // 1 for cas, 0 for write
+    output logic              mem_req_is_burst_o,  // 1 for a whole header, see falafel_lsu
     output logic [DATA_W-1:0] mem_req_addr_o,      // address
-    output logic [DATA_W-1:0] mem_req_data_o,      // write data
+    output logic [MEM_DATA_W-1:0] mem_req_data_o,  // write data
     output logic [DATA_W-1:0] mem_req_cas_exp_o,   // compare & swap expected value
 
     //----------- memory response ------------//
     input  logic              mem_rsp_val_i,  // resp valid
     output logic              mem_rsp_rdy_o,  // falafel ready
-    input  logic [DATA_W-1:0] mem_rsp_data_i  // resp data
+    input  logic [MEM_DATA_W-1:0] mem_rsp_data_i,  // resp data
+
+    //----------- header cache ------------//
+    output logic [DATA_W-1:0] header_cache_hits_o,
+    output logic [DATA_W-1:0] header_cache_misses_o
 );
 
-  localparam NUM_OP_FIFO_ENTRIES = 4;
   localparam [DATA_W-1:0] MSG_ID_SIZE = 8;
   localparam ALLOC_ENTRY_WIDTH = MSG_ID_SIZE + DATA_W;
 
@@ -60,6 +74,22 @@ module falafel_wrapper
   logic result_ready;
   assign result_ready = !resp_fifo_full;
 
+  logic falafel_result_val, falafel_result_is_write;
+  logic [DATA_W-1:0] falafel_result_data;
+
+  // Perf counters; a counter read goes to the response FIFO in a cycle
+  // without an alloc result
+  perf_counters_t perf_counters;
+  perf_events_t perf_events;
+  logic perf_read_val, perf_read_rdy;
+  logic [DATA_W-1:0] perf_read_data;
+  logic alloc_fifo_stall, free_fifo_stall;
+
+  assign perf_read_rdy = result_ready && !falafel_result_is_write;
+  assign resp_fifo_write_en = (falafel_result_is_write && result_ready) ||
+      (perf_read_val && perf_read_rdy);
+  assign resp_fifo_din = falafel_result_is_write ? falafel_result_data : perf_read_data;
+
   logic [MSG_ID_SIZE-1:0] alloc_fifo_din_id;
   logic [DATA_W-1:0] alloc_fifo_din_size;
   logic [MSG_ID_SIZE-1:0] alloc_fifo_dout_id;
@@ -98,19 +128,33 @@ module falafel_wrapper
       .free_fifo_full_i     (free_fifo_full),
       .free_fifo_write_o    (free_fifo_write_en),
       .free_fifo_din_o      (free_fifo_din),
+      .alloc_fifo_stall_o   (alloc_fifo_stall),
+      .free_fifo_stall_o    (free_fifo_stall),
+
+      .config_o(config_regs),
 
-      .config_o(config_regs)
+      .perf_counters_i (perf_counters),
+      .perf_read_val_o (perf_read_val),
+      .perf_read_rdy_i (perf_read_rdy),
+      .perf_read_data_o(perf_read_data)
   );
 
   logic falafel_req_ready;
   assign alloc_fifo_read_en = is_alloc ? falafel_req_ready : 0;
   assign free_fifo_read_en  = !(is_alloc) ? falafel_req_ready : 0;
 
-  falafel i_falafel (
+  falafel #(
+      .BEST_FIT_STOP_UNSPLITTABLE(BEST_FIT_STOP_UNSPLITTABLE),
+      .MAX_BATCH_OPS(MAX_BATCH_OPS),
+      .MAX_LOCK_HOLD_CYCLES(MAX_LOCK_HOLD_CYCLES),
+      .HEADER_BURST(HEADER_BURST),
+      .HEADER_CACHE_ENTRIES(HEADER_CACHE_ENTRIES),
+      .HEADER_CACHE_KEEP_ON_LOCK(HEADER_CACHE_KEEP_ON_LOCK)
+  ) i_falafel (
       .clk_i,
       .rst_ni,
       .falafel_config_i(config_regs),
-      .config_alloc_strategy_i(0),  // TODO
+      .config_alloc_strategy_i(config_regs.alloc_strategy),
       .req_alloc_ready_o(falafel_req_ready),
       .is_alloc_i(is_alloc),
       .req_alloc_valid_i(req_alloc_valid),
@@ -118,9 +162,9 @@ module falafel_wrapper
       .addr_to_free_i(free_fifo_dout),
       .size_to_allocate_i(alloc_fifo_dout_size),
 
-      .rsp_result_is_write_o(resp_fifo_write_en),
-      .rsp_result_val_o(  /* TODO */),
-      .rsp_result_data_o(resp_fifo_din),
+      .rsp_result_is_write_o(falafel_result_is_write),
+      .rsp_result_val_o(falafel_result_val),
+      .rsp_result_data_o(falafel_result_data),
       .result_ready_i(result_ready),
 
       //----------- memory request ------------//
@@ -128,12 +172,35 @@ module falafel_wrapper
       .mem_req_rdy_i,  // mem ready
       .mem_req_is_write_o,  // 1 for write, 0 for read
       .mem_req_is_cas_o,  // 1 for cas, 0 for write
+      .mem_req_is_burst_o,  // 1 for a whole header
       .mem_req_addr_o,  // address
       .mem_req_data_o,  // write data
       .mem_req_cas_exp_o,  // comp
       .mem_rsp_val_i,  // resp valid
       .mem_rsp_rdy_o,  // falafel ready
-      .mem_rsp_data_i
+      .mem_rsp_data_i,
+      .header_cache_hits_o,
+      .header_cache_misses_o,
+      .perf_events_o(perf_events)
+  );
+
+  falafel_perf_counters i_falafel_perf_counters (
+      .clk_i,
+      .rst_ni,
+      .req_val_i(req_alloc_valid),
+      .req_rdy_i(falafel_req_ready),
+      .is_alloc_i(is_alloc),
+      .result_val_i(falafel_result_val),
+      .result_rdy_i(result_ready),
+      .events_i(perf_events),
+      .mem_req_val_i(mem_req_val_o),
+      .mem_req_rdy_i(mem_req_rdy_i),
+      .alloc_fifo_stall_i(alloc_fifo_stall),
+      .free_fifo_stall_i(free_fifo_stall),
+      .resp_fifo_stall_i(falafel_result_val && !result_ready),
+      .header_cache_hits_i(header_cache_hits_o),
+      .header_cache_misses_i(header_cache_misses_o),
+      .counters_o(perf_counters)
   );
 
 
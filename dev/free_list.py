@@ -1,4 +1,17 @@
+from array import array
+from bisect import bisect_left
+
+# next_addr of a node added without one; stored in the column as all ones
+# since array("Q") cannot hold None
+NO_NEXT_ADDR = (1 << 64) - 1
+
+# print_list shows at most this many nodes unless told otherwise
+DEFAULT_DUMP_LIMIT = 32
+
+
 class Node:
+    __slots__ = ("addr", "size", "next_addr")
+
     def __init__(self, addr, size, next_addr=None):
         self.addr = addr
         self.size = size
@@ -9,35 +22,100 @@ class Node:
 
 
 class LinkedList:
+    """Headers of the mocked memory, one row per node in parallel columns.
+
+    addr/size/next_addr live in three array("Q") columns (24 bytes per
+    node) and `nodes` maps an address to its row, so membership tests like
+    `addr in linked_list.nodes` stay O(1) without a Python object per
+    header. The address order used for dumping is sorted lazily and only
+    again after a node is added.
+    """
+
     def __init__(self):
-        self.nodes = {}
+        self.nodes = {}  # addr -> row
+        self._addr = array("Q")
+        self._size = array("Q")
+        self._next_addr = array("Q")
+        self._sorted = None
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, addr):
+        return addr in self.nodes
 
     def add_node(self, addr, size, next_addr=None):
-        node = Node(addr, size, next_addr)
-        self.nodes[addr] = node
+        if next_addr is None:
+            next_addr = NO_NEXT_ADDR
+        row = self.nodes.get(addr)
+        if row is not None:
+            self._size[row] = size
+            self._next_addr[row] = next_addr
+            return
+        self.nodes[addr] = len(self._addr)
+        self._addr.append(addr)
+        self._size.append(size)
+        self._next_addr.append(next_addr)
+        self._sorted = None
 
     def update_size(self, addr, size):
         if addr in self.nodes:
-            self.nodes[addr].size = size
+            self._size[self.nodes[addr]] = size
         else:
             print(f"Node with address {addr} does not exist.")
 
     def update_next_addr(self, addr, next_addr):
         if addr in self.nodes:
-            self.nodes[addr].next_addr = next_addr
+            self._next_addr[self.nodes[addr]] = (
+                NO_NEXT_ADDR if next_addr is None else next_addr
+            )
         else:
             print(f"Node with address {addr} does not exist.")
 
     def get_node(self, addr):
         if addr in self.nodes:
-            node = self.nodes[addr]
-            return node.size, node.next_addr
+            row = self.nodes[addr]
+            return self._size[row], self._next(row)
         else:
             return None, None
 
-    def print_list(self):
+    def node(self, addr):
+        row = self.nodes[addr]
+        return Node(addr, self._size[row], self._next(row))
+
+    def _next(self, row):
+        next_addr = self._next_addr[row]
+        return None if next_addr == NO_NEXT_ADDR else next_addr
+
+    def _sorted_from(self, start):
+        if self._sorted is None:
+            self._sorted = sorted(self._addr)
+        return 0 if start is None else bisect_left(self._sorted, start)
+
+    def iter_nodes(self, start=None):
+        """Yields (addr, size, next_addr) in address order, from `start` on."""
+        for j in range(self._sorted_from(start), len(self.nodes)):
+            addr = self._sorted[j]
+            row = self.nodes[addr]
+            yield addr, self._size[row], self._next(row)
+
+    def walk(self, head, max_nodes=DEFAULT_DUMP_LIMIT):
+        """Yields (addr, size, next_addr) following next_addr from `head`."""
+        addr = head
+        for _ in range(max_nodes):
+            if addr is None or addr not in self.nodes:
+                return
+            size, next_addr = self.get_node(addr)
+            yield addr, size, next_addr
+            addr = next_addr
+
+    def print_list(self, limit=DEFAULT_DUMP_LIMIT, start=None):
+        """Prints up to `limit` nodes (None for all) from `start` on."""
         print("LinkedList contents:")
-        for addr, node in sorted(self.nodes.items()):
-            print(
-                f"Addr: {addr}, Size: {node.size}, Next Addr: {node.next_addr}"
-            )  # noqa
\ No newline at end of file
+        remaining = len(self.nodes) - self._sorted_from(start)
+        nodes = self.iter_nodes(start)
+        for shown, (addr, size, next_addr) in enumerate(nodes):
+            if limit is not None and shown == limit:
+                print(f"... {remaining - shown} more nodes")
+                break
+            print(f"Addr: {addr}, Size: {size}, Next Addr: {next_addr}")
@@ -0,0 +1,332 @@
+"""Initial heaps generated from parameters, written into memory in bulk.
+
+A HeapImage is the block layout of a heap, one row per block header in
+array("Q") columns like free_list.LinkedList: address, size, next_addr and
+whether the block is free. Blocks are appended in address order; link()
+chains the free ones into one ascending free list. load() writes every
+header into MemoryAgent.mem with two dict.update calls instead of a
+write_header per block, and model() gives the matching RefAllocator for a
+Scoreboard.
+
+generate() lays out free blocks with allocated gaps between them (so no
+two free blocks can merge) and a large free tail block. The sizes and gaps
+are drawn from distributions with the syntax of MEM_LATENCY, in bytes:
+fixed:N, uniform:LOW:HIGH or bimodal:SMALL:LARGE:LARGE_PROB. Two worst
+cases are built on top of it:
+  first_fit_worst_case  every free block is too small for the request but
+                        the tail, so first fit walks the whole list
+  best_fit_worst_case   near misses just below the request between fits
+                        that get smaller toward the tail, so best fit walks
+                        the whole list and updates its candidate on each fit
+
+Images are saved to and loaded from snapshot files (.gz compressed), so
+large benchmark heaps are generated once:
+    python heap_image.py heap.img --free-blocks 100000 --sizes uniform:16:512
+    python heap_image.py heap.img --worst-case first --request 1024
+    STRESS_HEAP=heap.img make MODULE=test_stress
+"""
+
+import argparse
+import gzip
+import random
+import struct
+import sys
+from array import array
+
+from mem_agent import parse_latency
+from ref_model import (
+    BLOCK_HEADER_SIZE,
+    BLOCK_NEXT_ADDR_OFFSET,
+    MIN_ALLOC_SIZE,
+    RefAllocator,
+)
+
+FREE_LIST_PTR = 8
+HEAP_BASE = 0x1000
+TAIL_FREE_SIZE = 1 << 24
+
+MAGIC = b"FLHEAP01"
+# header: magic, free list pointer, number of blocks; then the columns
+FILE_HEADER = struct.Struct("<8sQQ")
+
+
+def parse_distribution(spec):
+    """Size or gap distribution in bytes, the syntax of MEM_LATENCY."""
+    return parse_latency(spec)
+
+
+class HeapImage:
+    def __init__(self, free_list_ptr=FREE_LIST_PTR, base=HEAP_BASE):
+        self.free_list_ptr = free_list_ptr
+        self.addr = array("Q")
+        self.size = array("Q")
+        self.next_addr = array("Q")
+        self.free = array("B")
+        self.end = base  # address after the last block
+
+    def __len__(self):
+        return len(self.addr)
+
+    def add_block(self, size, free, addr=None):
+        """Appends a block at `addr` (default: right after the last one)."""
+        addr = self.end if addr is None else addr
+        assert (
+            addr >= self.end
+        ), f"block at {addr:#x} overlaps the one before {self.end:#x}"
+        self.addr.append(addr)
+        self.size.append(size)
+        self.next_addr.append(0)
+        self.free.append(free)
+        self.end = addr + BLOCK_HEADER_SIZE + size
+        return addr
+
+    def link(self):
+        """Chains the free blocks in address order, returns the head or 0."""
+        next_addr = 0
+        for row in range(len(self.addr) - 1, -1, -1):
+            if self.free[row]:
+                self.next_addr[row] = next_addr
+                next_addr = self.addr[row]
+        return next_addr
+
+    def free_blocks(self):
+        """(addr, size) of the free blocks in address order."""
+        rows = zip(self.addr, self.size, self.free)
+        return [(addr, size) for addr, size, free in rows if free]
+
+    def allocated_blocks(self):
+        rows = zip(self.addr, self.size, self.free)
+        return [(addr, size) for addr, size, free in rows if not free]
+
+    def load(self, mem):
+        """Writes every header and the free list pointer into a MemoryAgent."""
+        head = self.link()
+        words = mem.mem
+        words.update(zip(self.addr, self.size))
+        words.update(
+            zip(map(BLOCK_NEXT_ADDR_OFFSET.__add__, self.addr), self.next_addr)
+        )
+        words[self.free_list_ptr] = head
+
+    def model(self, best_fit_stop_unsplittable=False):
+        """RefAllocator holding the blocks of the image."""
+        model = RefAllocator(self.free_list_ptr, best_fit_stop_unsplittable)
+        model.add_free_blocks(self.free_blocks())
+        model.allocated.update(
+            (addr, (size, 0)) for addr, size in self.allocated_blocks()
+        )
+        return model
+
+    def save(self, path):
+        columns = [self.addr, self.size, self.next_addr, self.free]
+        with _open(path, "wb") as f:
+            f.write(FILE_HEADER.pack(MAGIC, self.free_list_ptr, len(self)))
+            for column in columns:
+                if sys.byteorder == "big":
+                    column = array(column.typecode, column)
+                    column.byteswap()
+                f.write(column.tobytes())
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def load_image(path):
+    """HeapImage saved by HeapImage.save."""
+    with _open(path, "rb") as f:
+        data = f.read()
+    magic, free_list_ptr, count = FILE_HEADER.unpack_from(data)
+    assert magic == MAGIC, f"{path} is not a heap image"
+    image = HeapImage(free_list_ptr)
+    pos = FILE_HEADER.size
+    for column in (image.addr, image.size, image.next_addr, image.free):
+        end = pos + count * column.itemsize
+        assert end <= len(data), f"{path} is cut off"
+        column.frombytes(data[pos:end])
+        if sys.byteorder == "big":
+            column.byteswap()
+        pos = end
+    if count:
+        image.end = image.addr[-1] + BLOCK_HEADER_SIZE + image.size[-1]
+    image.link()
+    return image
+
+
+def generate(
+    num_free_blocks,
+    sizes="uniform:16:1024",
+    gaps="uniform:16:256",
+    rng=None,
+    tail_size=TAIL_FREE_SIZE,
+    free_list_ptr=FREE_LIST_PTR,
+):
+    """Free blocks of `sizes` between allocated blocks of `gaps`, then a tail.
+
+    `sizes` and `gaps` are distribution specs or anything with sample(rng);
+    no tail block if `tail_size` is 0.
+    """
+    rng = rng or random.Random(1)
+    sizes = parse_distribution(sizes) if isinstance(sizes, str) else sizes
+    gaps = parse_distribution(gaps) if isinstance(gaps, str) else gaps
+    image = HeapImage(free_list_ptr)
+    for _ in range(num_free_blocks):
+        image.add_block(sizes.sample(rng), True)
+        image.add_block(gaps.sample(rng), False)
+    if tail_size:
+        image.add_block(tail_size, True)
+    image.link()
+    return image
+
+
+class _Capped:
+    # a size distribution limited to sizes below `limit`
+    def __init__(self, sizes, limit):
+        self.sizes = sizes
+        self.limit = limit
+
+    def sample(self, rng):
+        return min(self.sizes.sample(rng), self.limit - 1)
+
+
+def first_fit_worst_case(
+    num_free_blocks,
+    request,
+    sizes="uniform:16:1024",
+    gaps="uniform:16:256",
+    rng=None,
+    tail_size=TAIL_FREE_SIZE,
+    free_list_ptr=FREE_LIST_PTR,
+):
+    """Only the tail fits `request`, first fit visits every free block."""
+    assert request > 1 and tail_size >= request
+    sizes = parse_distribution(sizes) if isinstance(sizes, str) else sizes
+    return generate(
+        num_free_blocks,
+        _Capped(sizes, request),
+        gaps,
+        rng,
+        tail_size,
+        free_list_ptr,
+    )
+
+
+class _NearMisses:
+    # alternates sizes just below `request` and splittable fits that get one
+    # byte smaller each time, so the last fit before the tail is the best
+    def __init__(self, num_free_blocks, request, spread):
+        self.request = request
+        self.spread = spread
+        self.fits_left = num_free_blocks // 2
+        self.row = 0
+
+    def sample(self, rng):
+        self.row += 1
+        if self.row % 2:
+            return self.request - rng.randint(1, self.spread)
+        self.fits_left -= 1
+        return self.request + MIN_ALLOC_SIZE + self.fits_left
+
+
+def best_fit_worst_case(
+    num_free_blocks,
+    request,
+    spread=MIN_ALLOC_SIZE,
+    gaps="uniform:16:256",
+    rng=None,
+    tail_size=TAIL_FREE_SIZE,
+    free_list_ptr=FREE_LIST_PTR,
+):
+    """Near misses and ever better fits, best fit updates on every block.
+
+    Half of the free blocks are 1 to `spread` bytes too small for `request`,
+    the others fit with room to split (so neither the exact fit nor the
+    BEST_FIT_STOP_UNSPLITTABLE exit is taken) and shrink toward the tail; the
+    best fit is the last of them.
+    """
+    assert request > spread
+    assert tail_size >= request + MIN_ALLOC_SIZE + num_free_blocks
+    sizes = _NearMisses(num_free_blocks, request, spread)
+    return generate(
+        num_free_blocks,
+        sizes,
+        gaps,
+        rng,
+        tail_size,
+        free_list_ptr,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="snapshot to write, .gz to compress")
+    parser.add_argument("--free-blocks", type=int, default=1000)
+    parser.add_argument(
+        "--sizes",
+        default="uniform:16:1024",
+        help="free block sizes",
+    )
+    parser.add_argument(
+        "--gaps",
+        default="uniform:16:256",
+        help="allocated block sizes",
+    )
+    parser.add_argument(
+        "--worst-case",
+        choices=["first", "best"],
+        default=None,
+    )
+    parser.add_argument(
+        "--request",
+        type=int,
+        default=1024,
+        help="alloc size the worst case is built for",
+    )
+    parser.add_argument(
+        "--tail",
+        type=int,
+        default=TAIL_FREE_SIZE,
+        help="tail block size, 0 for none",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.worst_case == "first":
+        image = first_fit_worst_case(
+            args.free_blocks,
+            args.request,
+            args.sizes,
+            args.gaps,
+            rng,
+            args.tail,
+        )
+    elif args.worst_case == "best":
+        image = best_fit_worst_case(
+            args.free_blocks,
+            args.request,
+            gaps=args.gaps,
+            rng=rng,
+            tail_size=args.tail,
+        )
+    else:
+        image = generate(
+            args.free_blocks,
+            args.sizes,
+            args.gaps,
+            rng,
+            args.tail,
+        )
+    image.save(args.path)
+    free = image.free_blocks()
+    print(
+        f"wrote {len(image)} blocks ({len(free)} free, "
+        f"{sum(s for _, s in free)} free bytes, "
+        f"heap {HEAP_BASE:#x}..{image.end:#x}) to {args.path}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,483 @@
+import os
+import random
+from collections import deque
+
+import cocotb
+from cocotb.triggers import FallingEdge, ReadOnly, RisingEdge
+from cocotb.utils import get_sim_time
+
+import queue_monitor
+import state_profiler
+import trace_window
+import txn_log
+from mem_traffic import TrafficAccount
+
+WORD_SIZE = 8
+DATA_MASK = (1 << (8 * WORD_SIZE)) - 1
+BLOCK_NEXT_ADDR_OFFSET = WORD_SIZE
+EMPTY_KEY = 0
+LOCK_HOLDER_ID = 0xC0FFEE  # lock id of the emulated software threads
+
+
+class FixedLatency:
+    def __init__(self, cycles):
+        assert (
+            cycles >= 1
+        ), "a response comes one cycle after the request at the earliest"  # noqa
+        self.cycles = cycles
+
+    def sample(self, rng):
+        return self.cycles
+
+    def __str__(self):
+        return f"fixed:{self.cycles}"
+
+
+class UniformLatency:
+    def __init__(self, low, high):
+        assert 1 <= low <= high, f"bad latency range {low}..{high}"
+        self.low = low
+        self.high = high
+
+    def sample(self, rng):
+        return rng.randint(self.low, self.high)
+
+    def __str__(self):
+        return f"uniform:{self.low}:{self.high}"
+
+
+class BimodalLatency:
+    # DRAM-like: most requests hit an open row, the rest pay for a miss
+    def __init__(self, fast, slow, slow_prob):
+        assert 1 <= fast <= slow, f"bad latencies {fast}, {slow}"
+        self.fast = fast
+        self.slow = slow
+        self.slow_prob = slow_prob
+
+    def sample(self, rng):
+        return self.slow if rng.random() < self.slow_prob else self.fast
+
+    def __str__(self):
+        return f"bimodal:{self.fast}:{self.slow}:{self.slow_prob}"
+
+
+def parse_latency(spec):
+    """fixed:N, uniform:LOW:HIGH or bimodal:FAST:SLOW:SLOW_PROB (in cycles)"""
+    kind, *args = spec.split(":")
+    if kind == "fixed":
+        return FixedLatency(int(args[0]))
+    if kind == "uniform":
+        return UniformLatency(int(args[0]), int(args[1]))
+    if kind == "bimodal":
+        return BimodalLatency(int(args[0]), int(args[1]), float(args[2]))
+    raise ValueError(f"unknown latency model {spec}")
+
+
+class MemTransaction:
+    def __init__(
+        self,
+        cycle,
+        addr,
+        data,
+        is_write,
+        is_cas,
+        cas_exp,
+        rsp_data,
+        is_burst=False,
+    ):
+        self.cycle = cycle
+        self.addr = addr
+        self.data = data
+        self.is_write = is_write
+        self.is_cas = is_cas
+        self.cas_exp = cas_exp
+        self.rsp_data = rsp_data
+        self.is_burst = is_burst
+
+    def __str__(self):
+        if self.is_cas:
+            kind = "CAS"
+        elif self.is_write:
+            kind = "WR"
+        else:
+            kind = "RD"
+        if self.is_burst:
+            kind += "x2"
+        return f"MemTransaction(cycle={self.cycle}, {kind}, addr={self.addr}, data={self.data}, rsp={self.rsp_data})"  # noqa
+
+
+class MemoryAgent:
+    """Reactive memory model sitting on the falafel memory interface.
+
+    Every request accepted on mem_req_val_o/mem_req_rdy_i is decoded as a
+    read, a write or a CAS against a sparse backing store (one 64-bit word
+    per byte address) and answered on mem_rsp_val_i/mem_rsp_data_i. Builds
+    with HEADER_BURST set also issue mem_req_is_burst_o requests, which
+    move the two words at addr and addr + 8 as one 128-bit value (the word
+    at addr in the low half).
+
+    Responses are returned in order after a latency drawn from `latency`
+    (a latency model or a parse_latency spec). Each cycle mem_req_rdy_i is
+    dropped with probability `req_stall_prob` and a ready response is held
+    back with probability `rsp_stall_prob`.
+
+    Other lock holders are emulated at `lock_ptr`: while the lock word is
+    EMPTY_KEY it is taken with probability `lock_contention` per cycle and
+    held for `lock_hold` cycles (a latency spec), so falafel's LOAD_KEY
+    spins and its CAS can fail. Any other access falafel makes while the
+    lock is held counts as a lock violation.
+
+    While rst_ni is low no request is sampled and queued responses are
+    dropped, so a DUT left mid-operation by an earlier test is not answered
+    after its reset.
+
+    Arguments left as None are taken from MEM_LATENCY, MEM_REQ_STALL,
+    MEM_RSP_STALL, MEM_SEED, MEM_LOCK_PTR, MEM_LOCK_CONTENTION and
+    MEM_LOCK_HOLD; the defaults answer every request on the next cycle with
+    no contention.
+
+    With no response outstanding, no request up and nothing drawn per cycle
+    (no lock contention, no request stalls, neither MAX_BATCH_OPS nor a
+    header cache to poll) the agent sleeps until mem_req_val_o rises and
+    `cycle` is counted from the sim time meanwhile. Changing lock_contention
+    or req_stall_prob then takes effect at the next request.
+    """
+
+    def __init__(
+        self,
+        dut,
+        clk,
+        latency=None,
+        req_stall_prob=None,
+        rsp_stall_prob=None,
+        seed=None,
+        lock_ptr=None,
+        lock_contention=None,
+        lock_hold=None,
+    ):
+        self.dut = dut
+        self.clk = clk
+        self.mem = {}
+        self._cycle = 0
+        self._period = None  # sim steps between falling edges, measured
+        self._edge_time = None  # sim step of the falling edge of _cycle
+        self._asleep = False
+        self.rsp_queue = deque()  # (cycle the response is ready, data)
+        self.transactions = []
+        self.record = False
+        self._task = None
+        self.profiler = None
+        self.queue_monitor = None
+        self.trace_window = None
+        self.txn_log = None
+
+        if latency is None:
+            latency = os.environ.get("MEM_LATENCY", "fixed:1")
+        if isinstance(latency, str):
+            latency = parse_latency(latency)
+        if req_stall_prob is None:
+            req_stall_prob = float(os.environ.get("MEM_REQ_STALL", "0"))
+        if rsp_stall_prob is None:
+            rsp_stall_prob = float(os.environ.get("MEM_RSP_STALL", "0"))
+        if seed is None:
+            seed = int(os.environ.get("MEM_SEED", cocotb.RANDOM_SEED))
+        self.latency = latency
+        self.req_stall_prob = req_stall_prob
+        self.rsp_stall_prob = rsp_stall_prob
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+        if lock_ptr is None:
+            lock_ptr = int(os.environ.get("MEM_LOCK_PTR", "0"), 0)
+        if lock_contention is None:
+            lock_contention = float(os.environ.get("MEM_LOCK_CONTENTION", "0"))
+        if lock_hold is None:
+            lock_hold = os.environ.get("MEM_LOCK_HOLD", "fixed:50")
+        if isinstance(lock_hold, str):
+            lock_hold = parse_latency(lock_hold)
+        self.lock_ptr = lock_ptr
+        self.lock_contention = lock_contention
+        self.lock_hold = lock_hold
+        # set while the emulated holder has the lock
+        self.lock_release_cycle = None
+
+        # lock traffic from falafel and what the emulated holders did
+        self.lock_loads = 0
+        self.cas_attempts = 0
+        self.cas_failures = 0
+        self.lock_acquires = 0
+        self.lock_held_cycles = 0
+        self.lock_violations = 0
+
+        # cycles with a request on the bus or a response outstanding, and
+        # cycles a request was held off by mem_req_rdy_i
+        self.num_reqs = 0
+        self.busy_cycles = 0
+        self.req_stall_cycles = 0
+
+        # reads/writes/CAS per alloc and free, see TrafficAccount
+        self.traffic = TrafficAccount(
+            dut.i_falafel if hasattr(dut, "i_falafel") else dut,
+            batched=int(getattr(dut, "MAX_BATCH_OPS", 1)) > 1,
+            cached=int(getattr(dut, "HEADER_CACHE_ENTRIES", 0)) > 0,
+        )
+
+    def config(self):
+        return {
+            "latency": str(self.latency),
+            "req_stall_prob": self.req_stall_prob,
+            "rsp_stall_prob": self.rsp_stall_prob,
+            "seed": self.seed,
+            "lock_contention": self.lock_contention,
+            "lock_hold": str(self.lock_hold),
+        }
+
+    def lock_stats(self):
+        return {
+            "lock_loads": self.lock_loads,
+            "cas_attempts": self.cas_attempts,
+            "cas_failures": self.cas_failures,
+            "lock_acquires": self.lock_acquires,
+            "lock_held_cycles": self.lock_held_cycles,
+            "lock_violations": self.lock_violations,
+        }
+
+    @property
+    def cycle(self):
+        """Falling edges since start()."""
+        if self._asleep:
+            slept = (get_sim_time() - self._edge_time) // self._period
+            return self._cycle + slept
+        return self._cycle
+
+    def _can_sleep(self, req_val, rsp_val):
+        return not (
+            req_val
+            or rsp_val
+            or self.rsp_queue
+            or self._period is None
+            or self.lock_contention
+            or self.req_stall_prob
+            or self.traffic.batched
+            or self.traffic.cached
+        )
+
+    # backing store
+    def read_word(self, addr):
+        return self.mem.get(addr, 0)
+
+    def write_word(self, addr, data):
+        self.mem[addr] = data & DATA_MASK
+
+    def write_header(self, addr, size, next_addr):
+        self.write_word(addr, size)
+        self.write_word(addr + BLOCK_NEXT_ADDR_OFFSET, next_addr)
+
+    def read_header(self, addr):
+        size = self.read_word(addr)
+        return size, self.read_word(addr + BLOCK_NEXT_ADDR_OFFSET)
+
+    def load_linked_list(self, linked_list):
+        for addr, size, next_addr in linked_list.iter_nodes():
+            self.write_header(addr, size, next_addr or 0)
+
+    def load_model(self, model):
+        """Writes the headers and free list pointers of a RefAllocator."""
+        for addr, (size, next_addr) in model.allocated.items():
+            self.write_header(addr, size, next_addr)
+        for ptr, index in model.lists():
+            for addr, size, next_addr in model.free_list(index):
+                self.write_header(addr, size, next_addr)
+            self.write_word(ptr, index.first() or 0)
+
+    def walk_free_list(self, free_list_ptr, max_nodes=1 << 20):
+        headers = []
+        addr = self.read_word(free_list_ptr)
+        while addr != 0:
+            assert len(headers) < max_nodes, "free list does not terminate"
+            size, next_addr = self.read_header(addr)
+            headers.append((addr, size, next_addr))
+            addr = next_addr
+        return headers
+
+    # request handling
+    def access(self, addr, data, is_write, is_cas, cas_exp, is_burst=False):
+        if is_burst:
+            self.traffic.access(
+                addr,
+                is_write,
+                is_cas,
+                False,
+                size=2 * WORD_SIZE,
+            )
+            if self.lock_release_cycle is not None:
+                self.lock_violations += 1
+            if is_write:
+                next_addr = data >> (8 * WORD_SIZE)
+                self.write_header(addr, data & DATA_MASK, next_addr)
+                return 0
+            size, next_addr = self.read_header(addr)
+            return size | (next_addr << (8 * WORD_SIZE))
+        self.traffic.access(addr, is_write, is_cas, addr == self.lock_ptr)
+        if addr == self.lock_ptr:
+            if is_cas:
+                self.cas_attempts += 1
+                self.cas_failures += self.read_word(addr) != cas_exp
+            elif not is_write:
+                self.lock_loads += 1
+        elif self.lock_release_cycle is not None:
+            self.lock_violations += 1
+        if is_cas:
+            old = self.read_word(addr)
+            if old == cas_exp:
+                self.write_word(addr, data)
+            return old
+        if is_write:
+            self.write_word(addr, data)
+            return 0
+        return self.read_word(addr)
+
+    def start(self):
+        self.dut.mem_req_rdy_i.setimmediatevalue(1)
+        self.dut.mem_rsp_val_i.setimmediatevalue(0)
+        self.dut.mem_rsp_data_i.setimmediatevalue(0)
+        self._edge_time = None
+        self.txn_log = txn_log.get()
+        if self.txn_log is not None:
+            self.txn_log.start()
+        self._task = cocotb.start_soon(self._run())
+        # tests get the state profile for free when STATE_PROFILE is set
+        self.profiler = state_profiler.from_env(self.dut, self.clk)
+        self.queue_monitor = queue_monitor.from_env(self.dut, self.clk)
+        self.trace_window = trace_window.from_env(self.dut, self.clk)
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+            self._cycle = self.cycle
+            self._asleep = False
+        if self.txn_log is not None:
+            self.txn_log.flush()
+        if self.profiler is not None:
+            self.profiler.stop()
+            state_profiler.save(self.profiler)
+            self.profiler = None
+        if self.queue_monitor is not None:
+            self.queue_monitor.stop()
+            queue_monitor.save(self.queue_monitor)
+            self.queue_monitor = None
+        if self.trace_window is not None:
+            trace_window.drop(self.trace_window)
+            self.trace_window = None
+
+    def _emulate_lock_holder(self):
+        rng = self.rng
+        if self.lock_release_cycle is not None:
+            self.lock_held_cycles += 1
+            if self.cycle >= self.lock_release_cycle:
+                self.write_word(self.lock_ptr, EMPTY_KEY)
+                self.lock_release_cycle = None
+        elif (
+            self.read_word(self.lock_ptr) == EMPTY_KEY
+            and rng.random() < self.lock_contention
+        ):
+            self.write_word(self.lock_ptr, LOCK_HOLDER_ID)
+            self.lock_release_cycle = self.cycle + self.lock_hold.sample(rng)
+            self.lock_acquires += 1
+
+    async def _run(self):
+        dut = self.dut
+        rng = self.rng
+        driven = (False, 0, True)  # set by start()
+        while True:
+            await FallingEdge(self.clk)
+            now = get_sim_time()
+            if self._edge_time is None:
+                self._cycle += 1
+            else:
+                if self._period is None:
+                    self._period = now - self._edge_time
+                self._cycle += (now - self._edge_time) // self._period
+            self._edge_time = now
+            self._asleep = False
+            if self.lock_contention:
+                self._emulate_lock_holder()
+
+            rsp_queue = self.rsp_queue
+            rsp_val = len(rsp_queue) > 0 and rsp_queue[0][0] <= self.cycle
+            if rsp_val and self.rsp_stall_prob:
+                rsp_val = rng.random() >= self.rsp_stall_prob
+            req_stall = self.req_stall_prob
+            req_rdy = not (req_stall and rng.random() < req_stall)
+            rsp_word = self.rsp_queue[0][1] if rsp_val else 0
+            # only write what changed, most cycles nothing does
+            if rsp_val != driven[0]:
+                dut.mem_rsp_val_i.value = 1 if rsp_val else 0
+            if rsp_word != driven[1]:
+                dut.mem_rsp_data_i.value = rsp_word
+            if req_rdy != driven[2]:
+                dut.mem_req_rdy_i.value = 1 if req_rdy else 0
+            driven = (rsp_val, rsp_word, req_rdy)
+
+            # sample what the DUT will see on the next rising edge
+            await ReadOnly()
+            if dut.rst_ni.value == 0:
+                # falafel forgets its requests in reset, so do we
+                self.rsp_queue.clear()
+                continue
+            req_val = dut.mem_req_val_o.value == 1
+            if req_val or self.rsp_queue:
+                self.busy_cycles += 1
+            if rsp_val and dut.mem_rsp_rdy_o.value == 1:
+                self.rsp_queue.popleft()
+                if self.txn_log is not None:
+                    self.txn_log.mem_rsp(rsp_word)
+            if self.traffic.batched:
+                self.traffic.poll_result()
+            if self.traffic.cached:
+                self.traffic.poll_cache()
+
+            if req_val and not req_rdy:
+                self.req_stall_cycles += 1
+            elif req_val:
+                self.num_reqs += 1
+                addr = dut.mem_req_addr_o.value.integer
+                data = dut.mem_req_data_o.value.integer
+                is_write = dut.mem_req_is_write_o.value == 1
+                is_cas = dut.mem_req_is_cas_o.value == 1
+                cas_exp = dut.mem_req_cas_exp_o.value.integer
+                is_burst = dut.mem_req_is_burst_o.value == 1
+                rsp_data = self.access(
+                    addr,
+                    data,
+                    is_write,
+                    is_cas,
+                    cas_exp,
+                    is_burst,
+                )
+                if self.txn_log is not None:
+                    self.txn_log.mem_req(
+                        addr, data, is_write, is_cas, cas_exp, is_burst
+                    )
+                ready = self.cycle + self.latency.sample(rng)
+                self.rsp_queue.append((ready, rsp_data))
+                if self.record:
+                    self.transactions.append(
+                        MemTransaction(
+                            self.cycle,
+                            addr,
+                            data,
+                            is_write,
+                            is_cas,
+                            cas_exp,
+                            rsp_data,
+                            is_burst,
+                        )
+                    )
+            if self._can_sleep(req_val, rsp_val):
+                # mem_req_val_o is a function of the LSU state, it only rises
+                # after a rising edge and is sampled at the falling edge after
+                self._asleep = True
+                await RisingEdge(dut.mem_req_val_o)
@@ -1,6 +1,8 @@
-from cocotb.triggers import FallingEdge, RisingEdge, ReadOnly
 import cocotb
+from cocotb.triggers import FallingEdge, ReadOnly, RisingEdge
+from cocotb.utils import get_sim_time
 
+import txn_log
 from free_list import LinkedList
 from monitor import monitor_req_from_falafel
 
@@ -37,6 +39,89 @@ async def send_req_to_wrapper(dut, clk, config_data, index):
     dut.req_val_i[index].setimmediatevalue(0)
 
 
+async def issue_core_req(
+    dut,
+    clk,
+    is_alloc,
+    size_to_allocate=0,
+    addr_to_free=0,
+):
+    # drive on the falling edge and hold valid until falafel takes the request,
+    # returns the time (ns) valid was raised
+    await FallingEdge(clk)
+    start = get_sim_time("ns")
+    dut.is_alloc_i.value = is_alloc
+    dut.size_to_allocate_i.value = size_to_allocate
+    dut.addr_to_free_i.value = addr_to_free
+    dut.req_alloc_valid_i.value = 1
+    while True:
+        await ReadOnly()
+        accepted = dut.req_alloc_ready_o.value == 1
+        await FallingEdge(clk)
+        if accepted:
+            break
+    dut.req_alloc_valid_i.value = 0
+    log = txn_log.get()
+    if log is not None:
+        log.op(is_alloc, size_to_allocate if is_alloc else addr_to_free)
+    return start
+
+
+async def issue_alloc_req(dut, clk, size_to_allocate):
+    return await issue_core_req(dut, clk, 1, size_to_allocate=size_to_allocate)
+
+
+async def issue_free_req(dut, clk, addr_to_free):
+    return await issue_core_req(dut, clk, 0, addr_to_free=addr_to_free)
+
+
+async def issue_wrapper_req(dut, clk, data, index):
+    await FallingEdge(clk)
+    start = get_sim_time("ns")
+    dut.req_val_i[index].value = 1
+    dut.req_data_i[index].value = data
+    while True:
+        await ReadOnly()
+        accepted = dut.req_rdy_o[index].value == 1
+        await FallingEdge(clk)
+        if accepted:
+            break
+    dut.req_val_i[index].value = 0
+    log = txn_log.get()
+    if log is not None:
+        log.wrapper_word(index, data)
+    return start
+
+
+async def wait_for_result(dut, clk):
+    # rsp_result_val_o only changes on a rising edge, sleep until it rises
+    # instead of looking at every falling edge
+    await FallingEdge(clk)
+    while dut.rsp_result_val_o.value != 1:
+        await RisingEdge(dut.rsp_result_val_o)
+        await FallingEdge(clk)
+    data = dut.rsp_result_data_o.value.integer
+    log = txn_log.get()
+    if log is not None:
+        log.result(data, dut.rsp_result_is_write_o.value == 1)
+    return data
+
+
+async def wait_for_wrapper_resp(dut, clk):
+    while True:
+        await FallingEdge(clk)
+        if dut.resp_val_o.value == 1 and dut.resp_rdy_i.value == 1:
+            data = dut.resp_data_o.value.integer
+            log = txn_log.get()
+            if log is not None:
+                log.result(data)
+            # falafel_output_fsm sends every response twice
+            await FallingEdge(clk)
+            return data
+        if dut.resp_val_o.value != 1:
+            await RisingEdge(dut.resp_val_o)
+
+
 async def grant_store(dut, clk):
     await RisingEdge(clk)
     dut.mem_req_rdy_i.setimmediatevalue(0)
@@ -0,0 +1,202 @@
+from collections import Counter
+
+from ref_model import DATA_W, WORD_SIZE, unpack_config
+from state_profiler import OP_ALLOC, OP_FREE
+
+LOCK = "lock"  # loads, CAS and the unlock store of the lock word
+SEARCH = "search"  # every other load: free list pointer and headers
+UPDATE = "update"  # every other store: split, merge and link headers
+PHASES = (LOCK, SEARCH, UPDATE)
+
+READ = "read"
+WRITE = "write"
+CAS = "cas"
+
+
+class OpTraffic:
+    """Memory transactions of a single alloc or free."""
+
+    __slots__ = ("kind", "counts", "bytes", "nodes", "cache_hits")
+
+    def __init__(self):
+        self.kind = None
+        self.counts = Counter()  # (phase, READ/WRITE/CAS) -> transactions
+        self.bytes = Counter()  # phase -> bytes moved
+        self.nodes = 0  # headers loaded
+        # loads served by the header cache, no memory traffic
+        self.cache_hits = 0
+
+    def as_dict(self):
+        row = {
+            "kind": self.kind,
+            "nodes": self.nodes,
+            "cache_hits": self.cache_hits,
+        }
+        for phase in PHASES:
+            for access in (READ, WRITE, CAS):
+                row[f"{phase}_{access}s"] = self.counts[phase, access]
+            row[f"{phase}_bytes"] = self.bytes[phase]
+        row["bytes"] = sum(self.bytes.values())
+        return row
+
+
+class TrafficAccount:
+    """Attributes the memory traffic of falafel to ops and phases.
+
+    An op spans every transaction up to and including the store that
+    releases the lock, which is the last thing falafel does for each alloc
+    and free. Builds with MAX_BATCH_OPS > 1 (`batched`) return the result
+    before that store and may start the next op under the same lock, so
+    the result handshake ends the op there (see poll_result); a release
+    with no op in flight is charged to the op that finished last. A load
+    of `addr` right after a load of `addr - 8` completes a header
+    (LSU_LOAD_SIZE then LSU_LOAD_NEXT_ADDR) and counts as a node
+    visited, unless it is the free list pointer (or the first header
+    pointer of a size class, for segregated fit); so does a single header
+    burst load (size 2 * WORD_SIZE, LSU_LOAD_HEADER). CAS moves the word
+    both ways and counts double. Builds with a header cache (`cached`)
+    serve some loads without a memory request; poll_cache counts those
+    as cache hits and, list head pointers aside, as nodes as well.
+    """
+
+    def __init__(self, falafel, batched=False, cached=False):
+        self.falafel = falafel
+        self.batched = batched
+        self.cached = cached
+        self.current = OpTraffic()
+        self._last = None
+        self.ops = Counter()  # kind -> ops
+        self.totals = {}  # kind -> OpTraffic with the sums over all its ops
+        self._last_read = None
+
+    def access(self, addr, is_write, is_cas, is_lock, size=WORD_SIZE):
+        op = self.current
+        if is_lock:
+            phase = LOCK
+        else:
+            phase = UPDATE if is_write and not is_cas else SEARCH
+        if is_cas:
+            op.counts[phase, CAS] += 1
+            op.bytes[phase] += 2 * size
+        elif is_write:
+            op.counts[phase, WRITE] += 1
+            op.bytes[phase] += size
+        else:
+            op.counts[phase, READ] += 1
+            op.bytes[phase] += size
+            if phase == SEARCH and size == 2 * WORD_SIZE:
+                if addr not in self.list_heads():
+                    op.nodes += 1
+                self._last_read = None
+            elif phase == SEARCH:
+                last_read = self._last_read
+                if last_read is not None and addr == last_read + WORD_SIZE:
+                    # the first header address is loaded the same way
+                    if last_read not in self.list_heads():
+                        op.nodes += 1
+                    self._last_read = None
+                else:
+                    self._last_read = addr
+        if phase == LOCK and is_write and not is_cas:
+            if len(op.counts) == 1 and self._last is not None:
+                # the release at the end of a batch
+                self._charge_last(op)
+                self.current = OpTraffic()
+            else:
+                self._finish()
+
+    def poll_result(self):
+        """Ends the op in flight if its result is being handed over."""
+        falafel = self.falafel
+        if (
+            self.current.counts
+            and falafel.rsp_result_val_o.value == 1
+            and falafel.result_ready_i.value == 1
+        ):
+            self._finish()
+
+    def poll_cache(self):
+        """Counts a header load served by the header cache this cycle."""
+        falafel = self.falafel
+        if falafel.header_cache_hit.value == 1:
+            # header.addr is the first (most significant) field of header_req_t
+            req = falafel.core_req_header
+            addr = int(req.value) >> (len(req) - DATA_W)
+            self.current.cache_hits += 1
+            if addr not in self.list_heads():
+                self.current.nodes += 1
+
+    @property
+    def last(self):
+        """The op that finished last."""
+        if self.batched:
+            # a test can look at it in the result cycle before the memory
+            # agent polls
+            self.poll_result()
+        return self._last
+
+    def _charge_last(self, op):
+        total = self.totals[self._last.kind]
+        for last in (self._last, total):
+            last.counts.update(op.counts)
+            last.bytes.update(op.bytes)
+
+    def list_heads(self):
+        config = unpack_config(int(self.falafel.falafel_config_i.value))
+        free_list_ptr, _, _, size_class_ptrs, _ = config
+        return {free_list_ptr, *size_class_ptrs}
+
+    def _finish(self):
+        op = self.current
+        core = self.falafel.i_core
+        if core.is_alloc_q.value == 1:
+            op.kind = OP_ALLOC.get(
+                int(self.falafel.config_alloc_strategy_i.value), "alloc"
+            )
+        else:
+            op.kind = OP_FREE
+        self.ops[op.kind] += 1
+        total = self.totals.setdefault(op.kind, OpTraffic())
+        total.kind = op.kind
+        total.counts.update(op.counts)
+        total.bytes.update(op.bytes)
+        total.nodes += op.nodes
+        total.cache_hits += op.cache_hits
+        self._last = op
+        self.current = OpTraffic()
+        self._last_read = None
+
+    def report(self):
+        """Per op kind: transactions and bytes per op, and bytes per node."""
+        report = {}
+        for kind, total in sorted(self.totals.items()):
+            ops = self.ops[kind]
+            row = {"ops": ops}
+            for key, value in total.as_dict().items():
+                if key != "kind":
+                    row[f"{key}_per_op"] = value / ops
+            search_bytes = total.bytes[SEARCH]
+            row["search_bytes_per_node"] = (
+                search_bytes / total.nodes if total.nodes else 0.0
+            )
+            row["bytes_per_node"] = (
+                sum(total.bytes.values()) / total.nodes if total.nodes else 0.0
+            )
+            report[kind] = row
+        return report
+
+    def summary(self):
+        lines = []
+        for kind, row in self.report().items():
+            line = (
+                f"{kind}: {row['ops']} ops, {row['bytes_per_op']:.1f} B/op "
+                f"(lock {row['lock_bytes_per_op']:.1f}, "
+                f"search {row['search_bytes_per_op']:.1f}, "
+                f"update {row['update_bytes_per_op']:.1f}), "
+                f"{row['nodes_per_op']:.1f} nodes/op, "
+                f"{row['bytes_per_node']:.1f} B/node"
+            )
+            if self.cached:
+                line += f", {row['cache_hits_per_op']:.1f} cache hits/op"
+            lines.append(line)
+        return "\n".join(lines)
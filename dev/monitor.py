@@ -1,32 +1,101 @@
 import cocotb
-from cocotb.triggers import ReadOnly, Timer
+from cocotb.queue import Queue
+from cocotb.triggers import FallingEdge, ReadOnly, RisingEdge, Timer
+from cocotb.utils import get_sim_time
+
+from mem_agent import MemTransaction
+
+
+async def wait_for_high(signal):
+    """Returns in the ReadOnly phase of the first time step `signal` is 1.
+
+    Sleeps on the value change instead of polling, so an idle wait costs
+    nothing per cycle.
+    """
+    while True:
+        await ReadOnly()
+        if signal.value == 1:
+            return
+        await RisingEdge(signal)
 
 
 @cocotb.coroutine
 async def monitor_req_from_falafel(
     dut, expected_addr=None, expected_data=None, expected_is_write=0
 ):
-    while True:
-        await ReadOnly()
-        if dut.mem_req_val_o.value == 1:
-            if expected_addr is not None:
-                assert dut.mem_req_addr_o == expected_addr, int(
-                    dut.mem_req_addr_o
-                )  # noqa
-            if expected_data is not None:
-                assert dut.mem_req_data_o == expected_data, int(
-                    dut.mem_req_data_o
-                )  # noqa
-            if expected_is_write != 0:
-                assert dut.mem_req_is_write_o == 1
-            break
-        await Timer(1, units="ns")
+    await wait_for_high(dut.mem_req_val_o)
+    if expected_addr is not None:
+        assert dut.mem_req_addr_o == expected_addr, int(dut.mem_req_addr_o)  # noqa
+    if expected_data is not None:
+        assert dut.mem_req_data_o == expected_data, int(dut.mem_req_data_o)  # noqa
+    if expected_is_write != 0:
+        assert dut.mem_req_is_write_o == 1
 
 
 @cocotb.coroutine
 async def monitor_falafel_ready(dut):
-    while True:
-        await ReadOnly()
-        if dut.mem_rsp_rdy_o.value == 1:
-            break
-        await Timer(1, units="ns")
+    await wait_for_high(dut.mem_rsp_rdy_o)
+
+
+async def watchdog(cycles, clk_period, units="ns", name="MAX_SIM_TIME"):
+    """Fails the test after `cycles` clock periods.
+
+    One Timer, no per-cycle wakeups.
+    """
+    await Timer(cycles * clk_period, units)
+    assert False, f"Surpassed {name} of {cycles} cycles"
+
+
+class MemReqMonitor:
+    """Passive monitor of the memory requests falafel hands over.
+
+    Every request taken on mem_req_val_o/mem_req_rdy_i goes into `queue` as
+    a MemTransaction (rsp_data is None, the monitor only sees requests),
+    stamped with the cycle of the handshake counted in clock periods of
+    `clk_period` since time 0. mem_req_val_o is a function of the LSU state
+    alone, so it only rises after a rising edge: the monitor sleeps until
+    it does and then samples at falling edges, like the memory agent, only
+    while a request is up.
+    """
+
+    def __init__(self, dut, clk, clk_period, units="ns"):
+        self.dut = dut
+        self.clk = clk
+        self.clk_period = clk_period
+        self.units = units
+        self.queue = Queue()
+        self._task = None
+
+    def start(self):
+        self._task = cocotb.start_soon(self._run())
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+
+    def cycle(self):
+        return int(get_sim_time(self.units) // self.clk_period)
+
+    async def _run(self):
+        dut = self.dut
+        while True:
+            if dut.mem_req_val_o.value != 1:
+                await RisingEdge(dut.mem_req_val_o)
+            await FallingEdge(self.clk)
+            await ReadOnly()
+            if dut.mem_req_val_o.value != 1 or dut.mem_req_rdy_i.value != 1:
+                continue
+            self.queue.put_nowait(
+                MemTransaction(
+                    self.cycle(),
+                    dut.mem_req_addr_o.value.integer,
+                    dut.mem_req_data_o.value.integer,
+                    dut.mem_req_is_write_o.value == 1,
+                    dut.mem_req_is_cas_o.value == 1,
+                    dut.mem_req_cas_exp_o.value.integer,
+                    None,
+                    dut.mem_req_is_burst_o.value == 1,
+                )
+            )
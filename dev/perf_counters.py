@@ -0,0 +1,133 @@
+"""Reads and decodes the perf counters of falafel_wrapper.
+
+The counters (falafel_perf_counters.sv) are read-only registers at
+PERF_COUNTER_ADDR + 8 * index; a REQ_ACCESS_REGISTER to one of them takes
+the usual data word, ignores it and answers with the counter on
+resp_data_o, in order with the alloc results. They count from reset.
+decode() works on raw values read any other way too, e.g. on the board:
+    python perf_counters.py ALLOCS FREES ALLOC_CYCLES ... (all 14, in order)
+"""
+
+import argparse
+
+import cocotb
+
+from mem_rsp import issue_wrapper_req, wait_for_wrapper_resp
+
+OPCODE_SIZE = 4
+MSG_ID_SIZE = 8
+REQ_ACCESS_REGISTER = 0
+
+PERF_COUNTER_ADDR = 0x100
+# in the order of the PERF_* indices in falafel_pkg.sv
+PERF_COUNTERS = [
+    "allocs",
+    "frees",
+    "alloc_cycles",
+    "alloc_max_cycles",
+    "free_cycles",
+    "free_max_cycles",
+    "headers_visited",
+    "cas_retries",
+    "mem_reqs",
+    "alloc_fifo_full_cycles",
+    "free_fifo_full_cycles",
+    "resp_fifo_full_cycles",
+    "header_cache_hits",
+    "header_cache_misses",
+]
+
+
+def perf_counter_addr(name):
+    return PERF_COUNTER_ADDR + 8 * PERF_COUNTERS.index(name)
+
+
+async def read_perf_counter(dut, clk, name, req_id=0, index=0):
+    """Reads one counter over header queue `index` of the wrapper."""
+    header = (
+        REQ_ACCESS_REGISTER
+        | (req_id << OPCODE_SIZE)
+        | (perf_counter_addr(name) << (OPCODE_SIZE + MSG_ID_SIZE))
+    )
+    # the answer may come out while the data word is still being taken
+    resp = cocotb.start_soon(wait_for_wrapper_resp(dut, clk))
+    await issue_wrapper_req(dut, clk, header, index=index)
+    await issue_wrapper_req(dut, clk, 0, index=index)
+    return await resp
+
+
+async def read_perf_counters(dut, clk, names=PERF_COUNTERS, index=0):
+    """Raw values of the counters in `names`, one request each.
+
+    The reads are not atomic: ops completing in between are counted by the
+    later reads only.
+    """
+    values = {}
+    for name in names:
+        values[name] = await read_perf_counter(dut, clk, name, index=index)
+    return values
+
+
+def decode(values):
+    """Counters by name plus derived figures.
+
+    `values` are the raw counters in PERF_COUNTERS order or by name.
+    """
+    if not isinstance(values, dict):
+        values = dict(zip(PERF_COUNTERS, values))
+    counters = dict(values)
+    allocs, frees = values.get("allocs", 0), values.get("frees", 0)
+    ops = allocs + frees
+
+    def ratio(name, total):
+        return values.get(name, 0) / total if total else 0.0
+
+    counters["alloc_mean_cycles"] = ratio("alloc_cycles", allocs)
+    counters["free_mean_cycles"] = ratio("free_cycles", frees)
+    counters["headers_per_op"] = ratio("headers_visited", ops)
+    counters["mem_reqs_per_op"] = ratio("mem_reqs", ops)
+    counters["cas_retries_per_op"] = ratio("cas_retries", ops)
+    hits = values.get("header_cache_hits", 0)
+    loads = hits + values.get("header_cache_misses", 0)
+    counters["header_cache_hit_rate"] = ratio("header_cache_hits", loads)
+    return counters
+
+
+def summary(counters):
+    return (
+        f"{counters['allocs']} allocs "
+        f"({counters['alloc_mean_cycles']:.1f} cycles mean, "
+        f"{counters['alloc_max_cycles']} max), {counters['frees']} frees "
+        f"({counters['free_mean_cycles']:.1f} mean, "
+        f"{counters['free_max_cycles']} max), "
+        f"{counters['headers_per_op']:.1f} headers/op, "
+        f"{counters['mem_reqs_per_op']:.1f} mem reqs/op, "
+        f"{counters['cas_retries']} CAS retries, FIFOs full for "
+        f"{counters['alloc_fifo_full_cycles']}/"
+        f"{counters['free_fifo_full_cycles']}/"
+        f"{counters['resp_fifo_full_cycles']} cycles (alloc/free/resp), "
+        f"header cache hit rate {counters['header_cache_hit_rate']:.1%}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "values",
+        nargs=len(PERF_COUNTERS),
+        type=lambda x: int(x, 0),
+        help="raw counter values: " + " ".join(PERF_COUNTERS),
+    )
+    args = parser.parse_args()
+    counters = decode(args.values)
+    for name, value in counters.items():
+        print(
+            f"{name:>24}: {value:.3f}"
+            if isinstance(value, float)
+            else f"{name:>24}: {value}"
+        )
+    print(summary(counters))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""Occupancy of the wrapper FIFOs and stalls of its request queues.
+
+Samples falafel_wrapper once per cycle: how many entries each of the alloc,
+free and response FIFOs holds (the NUM_OP_FIFO_ENTRIES of falafel_fifo_internal
+plus the output register of falafel_fifo), how many it takes in, and for
+every request queue the cycles req_val_i[i] waited with req_rdy_o[i] low.
+By Little's law the mean number of entries L and the arrival rate lambda
+give the mean cycles an entry spends in the FIFO, W = L / lambda.
+
+Set QUEUE_PROFILE to a .json path to enable it for every wrapper test that
+starts a MemoryAgent; profiles written by several tests (or regression
+jobs, see regress.py --profile-queues) are merged by
+    python queue_monitor.py PROFILE_OR_DIR...
+To pick FIFO depths, compare runs with -P NUM_OP_FIFO_ENTRIES=N.
+"""
+
+import argparse
+import json
+import os
+from collections import Counter
+
+import cocotb
+from cocotb.triggers import FallingEdge, ReadOnly
+
+from state_profiler import percentile
+
+PROFILE_FILE = "queue_profile.json"
+FIFOS = ("alloc", "free", "resp")
+
+
+class QueueProfile:
+    """Occupancy and stall histograms of one or more runs, mergeable."""
+
+    def __init__(self):
+        self.cycles = 0
+        self.capacity = {}  # fifo -> entries it can hold
+        # fifo -> entries -> cycles
+        self.occupancy = {fifo: Counter() for fifo in FIFOS}
+        self.arrivals = Counter()  # fifo -> entries written
+        # request queue -> cycles valid but not ready
+        self.stall_cycles = Counter()
+        self.words = Counter()  # request queue -> words taken
+        # request queue -> Counter(cycles a word waited -> words)
+        self.waits = {}
+
+    def mean_occupancy(self, fifo):
+        if not self.cycles:
+            return 0.0
+        hist = self.occupancy[fifo]
+        return sum(n * c for n, c in hist.items()) / self.cycles
+
+    def arrival_rate(self, fifo):
+        return self.arrivals[fifo] / self.cycles if self.cycles else 0.0
+
+    def residence(self, fifo):
+        """Little's law: mean cycles an entry spends in the FIFO."""
+        rate = self.arrival_rate(fifo)
+        return self.mean_occupancy(fifo) / rate if rate else 0.0
+
+    def merge(self, other):
+        self.cycles += other.cycles
+        for fifo, capacity in other.capacity.items():
+            # runs with different depths still merge, the largest is shown
+            self.capacity[fifo] = max(self.capacity.get(fifo, 0), capacity)
+        for fifo, hist in other.occupancy.items():
+            self.occupancy[fifo].update(hist)
+        self.arrivals.update(other.arrivals)
+        self.stall_cycles.update(other.stall_cycles)
+        self.words.update(other.words)
+        for queue, hist in other.waits.items():
+            self.waits.setdefault(queue, Counter()).update(hist)
+        return self
+
+    def as_dict(self):
+        def hist(h):
+            return {str(k): v for k, v in sorted(h.items())}
+
+        return {
+            "cycles": self.cycles,
+            "capacity": self.capacity,
+            "occupancy": {fifo: hist(h) for fifo, h in self.occupancy.items()},
+            "arrivals": dict(self.arrivals),
+            "stall_cycles": {str(q): n for q, n in self.stall_cycles.items()},
+            "words": {str(q): n for q, n in self.words.items()},
+            "waits": {str(q): hist(h) for q, h in self.waits.items()},
+            "residence": {fifo: self.residence(fifo) for fifo in FIFOS},
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        def hist(h):
+            return Counter({int(k): v for k, v in h.items()})
+
+        profile = cls()
+        profile.cycles = d["cycles"]
+        profile.capacity = dict(d["capacity"])
+        for fifo, h in d["occupancy"].items():
+            profile.occupancy[fifo] = hist(h)
+        profile.arrivals = Counter(d["arrivals"])
+        stall_cycles = {int(q): n for q, n in d["stall_cycles"].items()}
+        profile.stall_cycles = Counter(stall_cycles)
+        profile.words = Counter({int(q): n for q, n in d["words"].items()})
+        profile.waits = {int(q): hist(h) for q, h in d["waits"].items()}
+        return profile
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.as_dict(), f, indent=1)
+
+    def report(self):
+        cycles = self.cycles or 1
+        lines = [
+            f"{self.cycles} cycles",
+            f"  {'fifo':6} {'depth':>5} {'mean':>6} {'p50':>4} {'p99':>4} "
+            f"{'max':>4} {'full':>6} {'in/cycle':>9} {'W (cycles)':>10}",
+        ]
+        for fifo in FIFOS:
+            hist = self.occupancy[fifo]
+            if not hist:
+                continue
+            capacity = self.capacity.get(fifo, 0)
+            lines.append(
+                f"  {fifo:6} {capacity:5} {self.mean_occupancy(fifo):6.2f} "
+                f"{percentile(hist, 0.5):4} {percentile(hist, 0.99):4} "
+                f"{max(hist):4} {100 * hist[capacity] / cycles:5.1f}% "
+                f"{self.arrival_rate(fifo):9.4f} {self.residence(fifo):10.1f}"
+            )
+        for fifo in FIFOS:
+            hist = self.occupancy[fifo]
+            if hist:
+                items = sorted(hist.items())
+                shares = " ".join(f"{n}:{c / cycles:.1%}" for n, c in items)
+                lines.append(f"  {fifo} occupancy {shares}")
+        for queue in sorted(self.words):
+            waits = self.waits.get(queue, Counter())
+            words = self.words[queue]
+            stalls = self.stall_cycles[queue]
+            lines.append(
+                f"  queue {queue}: {words} words, {stalls} stall cycles "
+                f"({stalls / words:.2f}/word, "
+                f"p99 {percentile(waits, 0.99)}, "
+                f"max {max(waits, default=0)})"
+            )
+        return "\n".join(lines)
+
+
+class QueueMonitor:
+    """Samples the FIFOs and request handshakes of `wrapper` every cycle."""
+
+    def __init__(self, wrapper, clk):
+        self.wrapper = wrapper
+        self.clk = clk
+        self.profile = QueueProfile()
+        self.entries = int(getattr(wrapper, "NUM_OP_FIFO_ENTRIES", 4))
+        for fifo in FIFOS:
+            self.profile.capacity[fifo] = self.entries + 1
+        self._task = None
+
+    def start(self):
+        self._task = cocotb.start_soon(self._run())
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+
+    def _occupancy(self, fifo):
+        internal = fifo.i_falafel_fifo_internal
+        read_addr = int(internal.read_addr_q.value)
+        write_addr = int(internal.write_addr_q.value)
+        if read_addr == write_addr:
+            stored = self.entries if internal.is_last_write_q.value == 1 else 0
+        else:
+            stored = (write_addr - read_addr) % self.entries
+        return stored + (0 if fifo.empty_q.value == 1 else 1)
+
+    async def _run(self):
+        wrapper = self.wrapper
+        profile = self.profile
+        fifos = {
+            "alloc": wrapper.i_alloc_fifo,
+            "free": wrapper.i_free_fifo,
+            "resp": wrapper.i_resp_fifo,
+        }
+        num_queues = len(wrapper.req_val_i)
+        # cycles the current word of each queue waited
+        waiting = [0] * num_queues
+        while True:
+            await FallingEdge(self.clk)
+            await ReadOnly()
+            if wrapper.rst_ni.value == 0:
+                continue
+            profile.cycles += 1
+            for name, fifo in fifos.items():
+                profile.occupancy[name][self._occupancy(fifo)] += 1
+                if fifo.write_i.value == 1:
+                    profile.arrivals[name] += 1
+            for i in range(num_queues):
+                if wrapper.req_val_i[i].value != 1:
+                    continue
+                if wrapper.req_rdy_o[i].value == 1:
+                    profile.words[i] += 1
+                    profile.waits.setdefault(i, Counter())[waiting[i]] += 1
+                    waiting[i] = 0
+                else:
+                    profile.stall_cycles[i] += 1
+                    waiting[i] += 1
+
+
+# paths this process already wrote, later tests merge into them
+_saved = set()
+
+
+def from_env(dut, clk):
+    """A started QueueMonitor, or None.
+
+    None unless QUEUE_PROFILE is set and `dut` is the wrapper.
+    """
+    if not os.environ.get("QUEUE_PROFILE") or not hasattr(dut, "i_resp_fifo"):
+        return None
+    return QueueMonitor(dut, clk).start()
+
+
+def save(monitor):
+    path = os.environ["QUEUE_PROFILE"]
+    profile = monitor.profile
+    if path in _saved and os.path.exists(path):
+        profile = QueueProfile.load(path).merge(profile)
+    profile.save(path)
+    _saved.add(path)
+
+
+def merge_files(paths):
+    """Merges profiles, directories are searched for PROFILE_FILE."""
+    profile = QueueProfile()
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                if PROFILE_FILE in files:
+                    found = os.path.join(root, PROFILE_FILE)
+                    profile.merge(QueueProfile.load(found))
+        else:
+            profile.merge(QueueProfile.load(path))
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        help="profiles or directories to merge",
+    )
+    args = parser.parse_args()
+    print(merge_files(args.paths).report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,607 @@
+from bisect import bisect_left, bisect_right, insort
+
+# mirrors falafel_pkg
+FIRST_FIT = 0
+BEST_FIT = 1
+NEXT_FIT = 2
+SEGREGATED_FIT = 3
+
+NUM_SIZE_CLASSES = 4
+DATA_W = 64
+ALLOC_STRATEGY_W = 32
+
+WORD_SIZE = 8
+BLOCK_NEXT_ADDR_OFFSET = WORD_SIZE
+BLOCK_HEADER_SIZE = 16
+MIN_PAYLOAD_SIZE = 0
+MIN_ALLOC_SIZE = BLOCK_HEADER_SIZE + MIN_PAYLOAD_SIZE
+
+MERGE_NONE = "none"
+MERGE_LEFT = "left"
+MERGE_RIGHT = "right"
+MERGE_BOTH = "both"
+
+CHUNK_SIZE = 256
+
+
+# config_regs_t from the LSB: lock_id, lock_ptr, free_list_ptr,
+# alloc_strategy, then the size class pointers and limits
+CONFIG_SIZE_CLASS_PTR_LSB = 3 * DATA_W + ALLOC_STRATEGY_W
+_SIZE_CLASS_PTRS_W = NUM_SIZE_CLASSES * DATA_W
+CONFIG_SIZE_CLASS_LIMIT_LSB = CONFIG_SIZE_CLASS_PTR_LSB + _SIZE_CLASS_PTRS_W
+
+
+def pack_config(
+    free_list_ptr, lock_ptr, lock_id, size_class_ptrs=(), size_class_limits=()
+):
+    """falafel_config_i (config_regs_t) with alloc_strategy left at 0."""
+    value = (free_list_ptr << (2 * DATA_W)) | (lock_ptr << DATA_W) | lock_id
+    for i, ptr in enumerate(size_class_ptrs):
+        value |= ptr << (CONFIG_SIZE_CLASS_PTR_LSB + i * DATA_W)
+    for i, limit in enumerate(size_class_limits):
+        value |= limit << (CONFIG_SIZE_CLASS_LIMIT_LSB + i * DATA_W)
+    return value
+
+
+def unpack_config(value):
+    """The arguments of pack_config that give `value`, alloc_strategy aside."""
+    mask = (1 << DATA_W) - 1
+
+    def word(lsb):
+        return (value >> lsb) & mask
+
+    def words(lsb, count):
+        return tuple(word(lsb + i * DATA_W) for i in range(count))
+
+    ptrs = words(CONFIG_SIZE_CLASS_PTR_LSB, NUM_SIZE_CLASSES)
+    limits = words(CONFIG_SIZE_CLASS_LIMIT_LSB, NUM_SIZE_CLASSES - 1)
+    return word(2 * DATA_W), word(DATA_W), word(0), ptrs, limits
+
+
+class FreeBlockIndex:
+    """Address-ordered free blocks with a size index.
+
+    Addresses are kept in sorted chunks of up to 2 * CHUNK_SIZE carrying the
+    largest block size they hold, so first fit only descends into the first
+    chunk that can satisfy the request. (size, addr) pairs are kept sorted
+    for best fit. This is not logarithmic: first fit and position() scan
+    the chunk list, O(n / CHUNK_SIZE), and the sorted lists are updated
+    with insort/del, O(n) element moves; both are cheap next to the
+    simulation for the heaps the tests build.
+    """
+
+    def __init__(self):
+        self.sizes = {}
+        self._chunks = []
+        self._firsts = []
+        self._maxes = []
+        self._by_size = []
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def __contains__(self, addr):
+        return addr in self.sizes
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            yield from chunk
+
+    def _locate(self, addr):
+        i = bisect_right(self._firsts, addr) - 1
+        return max(i, 0)
+
+    def _refresh(self, i):
+        chunk = self._chunks[i]
+        self._firsts[i] = chunk[0]
+        self._maxes[i] = max(self.sizes[a] for a in chunk)
+
+    def insert(self, addr, size):
+        assert addr not in self.sizes, f"block {addr} is already free"
+        self.sizes[addr] = size
+        insort(self._by_size, (size, addr))
+        if not self._chunks:
+            self._chunks.append([addr])
+            self._firsts.append(addr)
+            self._maxes.append(size)
+            return
+        i = self._locate(addr)
+        chunk = self._chunks[i]
+        insort(chunk, addr)
+        if len(chunk) > 2 * CHUNK_SIZE:
+            self._chunks[i] = chunk[:CHUNK_SIZE]
+            self._chunks.insert(i + 1, chunk[CHUNK_SIZE:])
+            self._firsts.insert(i + 1, 0)
+            self._maxes.insert(i + 1, 0)
+            self._refresh(i + 1)
+        self._refresh(i)
+
+    def extend(self, blocks):
+        """Inserts (addr, size) pairs, rebuilding the chunks only once."""
+        blocks = list(blocks)
+        for addr, size in blocks:
+            assert addr not in self.sizes, f"block {addr} is already free"
+            self.sizes[addr] = size
+        self._by_size += [(size, addr) for addr, size in blocks]
+        self._by_size.sort()
+        addrs = sorted(self.sizes)
+        self._chunks = []
+        for start in range(0, len(addrs), CHUNK_SIZE):
+            end = start + CHUNK_SIZE
+            self._chunks.append(addrs[start:end])
+        self._firsts = [chunk[0] for chunk in self._chunks]
+        sizes = self.sizes
+        self._maxes = [max(sizes[a] for a in chunk) for chunk in self._chunks]
+
+    def remove(self, addr):
+        size = self.sizes.pop(addr)
+        del self._by_size[bisect_left(self._by_size, (size, addr))]
+        i = self._locate(addr)
+        chunk = self._chunks[i]
+        del chunk[bisect_left(chunk, addr)]
+        if chunk:
+            self._refresh(i)
+        else:
+            del self._chunks[i]
+            del self._firsts[i]
+            del self._maxes[i]
+        return size
+
+    def resize(self, addr, size):
+        self.remove(addr)
+        self.insert(addr, size)
+
+    def first(self):
+        return self._chunks[0][0] if self._chunks else None
+
+    def prev(self, addr):
+        # largest free address strictly below addr
+        i = self._locate(addr)
+        while i >= 0:
+            chunk = self._chunks[i]
+            j = bisect_left(chunk, addr)
+            if j > 0:
+                return chunk[j - 1]
+            i -= 1
+        return None
+
+    def next(self, addr):
+        # smallest free address strictly above addr
+        i = self._locate(addr)
+        while i < len(self._chunks):
+            chunk = self._chunks[i]
+            j = bisect_right(chunk, addr)
+            if j < len(chunk):
+                return chunk[j]
+            i += 1
+        return None
+
+    def position(self, addr):
+        i = self._locate(addr)
+        before = sum(len(chunk) for chunk in self._chunks[:i])
+        return before + bisect_left(self._chunks[i], addr)
+
+    def first_fit(self, size, start=None):
+        # lowest address at or above `start` that fits
+        first = 0 if start is None else self._locate(start)
+        for i in range(first, len(self._chunks)):
+            if self._maxes[i] >= size:
+                for addr in self._chunks[i]:
+                    if start is not None and addr < start:
+                        continue
+                    if self.sizes[addr] >= size:
+                        return addr
+        return None
+
+    def best_fit(self, size):
+        # ties go to the lowest address, as the core only replaces strictly
+        # smaller differences while walking the list in address order
+        i = bisect_left(self._by_size, (size, -1))
+        if i == len(self._by_size):
+            return None
+        return self._by_size[i][1]
+
+    def lowest_fit_within(self, size, slack):
+        # lowest address whose size is in [size, size + slack)
+        i = bisect_left(self._by_size, (size, -1))
+        j = bisect_left(self._by_size, (size + slack, -1))
+        return min((addr for _, addr in self._by_size[i:j]), default=None)
+
+
+class AllocResult:
+    def __init__(self, addr, fit_addr, split, visited):
+        self.addr = addr
+        self.fit_addr = fit_addr
+        self.split = split
+        self.visited = visited
+
+    def __str__(self):
+        return (
+            f"AllocResult(addr={self.addr}, fit_addr={self.fit_addr}, "
+            f"split={self.split}, visited={self.visited})"
+        )
+
+
+class FreeResult:
+    def __init__(self, addr, merge, visited):
+        self.addr = addr
+        self.merge = merge
+        self.visited = visited
+
+    def __str__(self):
+        return (
+            f"FreeResult(addr={self.addr}, merge={self.merge}, "
+            f"visited={self.visited})"
+        )
+
+
+class RefAllocator:
+    """Golden model of falafel_core.
+
+    Follows set_headers_after_fit and the FREE_CHECK_NEIGHBORS/merge paths
+    on an ascending-address free list. `touched` holds the header addresses
+    written by the last operation so a scoreboard can check only those.
+    """
+
+    def __init__(self, free_list_ptr, best_fit_stop_unsplittable=False):
+        self.free_list_ptr = free_list_ptr
+        # the BEST_FIT_STOP_UNSPLITTABLE parameter of falafel_core
+        self.best_fit_stop_unsplittable = best_fit_stop_unsplittable
+        # (prev, addr) next fit resumes from, prev is None for the list head
+        self.rover = None
+        self.free = FreeBlockIndex()
+        self.allocated = {}  # header addr -> (size, next_addr) left in memory
+        self.touched = []
+
+    def add_free_block(self, addr, size):
+        self.free.insert(addr, size)
+
+    def add_free_blocks(self, blocks):
+        self.free.extend(blocks)
+
+    def add_allocated_block(self, addr, size, next_addr=0):
+        self.allocated[addr] = (size, next_addr)
+
+    def add_separated_blocks(
+        self, free_sizes, addr, allocated_size=32, allocated_first=False
+    ):
+        """Free blocks of `free_sizes` from `addr` on, each followed (or
+        preceded) by an allocated block so no two of them can merge.
+
+        Returns the address after the last block.
+        """
+        for size in free_sizes:
+            if allocated_first:
+                self.add_allocated_block(addr, allocated_size)
+                addr += BLOCK_HEADER_SIZE + allocated_size
+            self.add_free_block(addr, size)
+            addr += BLOCK_HEADER_SIZE + size
+            if not allocated_first:
+                self.add_allocated_block(addr, allocated_size)
+                addr += BLOCK_HEADER_SIZE + allocated_size
+        return addr
+
+    def next_addr(self, addr):
+        next_addr = self.free.next(addr)
+        return 0 if next_addr is None else next_addr
+
+    def header(self, addr):
+        if addr in self.free:
+            return self.free.sizes[addr], self.next_addr(addr)
+        return self.allocated[addr]
+
+    def lists(self):
+        """(first header pointer address, FreeBlockIndex) per free list."""
+        return [(self.free_list_ptr, self.free)]
+
+    def num_free_blocks(self):
+        return sum(len(index) for _, index in self.lists())
+
+    def free_list(self, index=None):
+        index = self.free if index is None else index
+        return [(a, index.sizes[a], index.next(a) or 0) for a in index]
+
+    def fragmentation(self):
+        sizes = [s for _, index in self.lists() for s in index.sizes.values()]
+        free_bytes = sum(sizes)
+        largest = max(sizes, default=0)
+        # share of free memory unusable by a single request
+        unusable = 1 - largest / free_bytes if free_bytes else 0.0
+        return {
+            "free_blocks": len(sizes),
+            "free_bytes": free_bytes,
+            "largest_free_block": largest,
+            "allocated_blocks": len(self.allocated),
+            "external_fragmentation": unusable,
+        }
+
+    def best_fit_stops_at(self, fit_size, size):
+        # the best fit walk ends early on an exact fit, and with
+        # BEST_FIT_STOP_UNSPLITTABLE on any fit too small to split
+        if self.best_fit_stop_unsplittable:
+            return fit_size - size < MIN_ALLOC_SIZE
+        return fit_size == size
+
+    def find_fit(self, size, strategy):
+        if strategy == BEST_FIT:
+            if self.best_fit_stop_unsplittable:
+                fit = self.free.lowest_fit_within(size, MIN_ALLOC_SIZE)
+                if fit is not None:
+                    return fit
+            return self.free.best_fit(size)
+        if strategy == NEXT_FIT and self.rover is not None:
+            fit = self.free.first_fit(size, start=self.rover[1])
+            if fit is not None:
+                return fit
+        return self.free.first_fit(size)
+
+    def can_alloc(self, size, strategy):
+        return self.find_fit(size, strategy) is not None
+
+    def alloc(self, size, strategy=FIRST_FIT):
+        fit = self.find_fit(size, strategy)
+        assert fit is not None, f"no fit for {size}, falafel runs off the list"
+        fit_size = self.free.sizes[fit]
+        fit_next = self.next_addr(fit)
+        prev = self.free.prev(fit)
+        if strategy == BEST_FIT and not self.best_fit_stops_at(fit_size, size):
+            visited = len(self.free)
+        elif strategy == NEXT_FIT and self.rover is not None:
+            rover_prev, rover = self.rover
+            assert (
+                self.free.prev(rover) == rover_prev
+            ), f"stale next fit rover {self.rover}"
+            start = self.free.position(rover)
+            visited = self.free.position(fit) - start + 1
+            if fit < rover:  # wrapped around to the head of the list
+                visited += len(self.free)
+        else:
+            visited = self.free.position(fit) + 1
+
+        self.free.remove(fit)
+        split = fit_size - size >= MIN_ALLOC_SIZE
+        if split:
+            new_addr = fit + BLOCK_HEADER_SIZE + size
+            self.free.insert(new_addr, fit_size - size - BLOCK_HEADER_SIZE)
+            self.allocated[fit] = (size, 0)
+            self.touched = [fit, new_addr]
+        else:
+            self.allocated[fit] = (fit_size, fit_next)
+            self.touched = []
+        self.touched.append(self.free_list_ptr if prev is None else prev)
+        if strategy != NEXT_FIT:
+            self.rover = None
+        elif split:
+            self.rover = (prev, new_addr)
+        else:
+            self.rover = (prev, fit_next) if fit_next else None
+        return AllocResult(fit + BLOCK_HEADER_SIZE, fit, split, visited)
+
+    def can_free(self, addr):
+        header = addr - BLOCK_HEADER_SIZE
+        return header in self.allocated and len(self.free) > 0
+
+    def free_block(self, addr):
+        header = addr - BLOCK_HEADER_SIZE
+        assert header in self.allocated, f"{addr} is not allocated"
+        assert len(self.free) > 0, f"free list is empty, cannot free {addr}"
+        right = self.free.next(header)
+        size, _ = self.allocated.pop(header)
+
+        # curr is the free block left of the target, or the free list pointer
+        curr = self.free.prev(header)
+        if curr is None:
+            curr_addr, curr_size = 0, 0
+            visited = 1
+        else:
+            curr_addr, curr_size = curr, self.free.sizes[curr]
+            visited = self.free.position(curr) + 1
+
+        does_merge_right = right is not None and addr + size == right
+        does_merge_left = curr_addr + BLOCK_HEADER_SIZE + curr_size == header
+        assert not (
+            does_merge_left and curr is None
+        ), "merge into the free list pointer"
+        # the freed block lands right after the header before the rover, or
+        # merges it away, so next fit restarts from the head
+        if self.rover is not None:
+            rover = self.rover[0]
+            if curr == rover or (does_merge_right and right == rover):
+                self.rover = None
+
+        if does_merge_left and does_merge_right:
+            right_size = self.free.remove(right)
+            merged_size = curr_size + right_size + size + 2 * BLOCK_HEADER_SIZE
+            self.free.resize(curr, merged_size)
+            self.touched = [curr]
+            merge = MERGE_BOTH
+        elif does_merge_right:
+            right_size = self.free.remove(right)
+            self.free.insert(header, right_size + size + BLOCK_HEADER_SIZE)
+            self.touched = [header]
+            merge = MERGE_RIGHT
+        elif does_merge_left:
+            self.free.resize(curr, curr_size + size + BLOCK_HEADER_SIZE)
+            self.touched = [curr]
+            merge = MERGE_LEFT
+        else:
+            self.free.insert(header, size)
+            self.touched = [header]
+            merge = MERGE_NONE
+        if merge in (MERGE_RIGHT, MERGE_NONE):
+            self.touched.append(self.free_list_ptr if curr is None else curr)
+        return FreeResult(addr, merge, visited)
+
+
+class SegregatedRefAllocator(RefAllocator):
+    """Golden model of falafel_core with SEGREGATED_FIT.
+
+    One ascending-address free list per size class: class i takes sizes
+    below `size_class_limits[i]`, the last class the rest, and the word at
+    `size_class_ptrs[i]` holds its first header. An alloc walks the list of
+    its class first fit and goes on with the next class at the end of a
+    list; the remainder of a split stays in the list of its block. A free
+    goes to the list of the class of its block and merges only with the
+    neighbors on that list. The core updates a list pointer as a header,
+    overwriting the word after it, so the pointers must be at least
+    BLOCK_HEADER_SIZE apart.
+    """
+
+    def __init__(self, size_class_ptrs, size_class_limits):
+        assert len(size_class_ptrs) == NUM_SIZE_CLASSES, size_class_ptrs
+        limits = list(size_class_limits)
+        assert len(limits) == NUM_SIZE_CLASSES - 1, limits
+        assert limits == sorted(limits), limits
+        ptrs = sorted(size_class_ptrs)
+        assert all(
+            b - a >= BLOCK_HEADER_SIZE for a, b in zip(ptrs, ptrs[1:])
+        ), f"size class pointers {size_class_ptrs} less than 16 bytes apart"
+        super().__init__(size_class_ptrs[0])
+        self.size_class_ptrs = list(size_class_ptrs)
+        self.size_class_limits = list(size_class_limits)
+        self.classes = [FreeBlockIndex() for _ in size_class_ptrs]
+        self._select(0)
+
+    def _select(self, size_class):
+        # the RefAllocator methods work on the list of this class
+        self.free = self.classes[size_class]
+        self.free_list_ptr = self.size_class_ptrs[size_class]
+
+    def size_class(self, size):
+        for i, limit in enumerate(self.size_class_limits):
+            if size < limit:
+                return i
+        return NUM_SIZE_CLASSES - 1
+
+    def lists(self):
+        return list(zip(self.size_class_ptrs, self.classes))
+
+    def add_free_block(self, addr, size):
+        self.classes[self.size_class(size)].insert(addr, size)
+
+    def add_free_blocks(self, blocks):
+        for addr, size in blocks:
+            self.add_free_block(addr, size)
+
+    def header(self, addr):
+        for i, index in enumerate(self.classes):
+            if addr in index:
+                self._select(i)
+                break
+        return super().header(addr)
+
+    def can_alloc(self, size, strategy=SEGREGATED_FIT):
+        first = self.size_class(size)
+        for index in self.classes[first:]:
+            if index.first_fit(size) is not None:
+                return True
+        return False
+
+    def alloc(self, size, strategy=SEGREGATED_FIT):
+        assert (
+            strategy == SEGREGATED_FIT
+        ), f"segregated free lists cannot serve {strategy}"
+        visited = 0  # headers of the classes that had no fit
+        for size_class in range(self.size_class(size), NUM_SIZE_CLASSES):
+            self._select(size_class)
+            if self.free.first_fit(size) is not None:
+                break
+            visited += len(self.free)
+        result = super().alloc(size, FIRST_FIT)
+        result.visited += visited
+        return result
+
+    def can_free(self, addr):
+        return addr - BLOCK_HEADER_SIZE in self.allocated
+
+    def free_block(self, addr):
+        header = addr - BLOCK_HEADER_SIZE
+        assert header in self.allocated, f"{addr} is not allocated"
+        size = self.allocated[header][0]
+        self._select(self.size_class(size))
+        if len(self.free):
+            return super().free_block(addr)
+        # the class is empty, the block becomes its only header
+        del self.allocated[header]
+        self.free.insert(header, size)
+        self.touched = [header, self.free_list_ptr]
+        return FreeResult(addr, MERGE_NONE, 0)
+
+
+class Scoreboard:
+    """Checks falafel results and memory against RefAllocator after each op.
+
+    Only the headers touched by an op are compared by default; a full walk
+    of the free list is done every `full_check_interval` ops (0 disables it)
+    and by check_heap().
+    """
+
+    def __init__(self, model, mem, full_check_interval=0):
+        self.model = model
+        self.mem = mem
+        self.full_check_interval = full_check_interval
+        self.num_ops = 0
+        self.num_allocs = 0
+        self.num_frees = 0
+        self.merges = {
+            MERGE_NONE: 0,
+            MERGE_LEFT: 0,
+            MERGE_RIGHT: 0,
+            MERGE_BOTH: 0,
+        }
+
+    def check_alloc(self, size, strategy, result):
+        expected = self.model.alloc(size, strategy)
+        assert (
+            result == expected.addr
+        ), f"alloc({size}) returned {result}, expected {expected}"
+        self.num_allocs += 1
+        self._after_op()
+        return expected
+
+    def check_free(self, addr):
+        expected = self.model.free_block(addr)
+        self.merges[expected.merge] += 1
+        self.num_frees += 1
+        self._after_op()
+        return expected
+
+    def _after_op(self):
+        self.num_ops += 1
+        for addr in self.model.touched:
+            self.check_header(addr)
+        interval = self.full_check_interval
+        if interval and self.num_ops % interval == 0:
+            self.check_heap()
+
+    def check_header(self, addr):
+        model = self.model
+        for ptr, index in model.lists():
+            if addr == ptr:
+                first = index.first()
+                expected = 0 if first is None else first
+                actual = self.mem.read_word(addr)
+                assert (
+                    actual == expected
+                ), f"free list pointer {addr}: {actual} != {expected}"
+                return
+        expected = model.header(addr)
+        actual = self.mem.read_header(addr)
+        assert actual == expected, f"header {addr}: {actual} != {expected}"
+
+    def check_heap(self):
+        for ptr, index in self.model.lists():
+            actual = self.mem.walk_free_list(ptr, len(index) + 1)
+            expected = self.model.free_list(index)
+            assert (
+                actual == expected
+            ), f"free list at {ptr} diverged at op {self.num_ops}"
+        for addr in self.model.allocated:
+            self.check_header(addr)
+
+    def report(self):
+        print(
+            f"Scoreboard: {self.num_ops} ops ({self.num_allocs} alloc, "
+            f"{self.num_frees} free), "
+            f"merges {self.merges}, {self.model.num_free_blocks()} free blocks"
+        )
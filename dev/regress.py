@@ -0,0 +1,498 @@
+"""Parallel regression runner.
+
+Builds every toplevel once with Verilator (through cocotb-test), caches the
+build under sim_cache/ keyed by the hash of the .sv sources, the parameters
+and the compile arguments, then runs each test and seed as its own job in a
+process pool. Every job gets its own directory under regress_results/ and
+the results are merged into one report. Tests a module's SKIP_IF rules out
+on a build are reported as SKIP without being run.
+
+    python regress.py                        # whole regression, one seed
+    python regress.py -j 8 --seeds 4 -k stress
+    python regress.py -P NUM_ALLOC_QUEUES=2 -k test_falafel_wrapper
+    python regress.py -k HEADER_BURST=1      # only the parameterized build
+    python regress.py -m falafel_wrapper:bench_throughput -P NUM_FREE_QUEUES=2
+    python regress.py --profile-states      # + state_profile.txt/.folded
+    python regress.py --profile-queues      # + queue_profile.txt
+    python regress.py --profile-sim         # + sim_profile.txt/.pstat
+    python regress.py --waves -k test_stress_alloc_free   # + dump.fst per job
+    python regress.py --build-profile fast -k stress
+    python regress.py --build-profile threads --threads 4 -k wrapper
+"""
+
+import argparse
+import hashlib
+import importlib
+import logging
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+import cocotb
+from cocotb_test.simulator import Verilator
+
+import queue_monitor
+import sim_profile
+import state_profiler
+
+DEV_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(DEV_DIR, "sim_cache")
+RESULTS_DIR = os.path.join(DEV_DIR, "regress_results")
+
+# (toplevel, module, parameters) run by default, -P adds to the parameters;
+# the parameterized builds run the tests skipped on the default one
+REGRESSION = [
+    ("falafel", "test_falafel", {}),
+    ("falafel_wrapper", "test_falafel_wrapper", {}),
+    ("falafel", "test_stress", {}),
+    ("falafel_wrapper", "test_stress", {}),
+    ("falafel", "test_falafel", {"HEADER_BURST": "1"}),
+    ("falafel", "test_falafel", {"MAX_BATCH_OPS": "4"}),
+    ("falafel_wrapper", "test_falafel_wrapper", {"MAX_BATCH_OPS": "4"}),
+    ("falafel", "test_falafel", {"HEADER_CACHE_ENTRIES": "4"}),
+]
+
+# tracing is opt-in (--waves), as with WAVES=1 in the Makefile
+COMPILE_ARGS = ""
+TRACE_ARGS = ["--trace-fst", "--trace-structs"]
+
+THREADS_MAIN = os.path.join(DEV_DIR, "verilator_threads.cpp")
+
+# named Verilator build profiles, the same as BUILD_PROFILE in the Makefile;
+# bench_sim_speed.py compares their simulation speed
+FAST_ARGS = [
+    "-O3",
+    "--x-assign",
+    "fast",
+    "--x-initial",
+    "fast",
+    "--noassert",
+    "-CFLAGS",
+    "-O3",
+]
+# X assignments can be randomized at runtime with +verilator+rand+reset+2
+DEBUG_ARGS = ["--assert", "--x-assign", "unique", "-CFLAGS", "-Og -g"]
+# for the wrapper with many queues; verilator_threads.cpp sets the thread
+# count of the simulation, which would otherwise be the number of CPUs
+THREADS_ARGS = [
+    "--threads",
+    "{threads}",
+    "-CFLAGS",
+    "-DSIM_THREADS={threads}",
+    THREADS_MAIN,
+]
+BUILD_PROFILES = {
+    "default": [],
+    "debug": DEBUG_ARGS + TRACE_ARGS,
+    "fast": FAST_ARGS,
+    "threads": FAST_ARGS + THREADS_ARGS,
+}
+
+
+def profile_args(profile, threads=2):
+    """Verilator arguments of a build profile."""
+    return [arg.format(threads=threads) for arg in BUILD_PROFILES[profile]]
+
+
+class CachedVerilator(Verilator):
+    """cocotb-test's Verilator flow, minus the rebuild before every run."""
+
+    def set_env(self):
+        super().set_env()
+        # cocotb-test forces -std=c++11, Verilator 5 needs C++14 or newer
+        cxxflags = self.env.get("CXXFLAGS", "")
+        self.env["CXXFLAGS"] = cxxflags.replace(" -std=c++11", "")
+
+    def build_command(self):
+        cmds = super().build_command()
+        if self.compile_only:
+            return cmds
+        return cmds[-1:]
+
+
+class Job:
+    def __init__(self, toplevel, module, test, seed, parameters=None):
+        self.toplevel = toplevel
+        self.module = module
+        self.test = test
+        self.seed = seed
+        self.parameters = parameters or {}
+
+    @property
+    def build(self):
+        """Toplevel and parameters, jobs with the same build share it."""
+        params = sorted(self.parameters.items())
+        return self.toplevel + "".join(f"-{k}={v}" for k, v in params)
+
+    @property
+    def name(self):
+        return f"{self.build}.{self.module}.{self.test}.s{self.seed}"
+
+
+def discover_tests(module):
+    with open(os.path.join(DEV_DIR, module + ".py")) as f:
+        source = f.read()
+    return re.findall(r"@cocotb\.test\(.*\)\s*\nasync def (\w+)", source)
+
+
+def skipped(job):
+    """True if the SKIP_IF of the job's module rules it out on its build.
+
+    cocotb runs a test named in TESTCASE even when it is marked skip, so
+    the jobs of skipped tests are not started at all.
+    """
+    skip_if = getattr(importlib.import_module(job.module), "SKIP_IF", {})
+    rule = skip_if.get(job.test)
+    return rule is not None and bool(rule(SimpleNamespace(**job.parameters)))
+
+
+def build_key(toplevel, parameters, compile_args):
+    h = hashlib.sha256()
+    for path in sorted(os.listdir(DEV_DIR)):
+        if path.endswith((".sv", ".cpp")):
+            h.update(path.encode())
+            with open(os.path.join(DEV_DIR, path), "rb") as f:
+                h.update(f.read())
+    verilator = subprocess.run(
+        ["verilator", "--version"], capture_output=True, text=True
+    )
+    h.update(verilator.stdout.encode())
+    h.update(cocotb.__version__.encode())
+    key = (toplevel, sorted(parameters.items()), compile_args)
+    h.update(repr(key).encode())
+    return h.hexdigest()[:16]
+
+
+def simulator(
+    toplevel, module, sim_build, work_dir, parameters, compile_args, **kwargs
+):
+    if any(arg in TRACE_ARGS for arg in compile_args):
+        # the cocotb main of a traced model only dumps when asked to
+        kwargs["plus_args"] = ["--trace"]
+    return CachedVerilator(
+        toplevel=toplevel,
+        module=module,
+        verilog_sources=[os.path.join(DEV_DIR, toplevel + ".sv")],
+        includes=[DEV_DIR],
+        python_search=[DEV_DIR],
+        parameters=parameters,
+        compile_args=compile_args,
+        sim_build=sim_build,
+        work_dir=work_dir,
+        **kwargs,
+    )
+
+
+def log_to(path):
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.FileHandler(path, mode="w"))
+    root.setLevel(logging.INFO)
+
+
+def build(toplevel, parameters, compile_args):
+    key = build_key(toplevel, parameters, compile_args)
+    sim_build = os.path.join(CACHE_DIR, f"{toplevel}-{key}")
+    stamp = os.path.join(sim_build, "build.ok")
+    if os.path.exists(stamp):
+        return toplevel, sim_build, True
+    shutil.rmtree(sim_build, ignore_errors=True)
+    os.makedirs(sim_build)
+    log_to(os.path.join(sim_build, "build.log"))
+    sim = simulator(
+        toplevel,
+        "",
+        sim_build,
+        sim_build,
+        parameters,
+        compile_args,
+        compile_only=True,
+    )
+    sim.run()
+    with open(stamp, "w") as f:
+        f.write(key + "\n")
+    return toplevel, sim_build, False
+
+
+def run_job(
+    job,
+    sim_build,
+    out_dir,
+    parameters,
+    compile_args,
+    timeout,
+    profile_states,
+    profile_queues,
+    profile_sim,
+):
+    job_dir = os.path.join(out_dir, job.name)
+    os.makedirs(job_dir)
+    results_file = os.path.join(job_dir, "results.xml")
+    # each job runs in its own process, so the per-job settings can go in
+    # os.environ, which cocotb-test copies over its own env
+    os.environ["TESTCASE"] = job.test
+    os.environ["RANDOM_SEED"] = str(job.seed)
+    os.environ["COCOTB_RESULTS_FILE"] = results_file
+    if profile_states:
+        profile = os.path.join(job_dir, state_profiler.PROFILE_FILE)
+        os.environ["STATE_PROFILE"] = profile
+    if profile_queues:
+        profile = os.path.join(job_dir, queue_monitor.PROFILE_FILE)
+        os.environ["QUEUE_PROFILE"] = profile
+    if profile_sim:
+        # cocotb writes test_profile.pstat to the job directory
+        os.environ["COCOTB_ENABLE_PROFILING"] = "1"
+    log_to(os.path.join(job_dir, "sim.log"))
+
+    start = time.time()
+    sim = simulator(
+        job.toplevel, job.module, sim_build, job_dir, parameters, compile_args
+    )
+
+    # a hung simulation is killed and reported as an error
+    def kill():
+        if sim.process:
+            sim.process.kill()
+
+    watchdog = threading.Timer(timeout, kill)
+    watchdog.start()
+    try:
+        sim.run()
+    except SystemExit:
+        pass  # failures are read back from the results file
+    finally:
+        watchdog.cancel()
+    result = {
+        "job": job,
+        "status": "ERROR",
+        "sim_time_ns": 0.0,
+        "real_time_s": time.time() - start,
+        "message": "",
+    }
+    if not os.path.isfile(results_file):
+        result["message"] = "simulation terminated abnormally"
+        return result
+    for testcase in ET.parse(results_file).iter("testcase"):
+        failure = testcase.find("failure")
+        if failure is not None:
+            result["status"] = "FAIL"
+            result["message"] = failure.get("message", "")
+        elif testcase.find("skipped") is not None:
+            result["status"] = "SKIP"
+        else:
+            result["status"] = "PASS"
+        result["sim_time_ns"] = float(testcase.get("sim_time_ns", 0))
+    return result
+
+
+def write_report(out_dir, results):
+    suite = ET.Element("testsuite", name="falafel regression")
+    lines = []
+    width = max((len(r["job"].build) for r in results), default=0)
+    for r in results:
+        job = r["job"]
+        testcase = ET.SubElement(
+            suite,
+            "testcase",
+            classname=f"{job.build}.{job.module}",
+            name=f"{job.test}[seed={job.seed}]",
+            time=f"{r['real_time_s']:.2f}",
+            sim_time_ns=str(r["sim_time_ns"]),
+        )
+        if r["status"] == "SKIP":
+            ET.SubElement(testcase, "skipped")
+        elif r["status"] != "PASS":
+            ET.SubElement(testcase, "failure", message=r["message"])
+        lines.append(
+            f"{r['status']:5} {job.build:{width}} "
+            f"{job.module + '.' + job.test:60} seed={job.seed:<12} "
+            f"{r['sim_time_ns']:>14.0f} ns {r['real_time_s']:>8.1f} s"
+        )
+    passed = sum(r["status"] == "PASS" for r in results)
+    skipped = sum(r["status"] == "SKIP" for r in results)
+    failed = len(results) - passed - skipped
+    counts = f"PASS={passed} FAIL={failed} SKIP={skipped}"
+    lines.append(f"TESTS={len(results)} {counts}")
+    root = ET.Element("testsuites")
+    root.append(suite)
+    ET.ElementTree(root).write(os.path.join(out_dir, "results.xml"))
+    with open(os.path.join(out_dir, "report.txt"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+    print("\n".join(lines))
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "-m",
+        "--module",
+        action="append",
+        default=[],
+        help="run TOPLEVEL:MODULE instead of the default regression",
+    )
+    parser.add_argument(
+        "-k",
+        "--filter",
+        action="append",
+        default=[],
+        help="only run jobs whose build.module.test contains this",
+    )
+    parser.add_argument("--seeds", type=int, default=1, help="seeds per test")
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=int(time.time()),
+        help="first seed",
+    )
+    parser.add_argument(
+        "-P",
+        "--param",
+        action="append",
+        default=[],
+        help="toplevel parameter NAME=VALUE",
+    )
+    parser.add_argument("--compile-args", default=COMPILE_ARGS)
+    parser.add_argument(
+        "--waves",
+        action="store_true",
+        help="build a traced model, every job dumps dump.fst",
+    )
+    parser.add_argument(
+        "--build-profile",
+        choices=list(BUILD_PROFILES),
+        default="default",
+        help="Verilator build profile, added to --compile-args",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=2,
+        help="model threads of the threads profile",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=3600,
+        help="seconds per job",
+    )
+    parser.add_argument("--out", default=None, help="result directory")
+    parser.add_argument(
+        "--profile-states",
+        action="store_true",
+        help="profile core/LSU state residency, see state_profiler.py",
+    )
+    parser.add_argument(
+        "--profile-queues",
+        action="store_true",
+        help="profile wrapper FIFO occupancy and stalls, see queue_monitor.py",
+    )
+    parser.add_argument(
+        "--profile-sim",
+        action="store_true",
+        help="profile Python vs simulator time, see sim_profile.py",
+    )
+    args = parser.parse_args()
+
+    parameters = dict(p.split("=", 1) for p in args.param)
+    compile_args = shlex.split(args.compile_args) + profile_args(
+        args.build_profile, args.threads
+    )
+    if args.waves and TRACE_ARGS[0] not in compile_args:
+        compile_args += TRACE_ARGS
+    out_dir = args.out
+    if not out_dir:
+        out_dir = os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S"))
+    os.makedirs(out_dir)
+
+    jobs = []
+    suite = [(*m.split(":", 1), {}) for m in args.module] or REGRESSION
+    for toplevel, module, extra in suite:
+        for test in discover_tests(module):
+            for seed in range(args.seed, args.seed + args.seeds):
+                params = {**parameters, **extra}
+                job = Job(toplevel, module, test, seed, params)
+                if not args.filter or any(k in job.name for k in args.filter):
+                    jobs.append(job)
+    skips = {job.name for job in jobs if skipped(job)}
+    builds = {job.build: job for job in jobs if job.name not in skips}
+    jobs_on = f"{len(jobs)} jobs, {len(skips)} skipped, {len(builds)} builds"
+    print(f"{jobs_on}, results in {out_dir}")
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        sim_builds = {}
+        futures = {}
+        for name, job in sorted(builds.items()):
+            futures[name] = pool.submit(
+                build, job.toplevel, job.parameters, compile_args
+            )
+        for name, future in futures.items():
+            _, sim_build, cached = future.result()
+            sim_builds[name] = sim_build
+            print(f"{name}: {'cached' if cached else 'built'} {sim_build}")
+
+        futures = {
+            job.name: pool.submit(
+                run_job,
+                job,
+                sim_builds[job.build],
+                out_dir,
+                job.parameters,
+                compile_args,
+                args.timeout,
+                args.profile_states,
+                args.profile_queues,
+                args.profile_sim,
+            )
+            for job in jobs
+            if job.name not in skips
+        }
+        results = []
+        for job in jobs:
+            if job.name in skips:
+                result = {
+                    "job": job,
+                    "status": "SKIP",
+                    "sim_time_ns": 0.0,
+                    "real_time_s": 0.0,
+                    "message": "",
+                }
+            else:
+                result = futures[job.name].result()
+            results.append(result)
+            print(f"{result['status']:5} {result['job'].name}")
+
+    failed = write_report(out_dir, results)
+    if args.profile_states:
+        profile = state_profiler.merge_files([out_dir])
+        with open(os.path.join(out_dir, "state_profile.txt"), "w") as f:
+            f.write(profile.report() + "\n")
+        profile.write_folded(os.path.join(out_dir, "state_profile.folded"))
+        print(profile.report())
+    if args.profile_queues:
+        profile = queue_monitor.merge_files([out_dir])
+        with open(os.path.join(out_dir, "queue_profile.txt"), "w") as f:
+            f.write(profile.report() + "\n")
+        print(profile.report())
+    if args.profile_sim:
+        report = sim_profile.profile_runs(
+            [out_dir], out=os.path.join(out_dir, "sim_profile.pstat")
+        )
+        with open(os.path.join(out_dir, "sim_profile.txt"), "w") as f:
+            f.write(report + "\n")
+        print(report)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import json
+import os
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import ClockCycles, FallingEdge
+from cocotb.utils import get_sim_time
+
+from alloc_trace import OP_ALLOC, read_trace
+from mem_agent import MemoryAgent
+from mem_rsp import issue_wrapper_req, wait_for_result
+from ref_model import FIRST_FIT, RefAllocator, Scoreboard
+from test_falafel_wrapper import (
+    MSG_ID_SIZE,
+    configure_wrapper,
+    reset_dut,
+    write_alloc_req,
+    write_free_req,
+)
+
+CLK_PERIOD = 10
+UNITS = "ns"
+
+FREE_LIST_PTR = 8
+LOCK_PTR = 0
+LOCK_ID = 1
+HEAP_BASE = 0x1000
+
+
+class LatencyStats:
+    """Streaming latency summary, a histogram keeps percentiles exact."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.hist = {}
+
+    def add(self, cycles):
+        self.count += 1
+        self.total += cycles
+        self.max = max(self.max, cycles)
+        self.hist[cycles] = self.hist.get(cycles, 0) + 1
+
+    def percentile(self, p):
+        rank = p / 100 * self.count
+        seen = 0
+        for cycles in sorted(self.hist):
+            seen += self.hist[cycles]
+            if seen >= rank:
+                return cycles
+        return 0
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+async def wrapper_alloc_timed(dut, clk, size, req_id):
+    start = await issue_wrapper_req(dut, clk, write_alloc_req(req_id), index=0)
+    await issue_wrapper_req(dut, clk, size, index=0)
+    while not (dut.resp_val_o.value == 1 and dut.resp_rdy_i.value == 1):
+        await FallingEdge(clk)
+    addr = dut.resp_data_o.value.integer
+    end = get_sim_time(UNITS)
+    # falafel_output_fsm sends every response twice
+    await FallingEdge(clk)
+    return addr, int((end - start) // CLK_PERIOD)
+
+
+async def wrapper_free_timed(dut, clk, addr, req_id):
+    start = await issue_wrapper_req(dut, clk, write_free_req(req_id), index=0)
+    await issue_wrapper_req(dut, clk, addr, index=0)
+    # frees are not answered on resp_val_o, wait for the core instead
+    await wait_for_result(dut.i_falafel, clk)
+    return int((get_sim_time(UNITS) - start) // CLK_PERIOD)
+
+
+@cocotb.test()
+async def replay_trace_through_wrapper(dut):
+    """Replays an allocation trace (alloc_trace.py) through falafel_wrapper.
+
+    Trace ids are mapped to the addresses returned on resp_data_o and every
+    op is checked against the reference model. Configured from the
+    environment:
+      TRACE_FILE       trace to replay (required)
+      TRACE_HEAP_SIZE  size of the single free block the heap starts as
+                       (default: 64 MiB)
+      TRACE_TIMING     asap issues ops back to back, trace waits for each
+                       op's timestamp (default: asap)
+      TRACE_OUT        write the summary as json to this path
+    """
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+
+    path = os.environ["TRACE_FILE"]
+    heap_size = int(os.environ.get("TRACE_HEAP_SIZE", str(64 << 20)), 0)
+    timing = os.environ.get("TRACE_TIMING", "asap")
+    assert timing in ("asap", "trace"), f"unknown TRACE_TIMING {timing}"
+
+    mem = MemoryAgent(dut, clk)
+    model = RefAllocator(FREE_LIST_PTR)
+    model.add_free_block(HEAP_BASE, heap_size)
+    mem.write_header(HEAP_BASE, heap_size, 0)
+    mem.write_word(FREE_LIST_PTR, HEAP_BASE)
+    scoreboard = Scoreboard(model, mem)
+    mem.start()
+
+    for i in range(len(dut.req_val_i)):
+        dut.req_val_i[i].setimmediatevalue(0)
+    dut.resp_rdy_i.setimmediatevalue(1)
+    await reset_dut(dut, clk)
+    await configure_wrapper(dut, clk, FREE_LIST_PTR, LOCK_PTR, LOCK_ID)
+
+    handles = {}  # trace id -> payload address
+    stats = {"alloc": LatencyStats(), "free": LatencyStats()}
+    unknown_frees = 0
+    start_cycle = mem.cycle
+    id_mask = (1 << MSG_ID_SIZE) - 1
+
+    for n, record in enumerate(read_trace(path)):
+        if timing == "trace":
+            behind = start_cycle + record.timestamp - mem.cycle
+            if behind > 0:
+                await ClockCycles(clk, behind)
+
+        tag = record.id & id_mask
+        if record.op == OP_ALLOC:
+            assert (
+                record.id not in handles
+            ), f"op {n}: id {record.id} is already allocated"
+            size = max(record.size, 1)  # falafel does not handle empty blocks
+            assert model.can_alloc(size, FIRST_FIT), (
+                f"op {n}: out of memory allocating {size} bytes, "
+                f"raise TRACE_HEAP_SIZE ({model.fragmentation()})"
+            )
+            addr, cycles = await wrapper_alloc_timed(dut, clk, size, tag)
+            scoreboard.check_alloc(size, FIRST_FIT, addr)
+            handles[record.id] = addr
+            stats["alloc"].add(cycles)
+        else:
+            addr = handles.pop(record.id, None)
+            if addr is None:
+                unknown_frees += 1
+                continue
+            cycles = await wrapper_free_timed(dut, clk, addr, tag)
+            scoreboard.check_free(addr)
+            stats["free"].add(cycles)
+
+        if (n + 1) % 10000 == 0:
+            print(
+                f"{n + 1} ops, {mem.cycle - start_cycle} cycles, "
+                f"{len(model.free)} free blocks"
+            )
+
+    scoreboard.check_heap()
+    summary = {
+        "trace": path,
+        "cycles": mem.cycle - start_cycle,
+        "latency": {op: s.summary() for op, s in stats.items()},
+        "unknown_frees": unknown_frees,
+        "live_handles": len(handles),
+        "fragmentation": model.fragmentation(),
+        "memory": mem.config(),
+    }
+    print(json.dumps(summary, indent=2))
+    if "TRACE_OUT" in os.environ:
+        with open(os.environ["TRACE_OUT"], "w") as f:
+            json.dump(summary, f, indent=2)
+    mem.stop()
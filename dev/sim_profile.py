@@ -0,0 +1,190 @@
+"""Where the wall clock time of a simulation goes: Python or Verilator.
+
+With COCOTB_ENABLE_PROFILING set, cocotb runs every trigger callback of the
+testbench under cProfile and writes the profile to test_profile.pstat in
+the working directory. The Python time is the total of that profile; the
+rest of the wall clock time of the tests (from results.xml) is spent in the
+simulator, i.e. in the Verilator model and the GPI. Alongside, the number
+of trigger callbacks per simulated cycle and the testbench functions
+(coroutines count one call per resume) that take the most time show which
+side to optimize. cProfile slows the Python side down, so the split
+overstates it somewhat; compare runs that were both profiled.
+
+    python regress.py --profile-sim -k stress   # + sim_profile.txt/.pstat
+    # or for a single run
+    COCOTB_ENABLE_PROFILING=1 make MODULE=test_stress
+    python sim_profile.py .
+The .pstat files open in the standard tools, e.g. python -m pstats,
+snakeviz or gprof2dot.
+"""
+
+import argparse
+import os
+import pstats
+import xml.etree.ElementTree as ET
+from collections import Counter
+
+DEV_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILE_FILE = "test_profile.pstat"  # written by cocotb
+RESULTS_FILE = "results.xml"
+CLK_PERIOD_NS = 10  # of every test in this directory
+
+TESTBENCH = {f for f in os.listdir(DEV_DIR) if f.endswith(".py")}
+
+
+def group(filename):
+    """Testbench file, cocotb, builtins or other for a pstats filename."""
+    base = os.path.basename(filename)
+    if base in TESTBENCH:
+        return base
+    if f"{os.sep}cocotb{os.sep}" in filename:
+        return "cocotb"
+    if filename == "~":
+        return "builtins"
+    return "other"
+
+
+def read_results(path):
+    """Names, wall clock seconds and sim time (ns) of a results.xml's tests."""
+    names, wall_s, sim_time_ns = [], 0.0, 0.0
+    for testcase in ET.parse(path).iter("testcase"):
+        names.append(testcase.get("name"))
+        wall_s += float(testcase.get("time", 0))
+        sim_time_ns += float(testcase.get("sim_time_ns", 0))
+    return names, wall_s, sim_time_ns
+
+
+def summarize(stats, wall_s, sim_time_ns, clk_period_ns=CLK_PERIOD_NS):
+    """Time split and hot spots of one profile, a dict."""
+    cycles = sim_time_ns / clk_period_ns
+    python_s = stats.total_tt
+    by_group = Counter()
+    callbacks = 0
+    functions = []
+    for (filename, lineno, name), entry in stats.stats.items():
+        _, ncalls, tottime, cumtime, _ = entry
+        by_group[group(filename)] += tottime
+        if group(filename) == "cocotb" and name == "_react":
+            callbacks += ncalls  # every trigger the simulator fires
+        basename = os.path.basename(filename)
+        if basename in TESTBENCH:
+            functions.append(
+                {
+                    "function": f"{basename}:{lineno}({name})",
+                    "calls": ncalls,
+                    "own_s": tottime,
+                    "cum_s": cumtime,
+                }
+            )
+    functions.sort(key=lambda f: f["own_s"], reverse=True)
+    return {
+        "sim_time_ns": sim_time_ns,
+        "cycles": cycles,
+        "wall_s": wall_s,
+        "python_s": python_s,
+        "simulator_s": max(wall_s - python_s, 0.0),
+        "callbacks": callbacks,
+        "callbacks_per_cycle": callbacks / cycles if cycles else 0.0,
+        "by_group": dict(by_group),
+        "functions": functions,
+    }
+
+
+def report(name, summary, top=10):
+    wall = summary["wall_s"] or 1.0
+    cycles = summary["cycles"] or 1.0
+    python_s = summary["python_s"]
+    simulator_s = summary["simulator_s"]
+    by_group = sorted(summary["by_group"].items(), key=lambda i: -i[1])
+    lines = [
+        f"{name}: {summary['cycles']:.0f} cycles in {summary['wall_s']:.1f} s "
+        f"({summary['cycles'] / wall:.0f} cycles/s), "
+        f"python {python_s:.1f} s ({100 * python_s / wall:.0f}%), "
+        f"simulator {simulator_s:.1f} s ({100 * simulator_s / wall:.0f}%), "
+        f"{summary['callbacks_per_cycle']:.2f} trigger callbacks/cycle",
+        "  python by file: "
+        + ", ".join(f"{g} {s:.1f} s" for g, s in by_group if s >= 0.05),
+    ]
+    for f in summary["functions"][:top]:
+        lines.append(
+            f"  {f['own_s']:8.2f} s own {f['cum_s']:8.2f} s incl "
+            f"{f['calls'] / cycles:8.3f} calls/cycle  {f['function']}"
+        )
+    return "\n".join(lines)
+
+
+def find_runs(paths):
+    """Directories below `paths` holding a profile and its results.xml."""
+    runs = []
+    for path in paths:
+        for root, _, files in os.walk(path):
+            if PROFILE_FILE in files and RESULTS_FILE in files:
+                runs.append(root)
+    return sorted(runs)
+
+
+def profile_runs(paths, out=None, top=10, clk_period_ns=CLK_PERIOD_NS):
+    """Report of every run below `paths` and of all of them together.
+
+    The merged profile is written to `out` if given.
+    """
+    runs = find_runs(paths)
+    if not runs:
+        return f"no {PROFILE_FILE} with a {RESULTS_FILE} next to it found"
+    lines = []
+    merged = None
+    total_wall = total_sim = 0.0
+    for run in runs:
+        results = os.path.join(run, RESULTS_FILE)
+        names, wall_s, sim_time_ns = read_results(results)
+        stats = pstats.Stats(os.path.join(run, PROFILE_FILE))
+        if len(runs) > 1:
+            name = os.path.basename(os.path.abspath(run))
+        else:
+            name = ",".join(names)
+        summary = summarize(stats, wall_s, sim_time_ns, clk_period_ns)
+        lines.append(report(name, summary, top))
+        total_wall += wall_s
+        total_sim += sim_time_ns
+        if merged is None:
+            merged = stats
+        else:
+            merged.add(stats)
+    if len(runs) > 1:
+        lines.append(
+            report(
+                f"all {len(runs)} runs",
+                summarize(merged, total_wall, total_sim, clk_period_ns),
+                top,
+            )
+        )
+    if out is not None:
+        merged.dump_stats(out)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "paths", nargs="+", help="run directories or directories above them"
+    )
+    parser.add_argument(
+        "--top", type=int, default=10, help="testbench functions to list"
+    )
+    parser.add_argument(
+        "--clk-period",
+        type=float,
+        default=CLK_PERIOD_NS,
+        help="ns",
+    )
+    parser.add_argument(
+        "--out",
+        default=None,
+        help="write the merged profile here",
+    )
+    args = parser.parse_args()
+    print(profile_runs(args.paths, args.out, args.top, args.clk_period))
+
+
+if __name__ == "__main__":
+    main()
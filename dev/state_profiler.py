@@ -0,0 +1,294 @@
+"""Per-state residency profile of falafel_core and falafel_lsu.
+
+Samples falafel_core.state_q and falafel_lsu.state_q once per cycle while an
+op is in flight (from its handshake on req_alloc_valid_i to the result on
+rsp_result_val_o) and keeps, per op kind, a histogram of the cycles each op
+spent in every state. Cycles the LSU waits in WAIT_RSP_FROM_MEM are further
+attributed to the lsu_op it is waiting for.
+
+Set STATE_PROFILE to a .json path to enable it for every test that starts a
+MemoryAgent; profiles written by several tests (or several regression jobs)
+are merged by
+    python state_profiler.py [--folded out.folded] PROFILE_OR_DIR...
+The folded file has one `op;core_state;lsu_state[;lsu_op] cycles` line per
+stack and can be fed to flamegraph.pl.
+"""
+
+import argparse
+import json
+import os
+import re
+from collections import Counter
+
+import cocotb
+from cocotb.triggers import FallingEdge, ReadOnly
+
+DEV_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILE_FILE = "state_profile.json"
+
+
+def read_enum(source, name):
+    """Names of `typedef enum ... {...} name;` in `source`, in value order."""
+    with open(os.path.join(DEV_DIR, source)) as f:
+        text = re.sub(r"//.*", "", f.read())
+    pattern = r"typedef\s+enum[^{]*\{([^}]*)\}\s*" + name + r"\s*;"
+    match = re.search(pattern, text)
+    assert match, f"{name} not found in {source}"
+    return [s.strip() for s in match.group(1).split(",") if s.strip()]
+
+
+# op kinds, shared with mem_traffic: free and one alloc kind per value of
+# config_alloc_strategy_i, e.g. "alloc_first_fit"
+OP_FREE = "free"
+OP_ALLOC = {
+    i: "alloc_" + name.lower()
+    for i, name in enumerate(read_enum("falafel_pkg.sv", "alloc_strategy_t"))
+}
+
+CORE_STATES = read_enum("falafel_core.sv", "core_state_e")
+LSU_STATES = read_enum("falafel_lsu.sv", "lsu_state_e")
+LSU_OPS = read_enum("falafel_lsu.sv", "lsu_op_t")
+LSU_WAIT = LSU_STATES.index("WAIT_RSP_FROM_MEM")
+
+
+def percentile(hist, p):
+    total = sum(hist.values())
+    if not total:
+        return 0
+    seen = 0
+    for value in sorted(hist):
+        seen += hist[value]
+        if seen >= p * total:
+            return value
+    return max(hist)
+
+
+class StateProfile:
+    """Residency histograms per op kind, mergeable across tests."""
+
+    def __init__(self):
+        self.ops = Counter()  # kind -> ops
+        self.latency = {}  # kind -> Counter(cycles per op -> ops)
+        self.core = {}  # kind -> state -> Counter(cycles per op -> ops)
+        self.lsu = {}  # kind -> state -> Counter(cycles per op -> ops)
+        self.folded = Counter()  # "kind;core;lsu[;op]" -> cycles
+
+    def add_op(self, kind, cycles, samples):
+        """`samples` maps (core_state, lsu_state, lsu_op) to cycles."""
+        self.ops[kind] += 1
+        self.latency.setdefault(kind, Counter())[cycles] += 1
+        core = Counter()
+        lsu = Counter()
+        for (core_state, lsu_state, lsu_op), n in samples.items():
+            core[CORE_STATES[core_state]] += n
+            lsu[LSU_STATES[lsu_state]] += n
+            stack = f"{kind};{CORE_STATES[core_state]};{LSU_STATES[lsu_state]}"
+            if lsu_state == LSU_WAIT:
+                stack += ";" + LSU_OPS[lsu_op]
+            self.folded[stack] += n
+        for states, per_op in ((self.core, core), (self.lsu, lsu)):
+            hists = states.setdefault(kind, {})
+            for state, n in per_op.items():
+                hists.setdefault(state, Counter())[n] += 1
+
+    def merge(self, other):
+        self.ops.update(other.ops)
+        self.folded.update(other.folded)
+        for kind, hist in other.latency.items():
+            self.latency.setdefault(kind, Counter()).update(hist)
+        for mine, theirs in ((self.core, other.core), (self.lsu, other.lsu)):
+            for kind, states in theirs.items():
+                mine_states = mine.setdefault(kind, {})
+                for state, hist in states.items():
+                    mine_states.setdefault(state, Counter()).update(hist)
+        return self
+
+    def as_dict(self):
+        def hist(h):
+            return {str(k): v for k, v in sorted(h.items())}
+
+        return {
+            "ops": dict(self.ops),
+            "latency": {kind: hist(h) for kind, h in self.latency.items()},
+            "core": {
+                kind: {s: hist(h) for s, h in st.items()}
+                for kind, st in self.core.items()
+            },
+            "lsu": {
+                kind: {s: hist(h) for s, h in st.items()}
+                for kind, st in self.lsu.items()
+            },
+            "folded": dict(self.folded),
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        def hist(h):
+            return Counter({int(k): v for k, v in h.items()})
+
+        profile = cls()
+        profile.ops = Counter(d["ops"])
+        profile.latency = {kind: hist(h) for kind, h in d["latency"].items()}
+
+        def states(by_kind):
+            return {
+                kind: {s: hist(h) for s, h in st.items()}
+                for kind, st in by_kind.items()
+            }
+
+        profile.core = states(d["core"])
+        profile.lsu = states(d["lsu"])
+        profile.folded = Counter(d["folded"])
+        return profile
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.as_dict(), f, indent=1)
+
+    def write_folded(self, path):
+        with open(path, "w") as f:
+            for stack, cycles in sorted(self.folded.items()):
+                f.write(f"{stack} {cycles}\n")
+
+    def report(self):
+        lines = []
+        for kind in sorted(self.ops):
+            ops = self.ops[kind]
+            latency = self.latency[kind]
+            total = sum(c * n for c, n in latency.items())
+            lines.append(
+                f"{kind}: {ops} ops, {total / ops:.1f} cycles/op "
+                f"(p50 {percentile(latency, 0.5)}, "
+                f"p99 {percentile(latency, 0.99)}, max {max(latency)})"
+            )
+            units = (("core", self.core[kind]), ("lsu", self.lsu[kind]))
+            for unit, states in units:
+                lines.append(
+                    f"  {unit + ' state':28} {'share':>7} {'cyc/op':>8} "
+                    f"{'p50':>6} {'p99':>6} {'max':>6}"
+                )
+                rows = []
+                for state, hist in states.items():
+                    cycles = sum(c * n for c, n in hist.items())
+                    # ops that never entered the state count as 0 cycles
+                    full = hist + Counter({0: ops - sum(hist.values())})
+                    rows.append((cycles, state, full))
+                for cycles, state, full in sorted(rows, reverse=True):
+                    lines.append(
+                        f"  {state:28} {100 * cycles / total:6.1f}% "
+                        f"{cycles / ops:8.1f} {percentile(full, 0.5):6} "
+                        f"{percentile(full, 0.99):6} {max(full):6}"
+                    )
+        return "\n".join(lines)
+
+
+class StateProfiler:
+    """Samples the core and LSU state of `falafel` (the falafel instance)."""
+
+    def __init__(self, falafel, clk):
+        self.falafel = falafel
+        self.clk = clk
+        self.profile = StateProfile()
+        self._task = None
+
+    def start(self):
+        self._task = cocotb.start_soon(self._run())
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+
+    async def _run(self):
+        falafel = self.falafel
+        core_state = falafel.i_core.state_q
+        lsu_state = falafel.i_lsu.state_q
+        lsu_op = falafel.i_lsu.lsu_op_q
+        kind = None
+        cycles = 0
+        samples = Counter()
+        while True:
+            await FallingEdge(self.clk)
+            await ReadOnly()
+            if kind is not None:
+                cycles += 1
+                state = int(lsu_state.value)
+                op = int(lsu_op.value) if state == LSU_WAIT else 0
+                samples[int(core_state.value), state, op] += 1
+                if (
+                    falafel.rsp_result_val_o.value == 1
+                    and falafel.result_ready_i.value == 1
+                ):
+                    self.profile.add_op(kind, cycles, samples)
+                    kind = None
+            elif (
+                falafel.req_alloc_valid_i.value == 1
+                and falafel.req_alloc_ready_o.value == 1
+            ):
+                if falafel.is_alloc_i.value == 1:
+                    kind = OP_ALLOC.get(
+                        int(falafel.config_alloc_strategy_i.value), "alloc"
+                    )
+                else:
+                    kind = OP_FREE
+                cycles = 0
+                samples = Counter()
+
+
+_saved = set()  # paths this process already wrote, later tests merge into them
+
+
+def from_env(dut, clk):
+    """A started StateProfiler if STATE_PROFILE is set, otherwise None."""
+    if not os.environ.get("STATE_PROFILE"):
+        return None
+    falafel = dut.i_falafel if hasattr(dut, "i_falafel") else dut
+    return StateProfiler(falafel, clk).start()
+
+
+def save(profiler):
+    path = os.environ["STATE_PROFILE"]
+    profile = profiler.profile
+    if path in _saved and os.path.exists(path):
+        profile = StateProfile.load(path).merge(profile)
+    profile.save(path)
+    _saved.add(path)
+
+
+def merge_files(paths):
+    """Merges profiles, directories are searched for PROFILE_FILE."""
+    profile = StateProfile()
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                if PROFILE_FILE in files:
+                    found = os.path.join(root, PROFILE_FILE)
+                    profile.merge(StateProfile.load(found))
+        else:
+            profile.merge(StateProfile.load(path))
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        help="profiles or directories to merge",
+    )
+    parser.add_argument("--folded", help="write folded stacks to this path")
+    args = parser.parse_args()
+    profile = merge_files(args.paths)
+    print(profile.report())
+    if args.folded:
+        profile.write_folded(args.folded)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,46 @@
+import os
+import random
+
 import cocotb
-from cocotb.triggers import FallingEdge
 from cocotb.clock import Clock
+from cocotb.triggers import FallingEdge
 
-from monitor import monitor_req_from_falafel, monitor_falafel_ready  # noqa
+import txn_log
 from free_list import LinkedList
+from heap_image import best_fit_worst_case, first_fit_worst_case, load_image
+from mem_agent import MemoryAgent
 from mem_rsp import (
-    send_req_to_allocate,
-    send_req_to_free,
     grant_lock,
     handle_loading_headers,
     handle_storing_headers,
+    issue_alloc_req,
+    issue_free_req,
+    send_req_to_allocate,
+    send_req_to_free,
+    wait_for_result,
 )
+from monitor import (
+    MemReqMonitor,
+    monitor_falafel_ready,
+    monitor_req_from_falafel,
+    watchdog,
+)
+from ref_model import (
+    BEST_FIT,
+    BLOCK_HEADER_SIZE,
+    FIRST_FIT,
+    MERGE_BOTH,
+    MERGE_LEFT,
+    MERGE_NONE,
+    MERGE_RIGHT,
+    NEXT_FIT,
+    SEGREGATED_FIT,
+    RefAllocator,
+    Scoreboard,
+    SegregatedRefAllocator,
+    pack_config,
+)
+from trace_window import TraceWindow
 
 CLK_PERIOD = 10
 MAX_SIM_TIME = 15000
@@ -31,21 +61,82 @@ async def reset_dut(dut, clk):
     await FallingEdge(clk)
 
 
-async def sim_time_counter(dut, clk):
-    counter = 0
+def header_burst(dut):
+    """True for builds with HEADER_BURST, loading a header in one request."""
+    return bool(int(getattr(dut, "HEADER_BURST", 0)))
+
+
+def batched(dut):
+    """True for builds with MAX_BATCH_OPS > 1, unlocking after the result."""
+    return int(getattr(dut, "MAX_BATCH_OPS", 1)) > 1
+
+
+def scripted_mem_off(dut):
+    """True for builds the scripted memory of the fit tests cannot follow.
 
-    while counter < MAX_SIM_TIME:
-        counter += 1
+    It answers one DATA_W word per request and expects the lock release
+    before the result.
+    """
+    return header_burst(dut) or batched(dut)
+
+
+def stops_unsplittable(dut):
+    """True for builds whose best fit also stops on an unsplittable fit."""
+    return bool(int(getattr(dut, "BEST_FIT_STOP_UNSPLITTABLE", 0)))
+
+
+def header_cache(dut):
+    """Entries of the header cache between core and LSU, 0 without one."""
+    return int(getattr(dut, "HEADER_CACHE_ENTRIES", 0))
+
+
+async def wait_lock_release(mem, clk, lock_ptr, max_cycles=100):
+    for _ in range(max_cycles):
+        if mem.read_word(lock_ptr) == 0:
+            return
         await FallingEdge(clk)
+    assert False, f"lock at {lock_ptr:#x} still held after {max_cycles} cycles"
 
-    assert False, "Surpassed MAX_SIM_TIME of " + str(MAX_SIM_TIME)
 
+async def wait_mem_idle(mem, clk, max_cycles=100):
+    # the lock word is written when the unlock store is taken, its response
+    # can still be queued in the memory agent
+    for _ in range(max_cycles):
+        if not mem.rsp_queue:
+            return
+        await FallingEdge(clk)
+    assert False, (
+        f"{len(mem.rsp_queue)} memory responses still queued after "
+        f"{max_cycles} cycles"
+    )
 
-@cocotb.test()
+
+async def sim_time_counter(dut, clk):
+    await watchdog(MAX_SIM_TIME, CLK_PERIOD, UNITS)
+
+
+# tests that cannot run on some builds: cocotb skips them when it discovers
+# the tests, regress.py before it starts their jobs (cocotb still runs a
+# test named in TESTCASE)
+SKIP_IF = {
+    "test_falafel_alloc_first_fit": scripted_mem_off,
+    "test_falafel_alloc_best_fit": scripted_mem_off,
+    "test_falafel_header_cache": lambda dut: not header_cache(dut),
+    "test_falafel_txn_log": lambda dut: not txn_log.enabled(),
+}
+
+
+def skip(test):
+    """skip= of `test` on the simulated build, False outside a simulation."""
+    return bool(SKIP_IF[test](cocotb.top))
+
+
+@cocotb.test(skip=skip("test_falafel_alloc_first_fit"))
 async def test_falafel_alloc_first_fit(dut):
     print("---------------------- Start first fit test ----------------------")
     clk = dut.clk_i
     cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    cocotb.start_soon(sim_time_counter(dut, clk))
     dut.config_alloc_strategy_i.setimmediatevalue(0)  # first fit
 
     DATA_W = 64
@@ -120,7 +211,7 @@ async def test_falafel_alloc_first_fit(dut):
         clk,
         linked_list,
         expected_addr=716,
-        expected_data=100,
+        expected_data=84,
         expected_next_addr=2000,
     )
     print("-----Granted creating the new block-----")
@@ -153,11 +244,12 @@ async def test_falafel_alloc_first_fit(dut):
     await FallingEdge(clk)
 
 
-@cocotb.test()
+@cocotb.test(skip=skip("test_falafel_alloc_best_fit"))
 async def test_falafel_alloc_best_fit(dut):
     print("---------------------- Start best fit test ----------------------")
     clk = dut.clk_i
     cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    cocotb.start_soon(sim_time_counter(dut, clk))
     dut.config_alloc_strategy_i.setimmediatevalue(1)  # best fit
 
     DATA_W = 64
@@ -232,7 +324,7 @@ async def test_falafel_alloc_best_fit(dut):
         clk,
         linked_list,
         expected_addr=2216,
-        expected_data=99,
+        expected_data=83,
         expected_next_addr=0,
     )
     print("-----Granted creating the new block-----")
@@ -270,6 +362,7 @@ async def test_falafel_free_merge_right(dut):
     print("------------------ Start free merge right test ------------------")
     clk = dut.clk_i
     cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    cocotb.start_soon(sim_time_counter(dut, clk))
 
     DATA_W = 64
     free_list_ptr = 12
@@ -377,6 +470,7 @@ async def test_falafel_free_merge_left(dut):
     print("------------------ Start free merge left test ------------------")
     clk = dut.clk_i
     cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    cocotb.start_soon(sim_time_counter(dut, clk))
 
     monitor_task_req_from_lsu = cocotb.start_soon(monitor_req_from_falafel(dut))
     monitor_task_falafel_ready = cocotb.start_soon(monitor_falafel_ready(dut))
@@ -471,6 +565,7 @@ async def test_falafel_free_merge_both_sides(dut):
     print("---------------- Start free merge both sides test ----------------")
     clk = dut.clk_i
     cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    cocotb.start_soon(sim_time_counter(dut, clk))
 
     monitor_task_req_from_lsu = cocotb.start_soon(monitor_req_from_falafel(dut))
     monitor_task_falafel_ready = cocotb.start_soon(monitor_falafel_ready(dut))
@@ -561,3 +656,909 @@ async def test_falafel_free_merge_both_sides(dut):
     assert dut.rsp_result_val_o == 1
     assert dut.rsp_result_is_write_o == 0
     await FallingEdge(clk)
+
+
+@cocotb.test()
+async def test_falafel_mem_agent_alloc_and_free(dut):
+    print("-------------- Start memory agent alloc & free test --------------")
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    cocotb.start_soon(sim_time_counter(dut, clk))
+    dut.config_alloc_strategy_i.setimmediatevalue(0)  # first fit
+
+    free_list_ptr = 8
+    lock_ptr = 0
+    lock_id = 0x9ABC
+    packed_value = pack_config(free_list_ptr, lock_ptr, lock_id)
+    dut.falafel_config_i.value = packed_value
+
+    linked_list = LinkedList()
+    linked_list.add_node(free_list_ptr, 64, 0)  # free list pointer
+    linked_list.add_node(64, 48, 128)
+    linked_list.add_node(128, 300, 1024)
+    linked_list.add_node(1024, 1000, 0)
+
+    mem = MemoryAgent(dut, clk)
+    mem.load_linked_list(linked_list)
+    mem.start()
+
+    dut.req_alloc_valid_i.setimmediatevalue(0)
+    dut.result_ready_i.setimmediatevalue(1)
+    await reset_dut(dut, clk)
+
+    # split 128, the remainder is linked behind 64
+    await issue_alloc_req(dut, clk, 100)
+    assert await wait_for_result(dut, clk) == 144
+    assert mem.walk_free_list(free_list_ptr) == [
+        (64, 48, 244),
+        (244, 184, 1024),
+        (1024, 1000, 0),
+    ], mem.walk_free_list(free_list_ptr)
+
+    # exact fit on the first header, the free list pointer moves
+    await issue_alloc_req(dut, clk, 48)
+    assert await wait_for_result(dut, clk) == 80
+    assert mem.walk_free_list(free_list_ptr) == [
+        (244, 184, 1024),
+        (1024, 1000, 0),
+    ], mem.walk_free_list(free_list_ptr)
+
+    # both frees merge with the block on their right
+    await issue_free_req(dut, clk, 144)
+    await wait_for_result(dut, clk)
+    assert mem.walk_free_list(free_list_ptr) == [
+        (128, 300, 1024),
+        (1024, 1000, 0),
+    ], mem.walk_free_list(free_list_ptr)
+
+    await issue_free_req(dut, clk, 80)
+    await wait_for_result(dut, clk)
+    assert mem.walk_free_list(free_list_ptr) == [
+        (64, 364, 1024),
+        (1024, 1000, 0),
+    ], mem.walk_free_list(free_list_ptr)
+
+    await wait_lock_release(mem, clk, lock_ptr)
+    mem.stop()
+
+
+@cocotb.test()
+async def test_falafel_scoreboard_merge_cases(dut):
+    print("--------------- Start scoreboard merge cases test ---------------")
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    cocotb.start_soon(sim_time_counter(dut, clk))
+
+    free_list_ptr = 8
+    lock_ptr = 0
+    lock_id = 0x9ABC
+    packed_value = pack_config(free_list_ptr, lock_ptr, lock_id)
+    dut.falafel_config_i.value = packed_value
+
+    mem = MemoryAgent(dut, clk)
+    model = RefAllocator(free_list_ptr)
+    for addr, size in [(64, 1000), (2048, 1000), (8192, 0)]:
+        model.add_free_block(addr, size)
+    mem.load_model(model)
+    scoreboard = Scoreboard(model, mem, full_check_interval=1)
+    mem.start()
+
+    dut.req_alloc_valid_i.setimmediatevalue(0)
+    dut.result_ready_i.setimmediatevalue(1)
+    await reset_dut(dut, clk)
+
+    async def alloc(size, strategy):
+        dut.config_alloc_strategy_i.value = strategy
+        await issue_alloc_req(dut, clk, size)
+        result = await wait_for_result(dut, clk)
+        return scoreboard.check_alloc(size, strategy, result)
+
+    async def free(addr):
+        await issue_free_req(dut, clk, addr)
+        await wait_for_result(dut, clk)
+        return scoreboard.check_free(addr)
+
+    a, b, c, d = [(await alloc(100, FIRST_FIT)).addr for i in range(4)]
+    assert (await free(b)).merge == MERGE_NONE
+    assert (await free(c)).merge == MERGE_LEFT
+    assert (await free(a)).merge == MERGE_RIGHT
+    assert (await free(d)).merge == MERGE_BOTH
+    assert model.free_list()[0] == (64, 1000, 2048)
+
+    # equal differences go to the lowest address, exact fits are not split
+    e = await alloc(1000, BEST_FIT)
+    assert e.addr == 80 and not e.split
+    f = await alloc(990, BEST_FIT)
+    assert f.addr == 2064 and not f.split
+    await free(e.addr)
+    await free(f.addr)
+
+    scoreboard.check_heap()
+    scoreboard.report()
+    mem.stop()
+
+
+@cocotb.test()
+async def test_falafel_mem_agent_latency_and_backpressure(dut):
+    print("------------- Start slow memory & backpressure test -------------")
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    cocotb.start_soon(sim_time_counter(dut, clk))
+    dut.config_alloc_strategy_i.setimmediatevalue(0)  # first fit
+
+    free_list_ptr = 8
+    lock_ptr = 0
+    lock_id = 0x9ABC
+    packed_value = pack_config(free_list_ptr, lock_ptr, lock_id)
+    dut.falafel_config_i.value = packed_value
+
+    linked_list = LinkedList()
+    linked_list.add_node(free_list_ptr, 64, 0)  # free list pointer
+    linked_list.add_node(64, 48, 128)
+    linked_list.add_node(128, 300, 1024)
+    linked_list.add_node(1024, 1000, 0)
+
+    # same ops as test_falafel_mem_agent_alloc_and_free, on a memory that
+    # misses a third of the time and stalls both channels
+    mem = MemoryAgent(
+        dut,
+        clk,
+        latency="bimodal:2:20:0.3",
+        req_stall_prob=0.3,
+        rsp_stall_prob=0.3,
+        seed=1,
+    )
+    mem.load_linked_list(linked_list)
+    mem.start()
+
+    dut.req_alloc_valid_i.setimmediatevalue(0)
+    dut.result_ready_i.setimmediatevalue(1)
+    await reset_dut(dut, clk)
+
+    await issue_alloc_req(dut, clk, 100)
+    assert await wait_for_result(dut, clk) == 144
+    await issue_alloc_req(dut, clk, 48)
+    assert await wait_for_result(dut, clk) == 80
+    await issue_free_req(dut, clk, 144)
+    await wait_for_result(dut, clk)
+    await issue_free_req(dut, clk, 80)
+    await wait_for_result(dut, clk)
+    assert mem.walk_free_list(free_list_ptr) == [
+        (64, 364, 1024),
+        (1024, 1000, 0),
+    ], mem.walk_free_list(free_list_ptr)
+    await wait_lock_release(mem, clk, lock_ptr)
+
+    assert mem.req_stall_cycles > 0
+    assert mem.busy_cycles > 2 * mem.num_reqs
+    print(
+        f"{mem.config()}: {mem.num_reqs} requests, "
+        f"{mem.busy_cycles} busy cycles, "
+        f"{mem.req_stall_cycles} request stall cycles"
+    )
+    mem.stop()
+
+
+@cocotb.test()
+async def test_falafel_lock_contention(dut):
+    print("------------------ Start lock contention test ------------------")
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    cocotb.start_soon(sim_time_counter(dut, clk))
+    dut.config_alloc_strategy_i.setimmediatevalue(0)  # first fit
+
+    free_list_ptr = 8
+    lock_ptr = 0
+    lock_id = 0x9ABC
+    packed_value = pack_config(free_list_ptr, lock_ptr, lock_id)
+    dut.falafel_config_i.value = packed_value
+
+    # other threads take the lock a fifth of the cycles it is free
+    mem = MemoryAgent(
+        dut,
+        clk,
+        seed=3,
+        lock_ptr=lock_ptr,
+        lock_contention=0.2,
+        lock_hold="uniform:5:40",
+    )
+    model = RefAllocator(free_list_ptr)
+    for addr, size in [(64, 1000), (2048, 1000), (8192, 0)]:
+        model.add_free_block(addr, size)
+    mem.load_model(model)
+    scoreboard = Scoreboard(model, mem)
+    mem.start()
+
+    dut.req_alloc_valid_i.setimmediatevalue(0)
+    dut.result_ready_i.setimmediatevalue(1)
+    await reset_dut(dut, clk)
+
+    for i in range(10):
+        await issue_alloc_req(dut, clk, 100)
+        addr = scoreboard.check_alloc(
+            100, FIRST_FIT, await wait_for_result(dut, clk)
+        ).addr
+        await issue_free_req(dut, clk, addr)
+        await wait_for_result(dut, clk)
+        scoreboard.check_free(addr)
+
+    scoreboard.check_heap()
+    stats = mem.lock_stats()
+    print(stats)
+    # falafel spun on the held lock and retried failed CASes without ever
+    # touching the heap while someone else held the lock
+    assert stats["lock_loads"] > stats["cas_attempts"]
+    assert stats["cas_failures"] > 0
+    assert stats["lock_violations"] == 0
+    mem.stop()
+
+
+@cocotb.test()
+async def test_falafel_mem_traffic_accounting(dut):
+    print("-------------- Start memory traffic accounting test --------------")
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    cocotb.start_soon(sim_time_counter(dut, clk))
+    dut.config_alloc_strategy_i.setimmediatevalue(0)  # first fit
+
+    free_list_ptr = 8
+    lock_ptr = 0
+    lock_id = 0x9ABC
+    packed_value = pack_config(free_list_ptr, lock_ptr, lock_id)
+    dut.falafel_config_i.value = packed_value
+
+    mem = MemoryAgent(dut, clk, lock_ptr=lock_ptr)
+    model = RefAllocator(free_list_ptr)
+    for addr, size in [(64, 50), (2048, 1000), (8192, 0)]:
+        model.add_free_block(addr, size)
+    mem.load_model(model)
+    scoreboard = Scoreboard(model, mem)
+    mem.start()
+
+    dut.req_alloc_valid_i.setimmediatevalue(0)
+    dut.result_ready_i.setimmediatevalue(1)
+    await reset_dut(dut, clk)
+
+    async def check_op(kind):
+        # batched builds store the unlock after the result
+        await wait_lock_release(mem, clk, lock_ptr)
+        op = mem.traffic.last.as_dict()
+        print(op)
+        assert op["kind"] == kind, op
+        # one lock load, one CAS and the unlock store
+        lock_ops = (op["lock_reads"], op["lock_cass"], op["lock_writes"])
+        assert lock_ops == (1, 1, 1), op
+        # the first header address, then size and next address per header,
+        # as two loads or a single burst, unless the header cache has them
+        loads_per_header = 1 if header_burst(dut) else 2
+        loads = 1 + op["nodes"] - op["cache_hits"]
+        assert op["search_reads"] == loads_per_header * loads, op
+        assert op["search_bytes"] == 16 * loads, op
+        assert op["update_writes"] > 0, op
+        lock_words = op["lock_reads"] + op["lock_writes"]
+        assert op["lock_bytes"] == 8 * lock_words + 16 * op["lock_cass"], op
+        return op
+
+    # 64 is too small, 2048 fits
+    await issue_alloc_req(dut, clk, 100)
+    result = await wait_for_result(dut, clk)
+    expected = scoreboard.check_alloc(100, FIRST_FIT, result)
+    op = await check_op("alloc_first_fit")
+    assert op["nodes"] == expected.visited == 2
+    await issue_free_req(dut, clk, expected.addr)
+    await wait_for_result(dut, clk)
+    scoreboard.check_free(expected.addr)
+    await check_op("free")
+
+    scoreboard.check_heap()
+    print(mem.traffic.summary())
+    assert mem.traffic.ops == {"alloc_first_fit": 1, "free": 1}
+    mem.stop()
+
+
+@cocotb.test()
+async def test_falafel_best_fit_early_exit(dut):
+    print("----------------- Start best fit early exit test -----------------")
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    cocotb.start_soon(sim_time_counter(dut, clk))
+    dut.config_alloc_strategy_i.setimmediatevalue(1)  # best fit
+
+    free_list_ptr = 8
+    lock_ptr = 0
+    lock_id = 0x9ABC
+    packed_value = pack_config(free_list_ptr, lock_ptr, lock_id)
+    dut.falafel_config_i.value = packed_value
+
+    # builds with -P BEST_FIT_STOP_UNSPLITTABLE=1 also stop on the 110 block
+    stop_unsplittable = stops_unsplittable(dut)
+    mem = MemoryAgent(dut, clk, lock_ptr=lock_ptr)
+    model = RefAllocator(
+        free_list_ptr,
+        best_fit_stop_unsplittable=stop_unsplittable,
+    )
+    model.add_separated_blocks(
+        [200, 64, 110, 64, 100, 64, 64, 100, 150, 64, 1000], 0x1000
+    )
+    mem.load_model(model)
+    scoreboard = Scoreboard(model, mem)
+    mem.start()
+
+    dut.req_alloc_valid_i.setimmediatevalue(0)
+    dut.result_ready_i.setimmediatevalue(1)
+    await reset_dut(dut, clk)
+
+    # exact fits, an unsplittable fit, a fit that only a full walk finds
+    # and exact fits of the many 64 byte blocks
+    early_exits = 0
+    for size in [100, 100, 100, 90, 64, 64, 64, 150, 64]:
+        length = len(model.free)
+        await issue_alloc_req(dut, clk, size)
+        # the scoreboard checks the block and the heap against the full best
+        # fit of RefAllocator, the walk length against the early exit
+        expected = scoreboard.check_alloc(
+            size, BEST_FIT, await wait_for_result(dut, clk)
+        )
+        nodes = mem.traffic.last.nodes
+        print(f"alloc {size}: {expected}, {nodes} of {length} headers loaded")
+        assert (
+            nodes == expected.visited
+        ), f"{nodes} headers loaded, {expected.visited} expected"
+        early_exits += nodes < length
+
+    assert (
+        early_exits >= 6
+    ), f"only {early_exits} allocs stopped before the end of the list"
+    scoreboard.check_heap()
+    mem.stop()
+
+
+@cocotb.test()
+async def test_falafel_next_fit(dut):
+    print("------------------ Start next fit test ------------------")
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    cocotb.start_soon(sim_time_counter(dut, clk))
+
+    free_list_ptr = 8
+    lock_ptr = 0
+    lock_id = 0x9ABC
+    packed_value = pack_config(free_list_ptr, lock_ptr, lock_id)
+    dut.falafel_config_i.value = packed_value
+
+    mem = MemoryAgent(dut, clk, lock_ptr=lock_ptr)
+    model = RefAllocator(free_list_ptr)
+    model.add_separated_blocks([64, 200, 64, 300, 64, 500, 64], 0x1000)
+    mem.load_model(model)
+    scoreboard = Scoreboard(model, mem)
+    mem.start()
+
+    dut.req_alloc_valid_i.setimmediatevalue(0)
+    dut.result_ready_i.setimmediatevalue(1)
+    await reset_dut(dut, clk)
+
+    async def alloc(size, strategy=NEXT_FIT):
+        dut.config_alloc_strategy_i.value = strategy
+        await issue_alloc_req(dut, clk, size)
+        # the scoreboard checks the block and the heap, the walk length is
+        # checked against where the rover of RefAllocator says it starts
+        expected = scoreboard.check_alloc(
+            size, strategy, await wait_for_result(dut, clk)
+        )
+        nodes = mem.traffic.last.nodes
+        print(
+            f"alloc {size} ({strategy}): {expected}, {nodes} headers loaded, "
+            f"rover {model.rover}"
+        )
+        assert (
+            nodes == expected.visited
+        ), f"{nodes} headers loaded, {expected.visited} expected"
+        return expected
+
+    async def free(addr):
+        await issue_free_req(dut, clk, addr)
+        await wait_for_result(dut, clk)
+        expected = scoreboard.check_free(addr)
+        print(f"free {addr}: {expected}, rover {model.rover}")
+        return expected
+
+    # the first next fit starts at the head and leaves the rover on the
+    # remainder of the split 200 block
+    first = await alloc(100)
+    assert (
+        model.rover is not None
+        and model.rover[1] == first.fit_addr + BLOCK_HEADER_SIZE + 100
+    )
+    # resumes at the rover: the 84 byte remainder, a 64 block and the 300
+    # block, one header less than first fit from the head
+    second = await alloc(100)
+    assert second.visited == 3
+    # the 500 block is the only fit and ends the walk at its remainder
+    await alloc(400)
+    # nothing fits after the rover, so the walk wraps around to the head
+    rover = model.rover[1]
+    wrapped = await alloc(150)
+    assert wrapped.fit_addr < rover, "expected the walk to wrap around"
+
+    # the freed block merges with the remainder the rover points at, which
+    # restarts next fit from the head
+    await free(wrapped.addr)
+    assert model.rover is None
+    fit = model.free.first_fit(40)
+    position = model.free.position(fit)
+    restarted = await alloc(40)
+    assert restarted.fit_addr == fit and restarted.visited == position + 1
+
+    # first and best fit allocs drop the rover as well
+    await alloc(80)
+    assert model.rover is not None
+    await alloc(32, FIRST_FIT)
+    assert model.rover is None
+    await alloc(48)
+    await alloc(16, BEST_FIT)
+    assert model.rover is None
+
+    scoreboard.check_heap()
+    mem.stop()
+
+
+@cocotb.test()
+async def test_falafel_segregated_fit(dut):
+    print("------------------ Start segregated fit test ------------------")
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    cocotb.start_soon(sim_time_counter(dut, clk))
+    dut.config_alloc_strategy_i.setimmediatevalue(SEGREGATED_FIT)
+
+    free_list_ptr = 8  # unused by segregated fit
+    lock_ptr = 0
+    lock_id = 0x9ABC
+    size_class_ptrs = (0x40, 0x50, 0x60, 0x70)
+    size_class_limits = (64, 256, 1024)
+    dut.falafel_config_i.value = pack_config(
+        free_list_ptr, lock_ptr, lock_id, size_class_ptrs, size_class_limits
+    )
+
+    mem = MemoryAgent(dut, clk, lock_ptr=lock_ptr)
+    model = SegregatedRefAllocator(size_class_ptrs, size_class_limits)
+    free_sizes = [32, 600, 48, 2000, 200, 48, 800, 1 << 16]
+    model.add_separated_blocks(free_sizes, 0x1000)
+    mem.load_model(model)
+    scoreboard = Scoreboard(model, mem)
+    mem.start()
+
+    dut.req_alloc_valid_i.setimmediatevalue(0)
+    dut.result_ready_i.setimmediatevalue(1)
+    await reset_dut(dut, clk)
+
+    async def alloc(size):
+        await issue_alloc_req(dut, clk, size)
+        expected = scoreboard.check_alloc(
+            size, SEGREGATED_FIT, await wait_for_result(dut, clk)
+        )
+        nodes = mem.traffic.last.nodes
+        print(f"alloc {size}: {expected}, {nodes} headers loaded")
+        assert (
+            nodes == expected.visited
+        ), f"{nodes} headers loaded, {expected.visited} expected"
+        return expected
+
+    async def free(addr):
+        await issue_free_req(dut, clk, addr)
+        await wait_for_result(dut, clk)
+        expected = scoreboard.check_free(addr)
+        # besides the list, the block to free is loaded before the walk and
+        # its right neighbor before a merge with it
+        merges_right = expected.merge in (MERGE_RIGHT, MERGE_BOTH)
+        loads = expected.visited + 1 + merges_right
+        nodes = mem.traffic.last.nodes
+        print(f"free {addr}: {expected}, {nodes} headers loaded")
+        assert nodes == loads, f"{nodes} headers loaded, {loads} expected"
+        return expected
+
+    # the 32 block of class 0 is too small, the 48 block fits without a split
+    small = await alloc(40)
+    assert small.visited == 2 and not small.split
+    # the 200 block is the only one of class 1, its remainder stays there
+    medium = await alloc(100)
+    assert medium.visited == 1 and medium.split
+    # nothing in class 1 fits, the walk goes on with class 2
+    first_of_class_2 = model.classes[2].first()
+    spill = await alloc(90)
+    assert spill.visited == 2 and spill.fit_addr == first_of_class_2
+    await alloc(300)
+
+    # frees go to the class of their block and merge with its neighbors
+    assert (await free(small.addr)).merge == MERGE_NONE
+    assert (await free(medium.addr)).merge == MERGE_RIGHT
+
+    # take the merged block without a split, class 1 is left empty
+    whole = await alloc(190)
+    assert not whole.split and len(model.classes[1]) == 0
+    # an empty class only costs the load of its pointer
+    assert (await alloc(100)).visited == 1
+    # and a free into it makes the block its only header
+    assert (await free(whole.addr)).merge == MERGE_NONE
+    assert model.free_list(model.classes[1]) == [(whole.fit_addr, 200, 0)]
+
+    scoreboard.check_heap()
+    mem.stop()
+
+
+@cocotb.test()
+async def test_falafel_segregated_fit_no_cross_class_merge(dut):
+    """A free never merges with free neighbors on the list of another class."""
+    print("------------- Start segregated fit cross class test -------------")
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    cocotb.start_soon(sim_time_counter(dut, clk))
+    dut.config_alloc_strategy_i.setimmediatevalue(SEGREGATED_FIT)
+
+    free_list_ptr = 8  # unused by segregated fit
+    lock_ptr = 0
+    lock_id = 0x9ABC
+    size_class_ptrs = (0x40, 0x50, 0x60, 0x70)
+    size_class_limits = (64, 256, 1024)
+    dut.falafel_config_i.value = pack_config(
+        free_list_ptr, lock_ptr, lock_id, size_class_ptrs, size_class_limits
+    )
+
+    mem = MemoryAgent(dut, clk, lock_ptr=lock_ptr)
+    model = SegregatedRefAllocator(size_class_ptrs, size_class_limits)
+    # a class 1 block between free blocks of class 2 (left) and class 0
+    # (right), a free class 1 block far away and a class 0 block in use
+    # right of the class 0 one
+    left, target = 0x1000, 0x1000 + BLOCK_HEADER_SIZE + 600
+    right = target + BLOCK_HEADER_SIZE + 200
+    small = right + BLOCK_HEADER_SIZE + 32
+    model.add_free_block(left, 600)
+    model.add_allocated_block(target, 200)
+    model.add_free_block(right, 32)
+    model.add_allocated_block(small, 48)
+    model.add_free_block(0x4000, 100)
+    mem.load_model(model)
+    scoreboard = Scoreboard(model, mem)
+    mem.start()
+
+    dut.req_alloc_valid_i.setimmediatevalue(0)
+    dut.result_ready_i.setimmediatevalue(1)
+    await reset_dut(dut, clk)
+
+    async def free(header):
+        addr = header + BLOCK_HEADER_SIZE
+        await issue_free_req(dut, clk, addr)
+        await wait_for_result(dut, clk)
+        expected = scoreboard.check_free(addr)
+        print(f"free {addr}: {expected}")
+        return expected
+
+    # both neighbors are free, but on the lists of classes 2 and 0
+    assert (await free(target)).merge == MERGE_NONE
+    assert model.free_list(model.classes[1]) == [
+        (target, 200, 0x4000),
+        (0x4000, 100, 0),
+    ]
+    # the class 0 block in use is right of a free class 0 block: same list,
+    # so that one merges
+    assert (await free(small)).merge == MERGE_LEFT
+    assert model.free_list(model.classes[0]) == [(right, 96, 0)]
+    assert model.classes[2].first() == left
+
+    scoreboard.check_heap()
+    mem.stop()
+
+
+@cocotb.test(skip=skip("test_falafel_header_cache"))
+async def test_falafel_header_cache(dut):
+    print("------------------ Start header cache test ------------------")
+    entries = header_cache(dut)
+    keep = bool(int(getattr(dut, "HEADER_CACHE_KEEP_ON_LOCK", 0)))
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    cocotb.start_soon(sim_time_counter(dut, clk))
+    dut.config_alloc_strategy_i.setimmediatevalue(FIRST_FIT)
+
+    free_list_ptr = 8
+    lock_ptr = 0
+    lock_id = 0x9ABC
+    dut.falafel_config_i.value = pack_config(free_list_ptr, lock_ptr, lock_id)
+
+    mem = MemoryAgent(dut, clk, lock_ptr=lock_ptr)
+    model = RefAllocator(free_list_ptr)
+    model.add_separated_blocks(
+        [200, 64, 300, 1 << 16],
+        0x1000,
+        allocated_first=True,
+    )
+    mem.load_model(model)
+    scoreboard = Scoreboard(model, mem)
+    mem.start()
+
+    dut.req_alloc_valid_i.setimmediatevalue(0)
+    dut.result_ready_i.setimmediatevalue(1)
+    await reset_dut(dut, clk)
+    loads_per_header = 1 if header_burst(dut) else 2
+
+    async def check_counters(op, counters):
+        # batched builds store the unlock after the result
+        await wait_lock_release(mem, clk, lock_ptr)
+        hits = dut.header_cache_hits_o.value.integer - counters[0]
+        misses = dut.header_cache_misses_o.value.integer - counters[1]
+        traffic = mem.traffic.last
+        nodes = traffic.nodes
+        print(f"{op}: {hits} hits, {misses} misses, {nodes} headers visited")
+        # hits never reach the memory, every miss is one header load
+        assert hits == traffic.cache_hits, (hits, traffic.cache_hits)
+        assert (
+            loads_per_header * misses == traffic.as_dict()["search_reads"]
+        ), traffic.as_dict()
+        return hits
+
+    def counters():
+        return (
+            dut.header_cache_hits_o.value.integer,
+            dut.header_cache_misses_o.value.integer,
+        )
+
+    async def alloc(size):
+        before = counters()
+        await issue_alloc_req(dut, clk, size)
+        expected = scoreboard.check_alloc(
+            size, FIRST_FIT, await wait_for_result(dut, clk)
+        )
+        hits = await check_counters(f"alloc {size}", before)
+        assert mem.traffic.last.nodes == expected.visited
+        return expected, hits
+
+    async def free(addr):
+        before = counters()
+        await issue_free_req(dut, clk, addr)
+        await wait_for_result(dut, clk)
+        expected = scoreboard.check_free(addr)
+        return expected, await check_counters(f"free {addr}", before)
+
+    # the first free header is loaded by the walk and again as the right
+    # neighbor of the block in front of it, the second load hits
+    head = model.free.first()
+    freed, hits = await free(head - 32)
+    assert freed.merge == MERGE_RIGHT and (hits >= 1 or entries == 1)
+
+    # the merged head and the link stores are written through
+    first, _ = await alloc(100)
+    second, hits = await alloc(100)
+    if keep:
+        # the entries outlive the lock, the list head pointer at least hits
+        assert hits >= 1
+    await free(first.addr)
+
+    if not keep:
+        # software changes the list while falafel does not hold the lock:
+        # a new block in front of the cached head must be seen
+        new = 0x800
+        mem.write_header(new, 128, model.free.first())
+        mem.write_word(free_list_ptr, new)
+        model.add_free_block(new, 128)
+        taken, _ = await alloc(64)
+        assert taken.fit_addr == new
+    await free(second.addr)
+
+    scoreboard.check_heap()
+    print(mem.traffic.summary())
+    mem.stop()
+
+
+@cocotb.test()
+async def test_falafel_mem_req_monitor(dut):
+    print("--------------- Start memory request monitor test ---------------")
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    cocotb.start_soon(sim_time_counter(dut, clk))
+
+    free_list_ptr = 8
+    lock_ptr = 0
+    lock_id = 0x9ABC
+    packed_value = pack_config(free_list_ptr, lock_ptr, lock_id)
+    dut.falafel_config_i.value = packed_value
+    dut.config_alloc_strategy_i.value = FIRST_FIT
+
+    mem = MemoryAgent(dut, clk)
+    model = RefAllocator(free_list_ptr)
+    for addr, size in [(64, 1000), (2048, 1000)]:
+        model.add_free_block(addr, size)
+    mem.load_model(model)
+    scoreboard = Scoreboard(model, mem)
+    mem.record = True
+    mem.start()
+    monitor = MemReqMonitor(dut, clk, CLK_PERIOD, UNITS).start()
+
+    dut.req_alloc_valid_i.setimmediatevalue(0)
+    dut.result_ready_i.setimmediatevalue(1)
+    await reset_dut(dut, clk)
+
+    # the agent sleeps while falafel is idle and still counts the cycles
+    before = mem.cycle
+    for _ in range(50):
+        await FallingEdge(clk)
+    assert mem.cycle - before == 50, mem.cycle - before
+
+    addrs = []
+    for size in [100, 200, 1000]:
+        await issue_alloc_req(dut, clk, size)
+        addrs.append(
+            scoreboard.check_alloc(
+                size, FIRST_FIT, await wait_for_result(dut, clk)
+            ).addr
+        )
+    for addr in addrs:
+        await issue_free_req(dut, clk, addr)
+        await wait_for_result(dut, clk)
+        scoreboard.check_free(addr)
+    await wait_lock_release(mem, clk, lock_ptr)
+    scoreboard.check_heap()
+
+    seen = []
+    while not monitor.queue.empty():
+        seen.append(monitor.queue.get_nowait())
+    assert len(seen) == len(mem.transactions) == mem.num_reqs, (
+        len(seen),
+        mem.num_reqs,
+    )
+    offset = seen[0].cycle - mem.transactions[0].cycle
+    for got, ref in zip(seen, mem.transactions):
+        fields = ["addr", "data", "is_write", "is_cas", "cas_exp", "is_burst"]
+        assert [getattr(got, f) for f in fields] == [
+            getattr(ref, f) for f in fields
+        ], f"{got} != {ref}"
+        # the agent counts falling edges, the monitor clock periods
+        assert got.cycle - ref.cycle == offset, f"{got} != {ref}"
+    monitor.stop()
+    mem.stop()
+
+
+@cocotb.test(skip=skip("test_falafel_txn_log"))
+async def test_falafel_txn_log(dut):
+    print("------------------ Start transaction log test ------------------")
+    log = txn_log.get()
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    cocotb.start_soon(sim_time_counter(dut, clk))
+
+    free_list_ptr = 8
+    lock_ptr = 0
+    lock_id = 0x9ABC
+    packed_value = pack_config(free_list_ptr, lock_ptr, lock_id)
+    dut.falafel_config_i.value = packed_value
+    dut.config_alloc_strategy_i.value = FIRST_FIT
+
+    mem = MemoryAgent(dut, clk)
+    mem.write_header(64, 1000, 0)
+    mem.write_word(free_list_ptr, 64)
+    mem.record = True
+    mem.start()
+    dut.req_alloc_valid_i.setimmediatevalue(0)
+    dut.result_ready_i.setimmediatevalue(1)
+    await reset_dut(dut, clk)
+
+    await issue_alloc_req(dut, clk, 100)
+    addr = await wait_for_result(dut, clk)
+    await issue_free_req(dut, clk, addr)
+    free_result = await wait_for_result(dut, clk)
+    await wait_lock_release(mem, clk, lock_ptr)
+    # in batched builds the unlock comes after the result, its response is
+    # only logged once falafel takes it
+    await wait_mem_idle(mem, clk)
+    mem.stop()
+
+    # the records of this test follow the last START
+    records = list(txn_log.read_log(log.path))
+    start = max(i for i, r in enumerate(records) if r.kind == txn_log.START)
+    del records[: start + 1]
+    ops = [(r.flags, r.words[0]) for r in records if r.kind == txn_log.OP]
+    assert ops == [(txn_log.FLAG_ALLOC, 100), (0, addr)], ops
+    results = [r.words[0] for r in records if r.kind == txn_log.RESULT]
+    assert results == [addr, free_result], results
+    reqs = [r for r in records if r.kind == txn_log.MEM_REQ]
+    assert len(reqs) == len(mem.transactions), (
+        len(reqs),
+        len(mem.transactions),
+    )
+    for r, t in zip(reqs, mem.transactions):
+        assert (
+            r.words[0] == t.addr and r.words[1] == t.data & txn_log.WORD_MASK
+        ), f"{r} != {t}"
+        assert bool(r.flags & txn_log.FLAG_WRITE) == t.is_write, f"{r} != {t}"
+        assert bool(r.flags & txn_log.FLAG_CAS) == t.is_cas, f"{r} != {t}"
+    rsps = [r for r in records if r.kind == txn_log.MEM_RSP]
+    assert len(rsps) == len(reqs)
+    assert [r.words[0] for r in rsps] == [
+        t.rsp_data & txn_log.WORD_MASK for t in mem.transactions
+    ]
+    assert all(r.time >= p.time for p, r in zip(records, records[1:]))
+
+
+@cocotb.test()
+async def test_falafel_trace_window(dut):
+    print("-------------------- Start trace window test --------------------")
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    dut.req_alloc_valid_i.setimmediatevalue(0)
+    dut.result_ready_i.setimmediatevalue(1)
+    await reset_dut(dut, clk)
+
+    window = TraceWindow(dut, clk, 8).start()
+    for _ in range(20):
+        await FallingEdge(clk)
+    window.stop()
+    # only the last 8 cycles are kept, one sample per falling edge
+    assert len(window.samples) == 8
+    times = [t for t, _ in window.samples]
+    steps = [b - a for a, b in zip(times, times[1:])]
+    assert steps == [CLK_PERIOD * 1000] * len(steps), times
+    path = "test_trace_window.vcd"
+    window.write_vcd(path)
+    with open(path) as f:
+        vcd = f.read()
+    os.remove(path)
+    assert "$var wire 1 " in vcd and " mem_req_val_o $end" in vcd
+    assert vcd.count("\n#") == 8
+
+
+@cocotb.test()
+async def test_falafel_heap_image(dut):
+    print("--------------------- Start heap image test ---------------------")
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    cocotb.start_soon(sim_time_counter(dut, clk))
+
+    free_list_ptr = 8
+    lock_ptr = 0
+    lock_id = 0x9ABC
+    packed_value = pack_config(free_list_ptr, lock_ptr, lock_id)
+    dut.falafel_config_i.value = packed_value
+    dut.config_alloc_strategy_i.value = FIRST_FIT
+
+    stop_unsplittable = stops_unsplittable(dut)
+    mem = MemoryAgent(dut, clk, lock_ptr=lock_ptr)
+    mem.start()
+    dut.req_alloc_valid_i.setimmediatevalue(0)
+    dut.result_ready_i.setimmediatevalue(1)
+    await reset_dut(dut, clk)
+
+    request = 256
+    rng = random.Random(1)
+    images = [
+        (
+            FIRST_FIT,
+            first_fit_worst_case(64, request, "uniform:16:1024", rng=rng),
+        ),
+        (BEST_FIT, best_fit_worst_case(64, request, rng=rng)),
+    ]
+    for strategy, image in images:
+        # through a snapshot file and back
+        path = "test_heap_image.img.gz"
+        image.save(path)
+        image = load_image(path)
+        os.remove(path)
+        mem.mem.clear()
+        image.load(mem)
+        model = image.model(best_fit_stop_unsplittable=stop_unsplittable)
+        scoreboard = Scoreboard(model, mem)
+        scoreboard.check_heap()
+
+        dut.config_alloc_strategy_i.value = strategy
+        length = len(model.free)
+        await issue_alloc_req(dut, clk, request)
+        expected = scoreboard.check_alloc(
+            request, strategy, await wait_for_result(dut, clk)
+        )
+        await wait_lock_release(mem, clk, lock_ptr)
+        nodes = mem.traffic.last.nodes
+        print(
+            f"alloc {request} (strategy {strategy}): {expected}, "
+            f"{nodes} of {length} headers loaded"
+        )
+        # the worst cases make both strategies walk the whole list
+        assert (
+            nodes == expected.visited == length
+        ), f"{nodes} headers loaded, {expected.visited} expected"
+    mem.stop()
@@ -1,16 +1,29 @@
 import cocotb
-from cocotb.triggers import FallingEdge
 from cocotb.clock import Clock
-from mem_rsp import send_req_to_wrapper
-from monitor import monitor_req_from_falafel, monitor_falafel_ready  # noqa
+from cocotb.triggers import FallingEdge, ReadOnly
+
 from free_list import LinkedList
+from mem_agent import MemoryAgent
 from mem_rsp import (
-    send_req_to_allocate,
-    send_req_to_free,
     grant_lock,
     handle_loading_headers,
     handle_storing_headers,
+    issue_wrapper_req,
+    send_req_to_allocate,
+    send_req_to_free,
+    send_req_to_wrapper,
+    wait_for_result,
+    wait_for_wrapper_resp,
 )
+from monitor import (
+    monitor_falafel_ready,
+    monitor_req_from_falafel,
+    watchdog,
+)
+from perf_counters import decode, read_perf_counters
+from perf_counters import summary as perf_summary
+from queue_monitor import QueueMonitor
+from ref_model import FIRST_FIT, RefAllocator, Scoreboard
 
 CLK_PERIOD = 10
 MAX_SIM_TIME = 15000
@@ -36,6 +49,10 @@ REQ_FREE_MEM = 2
 FREE_LIST_PTR_ADDR = 0x10
 LOCK_PTR_ADDR = 0x18
 LOCK_ID_ADDR = 0x20
+ALLOC_STRATEGY_ADDR = 0x28
+# one register per size class, 8 bytes apart
+SIZE_CLASS_PTR_ADDR = 0x30
+SIZE_CLASS_LIMIT_ADDR = 0x50
 
 
 def write_config_req(req_id, addr):
@@ -68,6 +85,10 @@ async def reset_dut(dut, clk):
     await FallingEdge(clk)
 
 
+async def sim_time_counter(dut, clk):
+    await watchdog(MAX_SIM_TIME, CLK_PERIOD, UNITS)
+
+
 @cocotb.test()
 async def test_simple_alloc(dut):
     print("---------------------- Start first fit test ----------------------")
@@ -149,7 +170,7 @@ async def test_simple_alloc(dut):
         clk,
         linked_list,
         expected_addr=716,
-        expected_data=100,
+        expected_data=84,
         expected_next_addr=2000,
     )
     print("-----Granted creating the new block-----")
@@ -181,3 +202,399 @@ async def test_simple_alloc(dut):
 
     for i in range(10):
         await FallingEdge(clk)
+
+
+async def configure_wrapper(
+    dut,
+    clk,
+    free_list_ptr,
+    lock_ptr,
+    lock_id,
+    alloc_strategy=None,
+    size_class_ptrs=(),
+    size_class_limits=(),
+):
+    regs = [
+        (FREE_LIST_PTR_ADDR, free_list_ptr),
+        (LOCK_PTR_ADDR, lock_ptr),
+        (LOCK_ID_ADDR, lock_id),
+    ]
+    if alloc_strategy is not None:  # first fit after reset
+        regs.append((ALLOC_STRATEGY_ADDR, alloc_strategy))
+    for i, ptr in enumerate(size_class_ptrs):
+        regs.append((SIZE_CLASS_PTR_ADDR + 8 * i, ptr))
+    for i, limit in enumerate(size_class_limits):
+        regs.append((SIZE_CLASS_LIMIT_ADDR + 8 * i, limit))
+    for addr, data in regs:
+        await issue_wrapper_req(dut, clk, write_config_req(0, addr), index=0)
+        await issue_wrapper_req(dut, clk, data, index=0)
+
+
+async def wrapper_alloc(dut, clk, size, req_id=0):
+    await issue_wrapper_req(dut, clk, write_alloc_req(req_id), index=0)
+    await issue_wrapper_req(dut, clk, size, index=0)
+    return await wait_for_wrapper_resp(dut, clk)
+
+
+async def wrapper_free(dut, clk, addr, req_id=0):
+    await issue_wrapper_req(dut, clk, write_free_req(req_id), index=0)
+    await issue_wrapper_req(dut, clk, addr, index=0)
+    # frees are not answered on resp_val_o, wait for the core instead
+    await wait_for_result(dut.i_falafel, clk)
+
+
+@cocotb.test()
+async def test_mem_agent_alloc_and_free(dut):
+    print("-------------- Start memory agent alloc & free test --------------")
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    cocotb.start_soon(sim_time_counter(dut, clk))
+
+    free_list_ptr = 8
+    lock_ptr = 0
+    lock_id = 1
+
+    linked_list = LinkedList()
+    linked_list.add_node(free_list_ptr, 64, 0)  # free list pointer
+    linked_list.add_node(64, 48, 128)
+    linked_list.add_node(128, 300, 1024)
+    linked_list.add_node(1024, 1000, 0)
+
+    mem = MemoryAgent(dut, clk)
+    mem.load_linked_list(linked_list)
+    mem.start()
+
+    for i in range(len(dut.req_val_i)):
+        dut.req_val_i[i].setimmediatevalue(0)
+    dut.resp_rdy_i.setimmediatevalue(1)
+    await reset_dut(dut, clk)
+
+    await configure_wrapper(dut, clk, free_list_ptr, lock_ptr, lock_id)
+
+    assert await wrapper_alloc(dut, clk, 100) == 144
+    assert await wrapper_alloc(dut, clk, 48) == 80
+    assert mem.walk_free_list(free_list_ptr) == [
+        (244, 184, 1024),
+        (1024, 1000, 0),
+    ], mem.walk_free_list(free_list_ptr)
+
+    await wrapper_free(dut, clk, 144)
+    await wrapper_free(dut, clk, 80)
+    assert mem.walk_free_list(free_list_ptr) == [
+        (64, 364, 1024),
+        (1024, 1000, 0),
+    ], mem.walk_free_list(free_list_ptr)
+
+    mem.stop()
+
+
+@cocotb.test()
+async def test_batched_requests(dut):
+    """Queued requests share lock acquisitions on MAX_BATCH_OPS > 1 builds."""
+    print("-------------- Start batched requests test --------------")
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    cocotb.start_soon(sim_time_counter(dut, clk))
+    max_batch_ops = int(getattr(dut, "MAX_BATCH_OPS", 1))
+
+    free_list_ptr = 8
+    lock_ptr = 0
+    lock_id = 1
+
+    mem = MemoryAgent(dut, clk, lock_ptr=lock_ptr)
+    model = RefAllocator(free_list_ptr)
+    model.add_separated_blocks([64, 200, 64, 300, 1000], 0x1000)
+    mem.load_model(model)
+    scoreboard = Scoreboard(model, mem)
+    mem.start()
+
+    for i in range(len(dut.req_val_i)):
+        dut.req_val_i[i].setimmediatevalue(0)
+    dut.resp_rdy_i.setimmediatevalue(1)
+    await reset_dut(dut, clk)
+    await configure_wrapper(dut, clk, free_list_ptr, lock_ptr, lock_id)
+
+    async def check_results(ops):
+        # each result of the inner falafel, frees included, is checked when
+        # it comes out, before the next op of a batch touches the heap
+        addrs = []
+        for op, arg in ops:
+            result = await wait_for_result(dut.i_falafel, clk)
+            if op == "alloc":
+                expected = scoreboard.check_alloc(arg, FIRST_FIT, result)
+                addrs.append(expected.addr)
+            else:
+                scoreboard.check_free(arg)
+        return addrs
+
+    # the requests queue up in the alloc and free FIFOs while the first
+    # op of each group runs
+    sizes = [100, 48, 150, 64, 16]
+    allocs = [("alloc", size) for size in sizes]
+    results = cocotb.start_soon(check_results(allocs))
+    cas_attempts = mem.cas_attempts
+    for size in sizes:
+        await issue_wrapper_req(dut, clk, write_alloc_req(0), index=0)
+        await issue_wrapper_req(dut, clk, size, index=0)
+    addrs = await results
+    alloc_locks = mem.cas_attempts - cas_attempts
+
+    frees = [("free", addr) for addr in addrs]
+    results = cocotb.start_soon(check_results(frees))
+    cas_attempts = mem.cas_attempts
+    for addr in addrs:
+        await issue_wrapper_req(dut, clk, write_free_req(0), index=0)
+        await issue_wrapper_req(dut, clk, addr, index=0)
+    await results
+    free_locks = mem.cas_attempts - cas_attempts
+    # the lock of the last batch is released after its result
+    for _ in range(20):
+        await FallingEdge(clk)
+
+    print(
+        f"MAX_BATCH_OPS={max_batch_ops}: {alloc_locks} lock acquisitions for "
+        f"{len(sizes)} allocs, {free_locks} for {len(addrs)} frees"
+    )
+    if max_batch_ops == 1:
+        assert (alloc_locks, free_locks) == (len(sizes), len(addrs))
+    else:
+        assert alloc_locks < len(sizes) and free_locks < len(addrs)
+    assert mem.read_word(lock_ptr) == 0, "lock not released"
+    assert mem.traffic.ops["free"] == len(addrs), mem.traffic.ops
+    scoreboard.check_heap()
+    mem.stop()
+
+
+@cocotb.test()
+async def test_perf_counters(dut):
+    """The perf counter registers agree with the memory agent and testbench."""
+    print("-------------- Start perf counters test --------------")
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    cocotb.start_soon(sim_time_counter(dut, clk))
+
+    free_list_ptr = 8
+    lock_ptr = 0
+    lock_id = 1
+
+    mem = MemoryAgent(
+        dut,
+        clk,
+        lock_ptr=lock_ptr,
+        lock_contention=0.3,
+        lock_hold="fixed:3",
+        seed=1,
+    )
+    model = RefAllocator(free_list_ptr)
+    model.add_free_block(0x1000, 0x10000)
+    mem.load_model(model)
+    scoreboard = Scoreboard(model, mem)
+    mem.start()
+
+    # op cycles as falafel_perf_counters counts them: from the request
+    # handshake of the inner falafel to its result handshake
+    cycles = {True: [], False: []}
+
+    async def measure_ops():
+        falafel = dut.i_falafel
+        start = None
+        while True:
+            await FallingEdge(clk)
+            if start is not None:
+                start[1] += 1
+                if (
+                    falafel.rsp_result_val_o.value == 1
+                    and falafel.result_ready_i.value == 1
+                ):
+                    cycles[start[0]].append(start[1])
+                    start = None
+            if (
+                falafel.req_alloc_valid_i.value == 1
+                and falafel.req_alloc_ready_o.value == 1
+            ):
+                start = [falafel.is_alloc_i.value == 1, 0]
+
+    for i in range(len(dut.req_val_i)):
+        dut.req_val_i[i].setimmediatevalue(0)
+    dut.resp_rdy_i.setimmediatevalue(1)
+    await reset_dut(dut, clk)
+    cocotb.start_soon(measure_ops())
+    await configure_wrapper(dut, clk, free_list_ptr, lock_ptr, lock_id)
+
+    addrs = []
+    for size in [100, 48, 300, 64]:
+        addrs.append(
+            scoreboard.check_alloc(
+                size, FIRST_FIT, await wrapper_alloc(dut, clk, size)
+            ).addr
+        )
+    for addr in addrs[::2]:
+        await wrapper_free(dut, clk, addr)
+        scoreboard.check_free(addr)
+
+    # with no one reading the responses the resp FIFO fills up and holds
+    # off the next alloc, and the requests behind it fill the alloc FIFO
+    dut.resp_rdy_i.value = 0
+    sizes = [16 * (i + 1) for i in range(10)]
+
+    async def check_results():
+        # checked when the inner falafel hands them over, before the next alloc
+        addrs = []
+        for size in sizes:
+            while True:
+                await FallingEdge(clk)
+                falafel = dut.i_falafel
+                if (
+                    falafel.rsp_result_val_o.value == 1
+                    and falafel.result_ready_i.value == 1
+                ):
+                    break
+            result = falafel.rsp_result_data_o.value.integer
+            addrs.append(scoreboard.check_alloc(size, FIRST_FIT, result).addr)
+        return addrs
+
+    results = cocotb.start_soon(check_results())
+    for size in sizes:
+        await issue_wrapper_req(dut, clk, write_alloc_req(0), index=0)
+        await issue_wrapper_req(dut, clk, size, index=0)
+    for _ in range(5000):
+        await FallingEdge(clk)
+        if (
+            dut.i_falafel.rsp_result_val_o.value == 1
+            and dut.i_falafel.result_ready_i.value == 0
+        ):
+            break
+    for _ in range(10):
+        await FallingEdge(clk)
+    dut.resp_rdy_i.value = 1
+    resps = [await wait_for_wrapper_resp(dut, clk) for _ in sizes]
+    assert resps == await results, resps
+    for _ in range(20):
+        await FallingEdge(clk)
+    scoreboard.check_heap()
+
+    counters = decode(await read_perf_counters(dut, clk))
+    print(perf_summary(counters))
+    allocs, frees = cycles[True], cycles[False]
+    assert counters["allocs"] == len(allocs) == 4 + len(sizes), counters
+    assert counters["frees"] == len(frees) == 2, counters
+    assert counters["alloc_cycles"] == sum(allocs), (counters, allocs)
+    assert counters["alloc_max_cycles"] == max(allocs), (counters, allocs)
+    assert counters["free_cycles"] == sum(frees), (counters, frees)
+    assert counters["free_max_cycles"] == max(frees), (counters, frees)
+    assert counters["mem_reqs"] == mem.num_reqs, (counters, mem.num_reqs)
+    assert counters["cas_retries"] == mem.cas_failures, (
+        counters,
+        mem.lock_stats(),
+    )
+    nodes = sum(total.nodes for total in mem.traffic.totals.values())
+    assert counters["headers_visited"] == nodes, (counters, nodes)
+    assert counters["resp_fifo_full_cycles"] > 0, counters
+    assert counters["alloc_fifo_full_cycles"] > 0, counters
+    assert counters["free_fifo_full_cycles"] == 0, counters
+    hits = dut.header_cache_hits_o.value.integer
+    misses = dut.header_cache_misses_o.value.integer
+    assert counters["header_cache_hits"] == hits, counters
+    assert counters["header_cache_misses"] == misses, counters
+    mem.stop()
+
+
+@cocotb.test()
+async def test_queue_monitor(dut):
+    """QueueMonitor's occupancy, arrivals and stalls on a burst of allocs."""
+    print("-------------- Start queue monitor test --------------")
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    cocotb.start_soon(sim_time_counter(dut, clk))
+
+    free_list_ptr = 8
+    lock_ptr = 0
+    lock_id = 1
+
+    mem = MemoryAgent(dut, clk, lock_ptr=lock_ptr)
+    model = RefAllocator(free_list_ptr)
+    model.add_free_block(0x1000, 0x10000)
+    mem.load_model(model)
+    mem.start()
+
+    for i in range(len(dut.req_val_i)):
+        dut.req_val_i[i].setimmediatevalue(0)
+    dut.resp_rdy_i.setimmediatevalue(1)
+    await reset_dut(dut, clk)
+    await configure_wrapper(dut, clk, free_list_ptr, lock_ptr, lock_id)
+
+    # cycles each result spends in the response FIFO, from the cycle it is
+    # written to the one it is read
+    residence = []
+
+    async def measure_resp_fifo():
+        fifo = dut.i_resp_fifo
+        written = []
+        cycle = 0
+        while True:
+            await FallingEdge(clk)
+            await ReadOnly()
+            cycle += 1
+            if fifo.read_i.value == 1:
+                residence.append(cycle - written.pop(0))
+            if fifo.write_i.value == 1:
+                written.append(cycle)
+
+    monitor = QueueMonitor(dut, clk).start()
+    cocotb.start_soon(measure_resp_fifo())
+
+    # the results pile up in the response FIFO until it is full, then the
+    # requests behind them fill the alloc FIFO and the two entries of the
+    # input parser, and the last one stalls the queue
+    capacity = int(getattr(dut, "NUM_OP_FIFO_ENTRIES", 4)) + 1
+    sizes = [16 * (i + 1) for i in range(2 * capacity + 4)]
+
+    async def issue_allocs():
+        for size in sizes:
+            await issue_wrapper_req(dut, clk, write_alloc_req(0), index=0)
+            await issue_wrapper_req(dut, clk, size, index=0)
+
+    dut.resp_rdy_i.value = 0
+    issued = cocotb.start_soon(issue_allocs())
+    for _ in range(10000):
+        await FallingEdge(clk)
+        if (
+            dut.i_falafel.rsp_result_val_o.value == 1
+            and dut.i_falafel.result_ready_i.value == 0
+        ):
+            break
+    for _ in range(50):
+        await FallingEdge(clk)
+    dut.resp_rdy_i.value = 1
+    for _ in sizes:
+        await wait_for_wrapper_resp(dut, clk)
+    await issued
+    for _ in range(20):
+        await FallingEdge(clk)
+    monitor.stop()
+
+    profile = monitor.profile
+    print(profile.report())
+    for fifo in ("alloc", "free", "resp"):
+        assert sum(profile.occupancy[fifo].values()) == profile.cycles
+    assert profile.arrivals == {
+        "alloc": len(sizes),
+        "resp": len(sizes),
+    }, profile.arrivals
+    occupancy = profile.occupancy
+    assert max(occupancy["alloc"]) == capacity, occupancy["alloc"]
+    assert max(occupancy["resp"]) == capacity, occupancy["resp"]
+    assert max(occupancy["free"]) == 0
+    # every result was read back before the monitor stopped, so Little's
+    # law holds exactly
+    assert len(residence) == len(sizes), residence
+    mean = sum(residence) / len(residence)
+    assert abs(profile.residence("resp") - mean) < 1e-9, (
+        profile.residence("resp"),
+        residence,
+    )
+    assert profile.words[0] == 2 * len(sizes), profile.words
+    assert profile.stall_cycles[0] > 0
+    waited = sum(w * n for w, n in profile.waits[0].items())
+    assert profile.stall_cycles[0] == waited, profile.waits[0]
+    mem.stop()
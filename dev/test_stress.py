@@ -0,0 +1,298 @@
+import os
+import random
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.result import SimTimeoutError
+from cocotb.triggers import with_timeout
+
+from alloc_trace import OP_ALLOC, OP_FREE, TraceWriter
+from heap_image import load_image
+from mem_agent import MemoryAgent
+from mem_rsp import issue_alloc_req, issue_free_req, wait_for_result
+from monitor import watchdog
+from ref_model import (
+    BEST_FIT,
+    BLOCK_HEADER_SIZE,
+    FIRST_FIT,
+    MIN_ALLOC_SIZE,
+    NEXT_FIT,
+    SEGREGATED_FIT,
+    RefAllocator,
+    Scoreboard,
+    SegregatedRefAllocator,
+    pack_config,
+)
+from test_falafel import reset_dut
+from test_falafel_wrapper import configure_wrapper, wrapper_alloc, wrapper_free
+
+CLK_PERIOD = 10
+UNITS = "ns"
+
+FREE_LIST_PTR = 8
+LOCK_PTR = 0
+LOCK_ID = 1
+HEAP_BASE = 0x1000
+TAIL_BLOCK_SIZE = 1 << 24
+# the word after each pointer is written along with it, like the one after
+# the free list pointer
+SIZE_CLASS_PTRS = (0x40, 0x50, 0x60, 0x70)
+SIZE_CLASS_LIMITS = (64, 256, 1024)
+
+# every op gets OP_BASE_CYCLES plus CYCLES_PER_HEADER for each header that
+# can be on the free list when it starts, instead of a fixed MAX_SIM_TIME
+OP_BASE_CYCLES = 200
+CYCLES_PER_HEADER = 32
+
+STRATEGIES = {
+    "first": [FIRST_FIT],
+    "best": [BEST_FIT],
+    "next": [NEXT_FIT],
+    # a heap of size class lists is only valid for segregated fit
+    "segregated": [SEGREGATED_FIT],
+    "random": [FIRST_FIT, BEST_FIT, NEXT_FIT],
+}
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default), 0)
+
+
+class StressGenerator:
+    """Constrained-random alloc/free sequence kept legal by RefAllocator.
+
+    Sizes mix small, medium and large requests with exact fits of the last
+    freed block (so the no-split path is hit); frees pick a random live
+    block. Allocations that no free block fits are turned into frees, as
+    falafel would walk off the end of the free list.
+    """
+
+    def __init__(self, rng, model, strategies, alloc_ratio):
+        self.rng = rng
+        self.model = model
+        self.strategies = strategies
+        self.alloc_ratio = alloc_ratio
+        self.live = []
+        self.last_freed_size = None
+
+    def init_heap(self, mem, num_free_blocks):
+        # free blocks separated by allocated gaps so nothing merges up front,
+        # followed by a large tail block that keeps allocations satisfiable
+        rng = self.rng
+        addr = HEAP_BASE
+        for i in range(num_free_blocks):
+            gap_size = rng.randint(MIN_ALLOC_SIZE, 256)
+            self.model.add_allocated_block(addr, gap_size)
+            self.live.append(addr + BLOCK_HEADER_SIZE)
+            addr += BLOCK_HEADER_SIZE + gap_size
+            free_size = rng.randint(1, 1024)
+            self.model.add_free_block(addr, free_size)
+            addr += BLOCK_HEADER_SIZE + free_size
+        self.model.add_free_block(addr, TAIL_BLOCK_SIZE)
+
+        mem.load_model(self.model)
+
+    def load_image(self, mem, image):
+        # a saved heap (see heap_image.py) instead of init_heap, its
+        # allocated blocks are the live ones
+        self.live.extend(
+            addr + BLOCK_HEADER_SIZE for addr, _ in image.allocated_blocks()
+        )
+        image.load(mem)
+
+    def alloc_size(self):
+        rng = self.rng
+        r = rng.random()
+        if r < 0.1 and self.last_freed_size is not None:
+            size = self.last_freed_size - rng.randint(0, MIN_ALLOC_SIZE - 1)
+            return max(size, 1)
+        if r < 0.55:
+            return rng.randint(1, 64)
+        if r < 0.9:
+            return rng.randint(65, 512)
+        return rng.randint(513, 4096)
+
+    def next_op(self):
+        rng = self.rng
+        if self.live and rng.random() >= self.alloc_ratio:
+            return self.free_op()
+        size = self.alloc_size()
+        strategy = rng.choice(self.strategies)
+        if not self.model.can_alloc(size, strategy):
+            assert self.live, f"nothing to free and no block fits {size}"
+            return self.free_op()
+        return ("alloc", size, strategy)
+
+    def free_op(self):
+        i = self.rng.randrange(len(self.live))
+        self.live[i], self.live[-1] = self.live[-1], self.live[i]
+        addr = self.live.pop()
+        assert self.model.can_free(addr)
+        header = addr - BLOCK_HEADER_SIZE
+        self.last_freed_size = self.model.allocated[header][0]
+        return ("free", addr)
+
+
+@cocotb.test()
+async def test_stress_alloc_free(dut):
+    """Long constrained-random run checked against the reference model.
+
+    Runs on both toplevels (make MODULE=test_stress [TOPLEVEL=falafel_wrapper])
+    and is configured from the environment:
+      STRESS_SEED            seed of the op sequence (default: RANDOM_SEED)
+      STRESS_OPS             number of alloc/free ops (default: 20000)
+      STRESS_FREE_BLOCKS     free blocks in the initial heap (default: 64)
+      STRESS_HEAP            start from this heap snapshot instead (see
+                             heap_image.py; not with segregated fit)
+      STRESS_ALLOC_RATIO     probability of an alloc (default: 0.5)
+      STRESS_STRATEGY        first, best, next, segregated or random (default:
+                             random, which leaves out segregated);
+                             the wrapper runs one of them, set through
+                             its ALLOC_STRATEGY register
+      STRESS_CHECK_INTERVAL  ops between full heap checks (default: 1000)
+      STRESS_MAX_SIM_TIME    budget in cycles, 0 for none (default: 0)
+      STRESS_TRACE           write the ops as an allocation trace here
+    """
+    print("-------------- Start constrained-random stress test --------------")
+    clk = dut.clk_i
+    cocotb.start_soon(Clock(clk, CLK_PERIOD, UNITS).start())
+    is_wrapper = hasattr(dut, "req_val_i")
+
+    seed = env_int("STRESS_SEED", str(cocotb.RANDOM_SEED))
+    num_ops = env_int("STRESS_OPS", "20000")
+    num_free_blocks = env_int("STRESS_FREE_BLOCKS", "64")
+    alloc_ratio = float(os.environ.get("STRESS_ALLOC_RATIO", "0.5"))
+    strategies = STRATEGIES[os.environ.get("STRESS_STRATEGY", "random")]
+    check_interval = env_int("STRESS_CHECK_INTERVAL", "1000")
+    max_sim_time = env_int("STRESS_MAX_SIM_TIME", "0")
+    if is_wrapper:
+        # the strategy is a config register of the wrapper, pick one per run
+        strategies = [random.Random(seed).choice(strategies)]
+    print(
+        f"seed={seed} ops={num_ops} free_blocks={num_free_blocks} "
+        f"alloc_ratio={alloc_ratio} strategies={strategies}"
+    )
+
+    mem = MemoryAgent(dut, clk)
+    stop_unsplittable = getattr(dut, "BEST_FIT_STOP_UNSPLITTABLE", 0)
+    stop_unsplittable = bool(int(stop_unsplittable))
+    image = None
+    if "STRESS_HEAP" in os.environ:
+        image = load_image(os.environ["STRESS_HEAP"])
+    if strategies == [SEGREGATED_FIT]:
+        assert image is None, "heap images have a single free list"
+        model = SegregatedRefAllocator(SIZE_CLASS_PTRS, SIZE_CLASS_LIMITS)
+    elif image is not None:
+        assert image.free_list_ptr == FREE_LIST_PTR, f"{image.free_list_ptr=}"
+        model = image.model(best_fit_stop_unsplittable=stop_unsplittable)
+    else:
+        model = RefAllocator(
+            FREE_LIST_PTR, best_fit_stop_unsplittable=stop_unsplittable
+        )
+    gen = StressGenerator(random.Random(seed), model, strategies, alloc_ratio)
+    if image is not None:
+        gen.load_image(mem, image)
+    else:
+        gen.init_heap(mem, num_free_blocks)
+    scoreboard = Scoreboard(model, mem, full_check_interval=check_interval)
+    mem.start()
+
+    if is_wrapper:
+        for i in range(len(dut.req_val_i)):
+            dut.req_val_i[i].setimmediatevalue(0)
+        dut.resp_rdy_i.setimmediatevalue(1)
+        await reset_dut(dut, clk)
+        await configure_wrapper(
+            dut,
+            clk,
+            FREE_LIST_PTR,
+            LOCK_PTR,
+            LOCK_ID,
+            strategies[0],
+            size_class_ptrs=SIZE_CLASS_PTRS,
+            size_class_limits=SIZE_CLASS_LIMITS,
+        )
+    else:
+        dut.falafel_config_i.value = pack_config(
+            FREE_LIST_PTR,
+            LOCK_PTR,
+            LOCK_ID,
+            SIZE_CLASS_PTRS,
+            SIZE_CLASS_LIMITS,
+        )
+        dut.config_alloc_strategy_i.value = strategies[0]
+        dut.req_alloc_valid_i.setimmediatevalue(0)
+        dut.result_ready_i.setimmediatevalue(1)
+        await reset_dut(dut, clk)
+
+    async def alloc(size, strategy):
+        if is_wrapper:
+            return await wrapper_alloc(dut, clk, size)
+        dut.config_alloc_strategy_i.value = strategy
+        await issue_alloc_req(dut, clk, size)
+        return await wait_for_result(dut, clk)
+
+    async def free(addr):
+        if is_wrapper:
+            await wrapper_free(dut, clk, addr)
+            return
+        await issue_free_req(dut, clk, addr)
+        await wait_for_result(dut, clk)
+
+    if max_sim_time:
+        cocotb.start_soon(
+            watchdog(max_sim_time, CLK_PERIOD, UNITS, "STRESS_MAX_SIM_TIME")
+        )
+
+    trace = None
+    if "STRESS_TRACE" in os.environ:
+        trace = TraceWriter(os.environ["STRESS_TRACE"])
+        trace_ids = {}  # payload address -> trace id
+        start_cycle = mem.cycle
+
+    max_visited = 0
+    for i in range(num_ops):
+        op = gen.next_op()
+        if trace is not None:
+            timestamp = mem.cycle - start_cycle
+            if op[0] == "alloc":
+                trace.write(OP_ALLOC, op[1], i, timestamp)
+            elif op[1] in trace_ids:  # blocks of the initial heap have no id
+                trace.write(OP_FREE, 0, trace_ids.pop(op[1]), timestamp)
+        headers = model.num_free_blocks() + 1
+        budget = OP_BASE_CYCLES + CYCLES_PER_HEADER * headers
+        try:
+            if op[0] == "alloc":
+                _, size, strategy = op
+                result = await with_timeout(
+                    alloc(size, strategy), budget * CLK_PERIOD, UNITS
+                )
+                expected = scoreboard.check_alloc(size, strategy, result)
+                gen.live.append(expected.addr)
+                if trace is not None:
+                    trace_ids[expected.addr] = i
+            else:
+                await with_timeout(free(op[1]), budget * CLK_PERIOD, UNITS)
+                expected = scoreboard.check_free(op[1])
+        except SimTimeoutError:
+            slow = f"took more than {budget} cycles"
+            assert False, f"op {i} {op} {slow} (seed={seed})"
+        except AssertionError as e:
+            raise AssertionError(f"op {i} {op} (seed={seed}): {e}") from e
+        max_visited = max(max_visited, expected.visited)
+
+        if (i + 1) % 1000 == 0:
+            print(
+                f"{i + 1} ops, {mem.cycle} cycles, "
+                f"{model.num_free_blocks()} free blocks, "
+                f"{len(gen.live)} live blocks, "
+                f"max {max_visited} headers visited"
+            )
+
+    if trace is not None:
+        trace.close()
+    scoreboard.check_heap()
+    scoreboard.report()
+    print(mem.traffic.summary())
+    print(f"seed={seed}: {num_ops} ops in {mem.cycle} cycles")
+    mem.stop()
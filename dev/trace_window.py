@@ -0,0 +1,140 @@
+"""The last cycles before a failure as a VCD, without tracing the whole run.
+
+Set TRACE_WINDOW to a number of cycles N to enable it for every test that
+starts a MemoryAgent: the signals of the toplevel and the state_q of
+falafel_core and falafel_lsu are sampled once per cycle (at the falling
+edge, after the design settled) into a ring buffer of the last N samples.
+MemoryAgent.stop() at the end of a test drops it; a test that ends without
+it, because an assertion failed or a timeout hit, leaves its window
+behind, written to trace_window_<time>ns.vcd when the next test starts or
+the simulation ends. Any VCD viewer (gtkwave, surfer) opens it.
+
+Full waveforms of a run are opt-in: WAVES=1 make ... or
+regress.py --waves build a traced model and dump all of it to dump.fst.
+"""
+
+import atexit
+import os
+from collections import deque
+
+import cocotb
+from cocotb.handle import ModifiableObject, NonHierarchyIndexableObject
+from cocotb.triggers import FallingEdge, ReadOnly
+from cocotb.utils import get_sim_time
+
+FILE_PREFIX = "trace_window_"
+
+
+def vcd_id(n):
+    """Short VCD identifier of the n-th signal."""
+    chars = []
+    while True:
+        chars.append(chr(33 + n % 94))
+        n //= 94
+        if n == 0:
+            return "".join(chars)
+
+
+def traced_signals(dut):
+    """(scope, name, handle) of the signals the window records."""
+    signals = []
+    for handle in sorted(dut, key=lambda h: h._name):
+        if isinstance(handle, ModifiableObject):
+            signals.append(("top", handle._name, handle))
+        elif isinstance(handle, NonHierarchyIndexableObject):
+            for i, element in enumerate(handle):
+                if isinstance(element, ModifiableObject):
+                    signals.append(("top", f"{handle._name}_{i}", element))
+    falafel = dut.i_falafel if hasattr(dut, "i_falafel") else dut
+    for scope, name in [("core", "i_core"), ("lsu", "i_lsu")]:
+        if hasattr(falafel, name):
+            signals.append((scope, "state_q", getattr(falafel, name).state_q))
+    return signals
+
+
+class TraceWindow:
+    """Keeps the last `cycles` samples of `dut`, see the module docstring."""
+
+    def __init__(self, dut, clk, cycles):
+        self.dut = dut
+        self.clk = clk
+        self.signals = traced_signals(dut)
+        self.samples = deque(maxlen=cycles)  # (sim time in ps, binstrs)
+        self._task = None
+
+    def start(self):
+        self._task = cocotb.start_soon(self._run())
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+
+    async def _run(self):
+        handles = [handle for _, _, handle in self.signals]
+        while True:
+            await FallingEdge(self.clk)
+            await ReadOnly()
+            values = tuple(handle.value.binstr for handle in handles)
+            self.samples.append((get_sim_time("ps"), values))
+
+    def write_vcd(self, path):
+        with open(path, "w") as f:
+            f.write("$timescale 1ps $end\n")
+            scope = None
+            for n, (s, name, handle) in enumerate(self.signals):
+                if s != scope:
+                    if scope is not None:
+                        f.write("$upscope $end\n")
+                    f.write(f"$scope module {s} $end\n")
+                    scope = s
+                f.write(f"$var wire {len(handle)} {vcd_id(n)} {name} $end\n")
+            f.write("$upscope $end\n$enddefinitions $end\n")
+            last = None
+            for time, values in self.samples:
+                f.write(f"#{time}\n")
+                for n, value in enumerate(values):
+                    if last is None or last[n] != value:
+                        if len(value) == 1:
+                            f.write(f"{value.lower()}{vcd_id(n)}\n")
+                        else:
+                            f.write(f"b{value.lower()} {vcd_id(n)}\n")
+                last = values
+
+
+_running = []  # windows of tests that have not stopped them yet
+
+
+def _write_left_behind():
+    while _running:
+        window = _running.pop()
+        window.stop()
+        if window.samples:
+            path = f"{FILE_PREFIX}{int(window.samples[-1][0]) // 1000}ns.vcd"
+            window.write_vcd(path)
+            print(f"wrote the last {len(window.samples)} cycles to {path}")
+
+
+atexit.register(_write_left_behind)
+
+
+def from_env(dut, clk):
+    """A started TraceWindow if TRACE_WINDOW is set, otherwise None.
+
+    Windows left behind by earlier tests are written out first.
+    """
+    _write_left_behind()
+    cycles = int(os.environ.get("TRACE_WINDOW", "0"))
+    if not cycles:
+        return None
+    window = TraceWindow(dut, clk, cycles).start()
+    _running.append(window)
+    return window
+
+
+def drop(window):
+    """Stops `window` without writing it, its test got to the end."""
+    window.stop()
+    if window in _running:
+        _running.remove(window)
@@ -0,0 +1,247 @@
+"""Compact binary log of the transactions of a simulation.
+
+Always on and cheap enough for long stress runs: the memory agent logs
+every memory request it takes and every response falafel takes, the
+mem_rsp helpers log the ops they issue and the results they receive. Each
+record is a fixed little-endian struct, a 6 byte header
+    kind (u8), flags (u8), time since the previous record (u32, sim steps)
+followed by the 64-bit words of its kind (a TIME record carries the
+absolute time when the delta does not fit):
+    MEM_REQ  addr, data[, data_hi if FLAG_BURST][, cas_exp if FLAG_CAS]
+    MEM_RSP  data[, data_hi if FLAG_BURST, a 128-bit response]
+    OP       size to allocate or address to free (FLAG_ALLOC), wrapper
+             words with FLAG_WRAPPER and the queue index in the upper flags
+    RESULT   result data, FLAG_WRITE for rsp_result_is_write_o
+    START    nothing, a MemoryAgent was started (one per test, usually)
+
+The log goes to TXN_LOG (default txn_log.bin in the working directory;
+set it to an empty string to turn it off) and is read back by
+    python txn_log.py txn_log.bin [--last N] [--kind mem_req] [--addr ADDR]
+"""
+
+import argparse
+import atexit
+import os
+import struct
+from collections import deque
+
+import cocotb
+from cocotb.utils import get_sim_time
+
+MAGIC = b"FLTXLOG1"
+# header: magic, time precision of the simulator as a power of ten
+FILE_HEADER = struct.Struct("<8sb")
+RECORD = struct.Struct("<BBI")
+WORD = struct.Struct("<Q")
+MAX_DELTA = (1 << 32) - 1
+WORD_MASK = (1 << 64) - 1
+
+MEM_REQ = 1
+MEM_RSP = 2
+OP = 3
+RESULT = 4
+START = 5
+TIME = 6
+KINDS = {
+    MEM_REQ: "mem_req",
+    MEM_RSP: "mem_rsp",
+    OP: "op",
+    RESULT: "result",
+    START: "start",
+}
+
+FLAG_WRITE = 1 << 0
+FLAG_CAS = 1 << 1
+FLAG_BURST = 1 << 2
+FLAG_ALLOC = 1 << 3
+FLAG_WRAPPER = 1 << 4
+QUEUE_SHIFT = 5  # queue index of wrapper words in flags[7:5]
+
+DEFAULT_PATH = "txn_log.bin"
+
+
+class TxnLog:
+    """Writer; records are buffered and flushed by flush() and close()."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb", buffering=1 << 16)
+        precision = cocotb.simulator.get_precision()
+        self.file.write(FILE_HEADER.pack(MAGIC, precision))
+        self.last_time = 0
+
+    def _record(self, kind, flags, *words):
+        now = get_sim_time()
+        delta = now - self.last_time
+        if delta > MAX_DELTA:
+            self.file.write(RECORD.pack(TIME, 0, 0) + WORD.pack(now))
+            delta = 0
+        self.last_time = now
+        fmt = f"<BBI{len(words)}Q"
+        self.file.write(struct.pack(fmt, kind, flags, delta, *words))
+
+    def mem_req(self, addr, data, is_write, is_cas, cas_exp, is_burst=False):
+        flags = (FLAG_WRITE if is_write else 0) | (FLAG_CAS if is_cas else 0)
+        words = [addr, data & WORD_MASK]
+        if is_burst:
+            flags |= FLAG_BURST
+            words.append(data >> 64)
+        if is_cas:
+            words.append(cas_exp)
+        self._record(MEM_REQ, flags, *words)
+
+    def mem_rsp(self, data):
+        if data > WORD_MASK:
+            self._record(MEM_RSP, FLAG_BURST, data & WORD_MASK, data >> 64)
+        else:
+            self._record(MEM_RSP, 0, data)
+
+    def op(self, is_alloc, value):
+        self._record(OP, FLAG_ALLOC if is_alloc else 0, value)
+
+    def wrapper_word(self, index, word):
+        self._record(OP, FLAG_WRAPPER | (index << QUEUE_SHIFT), word)
+
+    def result(self, data, is_write=False):
+        self._record(RESULT, FLAG_WRITE if is_write else 0, data)
+
+    def start(self):
+        self._record(START, 0)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+_log = None
+
+
+def enabled():
+    """False if an empty TXN_LOG turns the log off."""
+    return bool(os.environ.get("TXN_LOG", DEFAULT_PATH))
+
+
+def get():
+    """The log of this simulation, opened on first use; None if disabled."""
+    global _log
+    if _log is None:
+        if not enabled():
+            return None
+        _log = TxnLog(os.environ.get("TXN_LOG", DEFAULT_PATH))
+        atexit.register(_log.close)
+    return _log
+
+
+class Record:
+    def __init__(self, kind, flags, time, words):
+        self.kind = kind
+        self.flags = flags
+        self.time = time  # in seconds
+        self.words = words
+
+    @property
+    def addr(self):
+        return self.words[0] if self.kind == MEM_REQ else None
+
+    def __str__(self):
+        f = self.flags
+        if self.kind == MEM_REQ:
+            kind = "CAS" if f & FLAG_CAS else "WR" if f & FLAG_WRITE else "RD"
+            kind += "x2" if f & FLAG_BURST else ""
+            text = f"{kind:5} addr={self.words[0]:#x} data={self.words[1]:#x}"
+            if f & FLAG_BURST:
+                text += f" data_hi={self.words[2]:#x}"
+            if f & FLAG_CAS:
+                text += f" cas_exp={self.words[-1]:#x}"
+        elif self.kind == MEM_RSP:
+            text = f"RSP   data={self.words[0]:#x}" + (
+                f" data_hi={self.words[1]:#x}" if f & FLAG_BURST else ""
+            )
+        elif self.kind == OP:
+            if f & FLAG_WRAPPER:
+                text = f"WORD  queue={f >> QUEUE_SHIFT} {self.words[0]:#x}"
+            elif f & FLAG_ALLOC:
+                text = f"ALLOC size={self.words[0]}"
+            else:
+                text = f"FREE  addr={self.words[0]:#x}"
+        elif self.kind == RESULT:
+            text = f"RESULT {self.words[0]:#x}"
+            if f & FLAG_WRITE:
+                text += " (write)"
+        else:
+            text = "START"
+        return f"{self.time * 1e9:14.1f} ns {text}"
+
+
+def word_count(kind, flags):
+    if kind == MEM_REQ:
+        return 2 + bool(flags & FLAG_BURST) + bool(flags & FLAG_CAS)
+    if kind == MEM_RSP:
+        return 1 + bool(flags & FLAG_BURST)
+    if kind in (OP, RESULT, TIME):
+        return 1
+    return 0
+
+
+def read_log(path):
+    """Yields the Records of a log, in order."""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, precision = FILE_HEADER.unpack_from(data)
+    assert magic == MAGIC, f"{path} is not a transaction log"
+    step = 10.0**precision
+    pos = FILE_HEADER.size
+    time = 0
+    while pos + RECORD.size <= len(data):
+        kind, flags, delta = RECORD.unpack_from(data, pos)
+        pos += RECORD.size
+        n = word_count(kind, flags)
+        if pos + n * WORD.size > len(data):
+            break  # cut off, e.g. by a crash before the last flush
+        words = struct.unpack_from(f"<{n}Q", data, pos)
+        pos += n * WORD.size
+        if kind == TIME:
+            time = words[0]
+            continue
+        time += delta
+        yield Record(kind, flags, time * step, words)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", nargs="?", default=DEFAULT_PATH)
+    parser.add_argument(
+        "--last",
+        type=int,
+        default=0,
+        help="only the last N records",
+    )
+    parser.add_argument(
+        "--kind",
+        action="append",
+        choices=list(KINDS.values()),
+        help="only records of this kind",
+    )
+    parser.add_argument(
+        "--addr",
+        type=lambda x: int(x, 0),
+        default=None,
+        help="only memory requests to this address",
+    )
+    args = parser.parse_args()
+
+    records = read_log(args.path)
+    if args.kind:
+        records = (r for r in records if KINDS[r.kind] in args.kind)
+    if args.addr is not None:
+        records = (r for r in records if r.addr == args.addr)
+    if args.last:
+        records = deque(records, maxlen=args.last)
+    for record in records:
+        print(record)
+
+
+if __name__ == "__main__":
+    main()
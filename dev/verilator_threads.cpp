@@ -0,0 +1,18 @@
+// Linked into models built with the threads profile (see BUILD_PROFILES in
+// regress.py). cocotb's Verilator main creates the model in the default
+// context, which starts with one thread per CPU the process may run on and
+// refuses a model built with more --threads than that. Setting the thread
+// count before main runs lets such a model run anywhere; Verilator warns
+// when it is more than the CPUs available.
+
+#include "verilated.h"
+
+#ifndef SIM_THREADS
+#error "build with -CFLAGS -DSIM_THREADS=<--threads of the model>"
+#endif
+
+namespace {
+struct SetSimThreads {
+    SetSimThreads() { Verilated::defaultContextp()->threads(SIM_THREADS); }
+} set_sim_threads;
+}  // namespace
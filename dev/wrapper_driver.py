@@ -0,0 +1,209 @@
+from collections import deque
+
+import cocotb
+from cocotb.triggers import FallingEdge, ReadOnly
+
+from ref_model import FIRST_FIT
+from test_falafel_wrapper import write_alloc_req, write_free_req
+
+HEADER_QUEUE = "header"
+ALLOC_QUEUE = "alloc"
+FREE_QUEUE = "free"
+
+
+def jain_fairness(values):
+    """1.0 when every queue got the same share, 1/n when one got everything."""
+    if not values or not any(values):
+        return 1.0
+    return sum(values) ** 2 / (len(values) * sum(v * v for v in values))
+
+
+class QueueStats:
+    def __init__(self, index, kind):
+        self.index = index
+        self.kind = kind
+        self.ops = 0
+        self.words = 0
+        self.stall_cycles = 0  # req_val_i high, req_rdy_o low
+        self.max_stall = 0
+        # nothing to send (a free queue with no live block)
+        self.idle_cycles = 0
+
+    def as_dict(self):
+        return {
+            "queue": self.index,
+            "kind": self.kind,
+            "ops": self.ops,
+            "words": self.words,
+            "stall_cycles": self.stall_cycles,
+            "max_stall": self.max_stall,
+            "idle_cycles": self.idle_cycles,
+        }
+
+
+class WrapperDriver:
+    """Drives all req_val_i queues of falafel_wrapper at once.
+
+    One coroutine per queue sends words back to back whenever req_rdy_o is
+    high: header queues send alloc and free messages (header + data word),
+    alloc queues sizes and free queues addresses. Frees pick a block
+    returned on resp_data_o that is not being freed yet. A monitor on the
+    i_falafel boundary checks every op against the scoreboard and drops
+    resp_rdy_i with probability `resp_stall_prob`.
+    """
+
+    def __init__(
+        self,
+        dut,
+        clk,
+        scoreboard,
+        rng,
+        num_header_queues=1,
+        num_alloc_queues=1,
+        num_free_queues=1,
+        resp_stall_prob=0.0,
+        max_alloc_size=256,
+        free_ratio=0.5,
+    ):
+        self.dut = dut
+        self.clk = clk
+        self.scoreboard = scoreboard
+        self.rng = rng
+        self.resp_stall_prob = resp_stall_prob
+        self.max_alloc_size = max_alloc_size
+        self.free_ratio = free_ratio
+
+        kinds = (
+            [HEADER_QUEUE] * num_header_queues
+            + [ALLOC_QUEUE] * num_alloc_queues
+            + [FREE_QUEUE] * num_free_queues
+        )
+        assert len(kinds) == len(dut.req_val_i), "queue counts differ from dut"
+        self.queues = [QueueStats(i, kind) for i, kind in enumerate(kinds)]
+
+        self.live = []  # addresses returned on resp_data_o
+        self.cycle = 0
+        self.issued = 0
+        self.completed = 0
+        self.resp_beats = 0
+        self.resp_stall_cycles = 0
+        self.running = False
+        self._tasks = []
+
+    def start(self):
+        self.running = True
+        for i in range(len(self.queues)):
+            self.dut.req_val_i[i].value = 0
+        self._tasks = [cocotb.start_soon(self._monitor())]
+        for q in self.queues:
+            self._tasks.append(cocotb.start_soon(self._drive_queue(q)))
+
+    def stop(self):
+        # queues finish the message they are sending and go idle
+        self.running = False
+
+    def kill(self):
+        for task in self._tasks:
+            task.kill()
+        self._tasks = []
+
+    async def drain(self, max_cycles=100000):
+        start = self.cycle
+        while self.completed < self.issued or self.resp_beats % 2:
+            assert self.cycle - start < max_cycles, "wrapper did not drain"
+            await FallingEdge(self.clk)
+
+    def _next_message(self, kind):
+        if kind == FREE_QUEUE or (
+            kind == HEADER_QUEUE and self.rng.random() < self.free_ratio
+        ):
+            if not self.live:
+                if kind == FREE_QUEUE:
+                    return None
+            else:
+                addr = self.live.pop(self.rng.randrange(len(self.live)))
+                if kind == FREE_QUEUE:
+                    return [addr]
+                return [write_free_req(0), addr]
+        size = self.rng.randint(1, self.max_alloc_size)
+        if kind == ALLOC_QUEUE:
+            return [size]
+        return [write_alloc_req(0), size]
+
+    async def _drive_queue(self, q):
+        dut = self.dut
+        await FallingEdge(self.clk)
+        while self.running:
+            words = self._next_message(q.kind)
+            if words is None:
+                q.idle_cycles += 1
+                await FallingEdge(self.clk)
+                continue
+            self.issued += 1
+            for word in words:
+                dut.req_val_i[q.index].value = 1
+                dut.req_data_i[q.index].value = word
+                stall = 0
+                while True:
+                    await ReadOnly()
+                    accepted = dut.req_rdy_o[q.index].value == 1
+                    await FallingEdge(self.clk)
+                    if accepted:
+                        break
+                    stall += 1
+                q.words += 1
+                q.stall_cycles += stall
+                q.max_stall = max(q.max_stall, stall)
+            q.ops += 1
+            dut.req_val_i[q.index].value = 0
+
+    async def _monitor(self):
+        dut = self.dut
+        core = dut.i_falafel
+        pending = deque()
+        while True:
+            await FallingEdge(self.clk)
+            self.cycle += 1
+            stall = self.resp_stall_prob
+            resp_rdy = not (stall and self.rng.random() < stall)
+            dut.resp_rdy_i.value = 1 if resp_rdy else 0
+
+            await ReadOnly()
+            req_valid = core.req_alloc_valid_i.value == 1
+            if req_valid and core.req_alloc_ready_o.value == 1:
+                if core.is_alloc_i.value == 1:
+                    size = core.size_to_allocate_i.value.integer
+                    pending.append((True, size))
+                else:
+                    addr = core.addr_to_free_i.value.integer
+                    pending.append((False, addr))
+            rsp_valid = core.rsp_result_val_o.value == 1
+            if rsp_valid and core.result_ready_i.value == 1:
+                is_alloc, arg = pending.popleft()
+                if is_alloc:
+                    result = core.rsp_result_data_o.value.integer
+                    self.scoreboard.check_alloc(arg, FIRST_FIT, result)
+                else:
+                    self.scoreboard.check_free(arg)
+                self.completed += 1
+            if not resp_rdy and dut.resp_fifo_empty.value == 0:
+                self.resp_stall_cycles += 1
+            if dut.resp_val_o.value == 1:
+                # falafel_output_fsm sends every response twice
+                if self.resp_beats % 2 == 0:
+                    self.live.append(dut.resp_data_o.value.integer)
+                self.resp_beats += 1
+
+    def report(self, cycles, completed):
+        per_kind = {}
+        for q in self.queues:
+            per_kind.setdefault(q.kind, []).append(q.ops)
+        fairness = {kind: jain_fairness(ops) for kind, ops in per_kind.items()}
+        return {
+            "cycles": cycles,
+            "ops": completed,
+            "ops_per_cycle": completed / cycles if cycles else 0.0,
+            "resp_stall_cycles": self.resp_stall_cycles,
+            "fairness": fairness,
+            "queues": [q.as_dict() for q in self.queues],
+        }